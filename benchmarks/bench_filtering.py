@@ -0,0 +1,53 @@
+"""
+Compare the evaluation of a compiled filter with that of the filter list generated by `FilterBuilder`.
+
+Run with `python -m benchmarks.bench_filtering [SIZE ...]` from the repository root.
+"""
+
+import sys
+from random import Random
+from timeit import repeat
+from uuid import uuid4
+
+from uri import URI
+
+from data.common import ImageMetadata
+from data.filtering import FilterBuilder
+
+
+def generate(size: int):
+    rng = Random(size)
+    vocabulary = ["tag{}".format(n) for n in range(0, 50)]
+
+    return [ImageMetadata(uuid4(), URI("{:07}.png".format(n)), rng.choice([None, "alice", "bob", "carol"]),
+                          rng.choice([None, "earth", "mars"]), rng.sample(vocabulary, rng.randint(0, 3)),
+                          rng.sample(vocabulary, rng.randint(0, 8)) if n % 3 else None)
+            for n in range(0, size)]
+
+
+SCENARIOS = {
+    'author': FilterBuilder().author_constraint("alice"),
+    'tag': FilterBuilder().tag_constraint("tag1"),
+    'mixed': FilterBuilder().tag_constraint("tag1").tag_constraint("tag2", True).universe_constraint("mars")
+                            .author_constraint(None, True)
+}
+
+
+def main(sizes):
+    for size in sizes:
+        metadata = generate(size)
+
+        for name, builder in SCENARIOS.items():
+            filters = builder.get_all_filters()
+            compiled = builder.compile()
+
+            listed = min(repeat(lambda: [m for m in metadata if all(map(lambda f: f(m), filters))],
+                                number=1, repeat=5))
+            fused = min(repeat(lambda: [m for m in metadata if compiled(m)], number=1, repeat=5))
+
+            print("{:>8} images, {:>6}: filter list {:8.3f} s, compiled {:8.3f} s, speed-up {:5.1f}x"
+                  .format(size, name, listed, fused, listed / fused))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10000, 100000])
@@ -0,0 +1,48 @@
+"""
+Compare directory scanning through `data.scanner` with the former `Path.iterdir()`-based listing.
+
+Run with `python -m benchmarks.bench_scanner [SIZE ...]` from the repository root.
+"""
+
+import sys
+from mimetypes import guess_type
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from timeit import repeat
+
+from data.scanner import scan_images
+
+
+def legacy_scan(directory: Path):
+    # The listing performed by Carousel before the introduction of the scanner, followed by the metadata file probes
+    # performed by load_meta()
+    images = [p for p in directory.iterdir()
+              if p.is_file() and (guess_type(p)[0] is not None) and (guess_type(p)[0].partition('/')[0] == 'image')]
+    return [(p, (p.parent / (p.stem + '.xml')).exists()) for p in images]
+
+
+def populate(directory: Path, size: int) -> None:
+    # Half of the images have a metadata file, and one file out of ten is neither an image nor a metadata file
+    for n in range(0, size):
+        (directory / "{:07}.png".format(n)).touch()
+        if n % 2 == 0:
+            (directory / "{:07}.xml".format(n)).touch()
+        if n % 10 == 0:
+            (directory / "{:07}.txt".format(n)).touch()
+
+
+def main(sizes):
+    for size in sizes:
+        with TemporaryDirectory() as test_dir:
+            directory = Path(test_dir)
+            populate(directory, size)
+
+            legacy = min(repeat(lambda: legacy_scan(directory), number=1, repeat=3))
+            scanner = min(repeat(lambda: scan_images(directory), number=1, repeat=3))
+
+            print("{:>8} images: legacy {:8.3f} s, scanner {:8.3f} s, speed-up {:5.1f}x"
+                  .format(size, legacy, scanner, legacy / scanner))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10000, 100000])
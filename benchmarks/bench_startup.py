@@ -0,0 +1,43 @@
+"""
+Compare the startup time of the command line interface with the one of the GUI entry point.
+
+Each entry point is started in a fresh interpreter: the command line interface runs a query over an empty directory,
+while the GUI is only imported, without opening any window. The GUI is skipped if GTK cannot be loaded.
+
+Run with `python -m benchmarks.bench_startup [RUNS]` from the repository root.
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from timeit import default_timer
+
+HIK = Path(__file__).parent.joinpath('..', 'hik').resolve()
+
+
+def startup(code: str) -> float:
+    start = default_timer()
+    subprocess.run([sys.executable, '-c', code], cwd=HIK, check=True, stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL)
+    return default_timer() - start
+
+
+def main(runs):
+    with TemporaryDirectory() as test_dir:
+        baseline = min(startup("pass") for _ in range(runs))
+        query = min(startup("import sys, cli; cli.main(['query', {!r}]); assert 'gi' not in sys.modules"
+                            .format(test_dir)) for _ in range(runs))
+        print("interpreter {:8.3f} s".format(baseline))
+        print("query       {:8.3f} s".format(query))
+
+    try:
+        gui = min(startup("import ui.gui_gtk.application") for _ in range(runs))
+        print("GUI import  {:8.3f} s, command line speed-up {:5.1f}x".format(gui, (gui - baseline) /
+                                                                              max(query - baseline, 1e-6)))
+    except subprocess.CalledProcessError:
+        print("GUI import  unavailable: GTK cannot be loaded")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,52 @@
+"""
+Compare loading metadata from per-image metadata files with loading it from a collection file.
+
+Run with `python -m benchmarks.bench_storage [SIZE ...]` from the repository root.
+"""
+
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from timeit import repeat
+from uuid import uuid4
+
+from uri import URI
+
+from data.common import ImageMetadata
+from data.storage import CollectionStore, SidecarStore, copy_metadata
+
+
+def populate(directory: Path, size: int):
+    images = []
+    for n in range(0, size):
+        img_path = directory / "{:07}.png".format(n)
+        img_path.touch()
+        SidecarStore().write(ImageMetadata(uuid4(), URI(img_path), "author", None, ["a", "b"], ["c", "d", "e"]),
+                             img_path)
+        images.append(img_path)
+
+    return images
+
+
+def main(sizes):
+    for size in sizes:
+        with TemporaryDirectory() as test_dir:
+            directory = Path(test_dir)
+            images = populate(directory, size)
+            with CollectionStore(directory) as collection:
+                copy_metadata(images, SidecarStore(), collection)
+
+            sidecars = min(repeat(lambda: list(SidecarStore().load_many(images)), number=1, repeat=3))
+
+            def load_collection():
+                with CollectionStore(directory) as store:
+                    return list(store.load_many(images))
+
+            consolidated = min(repeat(load_collection, number=1, repeat=3))
+
+            print("{:>8} images: metadata files {:8.3f} s, collection {:8.3f} s, speed-up {:5.1f}x"
+                  .format(size, sidecars, consolidated, sidecars / consolidated))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000])
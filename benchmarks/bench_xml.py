@@ -0,0 +1,44 @@
+"""
+Compare the specialized metadata reader and writer of `data.xmngr` with the reference ElementTree implementation
+of `tests.etree_reference`.
+
+Run with `python -m benchmarks.bench_xml [COUNT]` from the repository root.
+"""
+
+import sys
+from timeit import repeat
+from uuid import uuid4
+
+from uri import URI
+
+from data.common import ImageMetadata
+from tests.etree_reference import generate_xml_etree, parse_xml_etree
+from data.xmngr import generate_xml, parse_xml
+
+SPECIMENS = {
+    'minimal': ImageMetadata(uuid4(), URI("file:///home/user/Pictures/0000001.png"), None, None, None, None),
+    'typical': ImageMetadata(uuid4(), URI("file:///home/user/Pictures/0000002.png"), "Someone", "Somewhere",
+                             ["Alice", "Bob"], ["outdoor", "sunset", "sea", "boat", "cloud"]),
+    'large': ImageMetadata(uuid4(), URI("file:///home/user/Pictures/0000003.png"), "Someone & co.", "Somewhere",
+                           ["character {}".format(n) for n in range(0, 20)],
+                           ["tag {}".format(n) for n in range(0, 100)])
+}
+
+
+def main(count):
+    for name, metadata in SPECIMENS.items():
+        document = generate_xml(metadata)
+
+        reference = min(repeat(lambda: generate_xml_etree(metadata), number=count, repeat=3))
+        specialized = min(repeat(lambda: generate_xml(metadata), number=count, repeat=3))
+        print("{:>8} generate: ElementTree {:7.3f} s, template {:7.3f} s, speed-up {:5.1f}x"
+              .format(name, reference, specialized, reference / specialized))
+
+        reference = min(repeat(lambda: parse_xml_etree(document), number=count, repeat=3))
+        specialized = min(repeat(lambda: parse_xml(document), number=count, repeat=3))
+        print("{:>8} parse:    ElementTree {:7.3f} s, direct   {:7.3f} s, speed-up {:5.1f}x"
+              .format(name, reference, specialized, reference / specialized))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
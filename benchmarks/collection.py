@@ -0,0 +1,199 @@
+"""
+Generate synthetic image collections, for benchmarking HImaKura on collections of any size.
+
+Collections are made of tiny placeholder images, most of them described by metadata whose values follow the skewed
+distributions of real collections: a few tags, characters, authors and universes are very common, while most of them
+are rare (Zipf's law). Generation is deterministic for a given size and seed.
+
+Run with `python -m benchmarks.collection DIRECTORY SIZE [--seed SEED] [--collection]` from the repository root for
+creating a collection to be opened with HImaKura.
+"""
+
+import argparse
+import zlib
+from bisect import bisect
+from itertools import accumulate
+from pathlib import Path
+from random import Random
+from typing import Iterator, List, Optional, Sequence
+from uuid import UUID
+
+from uri import URI
+
+from data.common import ImageMetadata
+from data.storage import CollectionStore
+from data.xmngr import generate_xml
+
+
+def _png(width: int, height: int) -> bytes:
+    # A grey image, as small as PNG files get
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return len(data).to_bytes(4, 'big') + chunk_type + data + \
+            zlib.crc32(chunk_type + data).to_bytes(4, 'big')
+
+    header = width.to_bytes(4, 'big') + height.to_bytes(4, 'big') + bytes([8, 0, 0, 0, 0])
+    rows = (b'\0' + b'\x80' * width) * height
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b'')
+
+
+# The content of every placeholder image
+PLACEHOLDER = _png(4, 4)
+
+
+class Vocabulary:
+    """A set of values drawn with Zipf-distributed probabilities, the first ones being the most frequent."""
+
+    def __init__(self, values: Sequence[str], exponent: float = 1.0):
+        self.values = values
+        self._cumulative = list(accumulate(1 / (rank ** exponent) for rank in range(1, len(values) + 1)))
+
+    def draw(self, rng: Random) -> str:
+        """Draw a value."""
+
+        return self.values[bisect(self._cumulative, rng.random() * self._cumulative[-1])]
+
+    def sample(self, rng: Random, count: int) -> List[str]:
+        """Draw as many distinct values as requested, or all of them if there are fewer."""
+
+        count = min(count, len(self.values))
+        values = {}
+        while len(values) < count:
+            values[self.draw(rng)] = None
+
+        return list(values)
+
+
+def _names(rng: Random, count: int, words: int) -> List[str]:
+    syllables = ['ka', 'ki', 'ku', 'ke', 'ko', 'sa', 'shi', 'su', 'ta', 'chi', 'na', 'ni', 'ha', 'hi', 'ma', 'mi',
+                 'ya', 'yu', 'ra', 'ri', 'ru', 're', 'wa', 'n']
+    names = {}
+    while len(names) < count:
+        name = ' '.join(''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))).capitalize()
+                        for _ in range(rng.randint(1, words)))
+        names[name] = None
+
+    return list(names)
+
+
+class CollectionProfile:
+    """
+    The statistical shape of a collection.
+
+    Tags are plain lower-case words, a few of them with non-ASCII letters; characters, authors and universes are
+    capitalized names. The number of tags and characters per image is drawn uniformly within the given bounds.
+    """
+
+    def __init__(self, seed: int = 0, tags: int = 2000, characters: int = 500, authors: int = 300,
+                 universes: int = 50, tags_per_image: int = 12, characters_per_image: int = 3,
+                 described: float = 0.8):
+        """
+        Define a new profile.
+
+        :param seed: the seed of the vocabularies
+        :param tags: how many distinct tags there are
+        :param characters: how many distinct characters there are
+        :param authors: how many distinct authors there are
+        :param universes: how many distinct universes there are
+        :param tags_per_image: the maximum number of tags of an image
+        :param characters_per_image: the maximum number of characters of an image
+        :param described: the fraction of images having metadata
+        """
+
+        rng = Random(seed)
+        tag_words = ["{}{}".format(word.lower().replace(' ', '_'), "" if n % 40 else "é")
+                     for n, word in enumerate(_names(rng, tags, 2))]
+
+        self.tags = Vocabulary(tag_words)
+        self.characters = Vocabulary(_names(rng, characters, 2))
+        self.authors = Vocabulary(_names(rng, authors, 1))
+        self.universes = Vocabulary(_names(rng, universes, 3))
+        self.tags_per_image = tags_per_image
+        self.characters_per_image = characters_per_image
+        self.described = described
+
+    def metadata(self, rng: Random, img: Path) -> Optional[ImageMetadata]:
+        """Draw the metadata of an image, or None if the image is left without metadata."""
+
+        if rng.random() >= self.described:
+            return None
+
+        # Properties are missing now and then, as when images are only partially described
+        return ImageMetadata(UUID(int=rng.getrandbits(128), version=4), URI(img),
+                             self.authors.draw(rng) if rng.random() < 0.9 else None,
+                             self.universes.draw(rng) if rng.random() < 0.6 else None,
+                             self.characters.sample(rng, rng.randint(1, self.characters_per_image))
+                             if rng.random() < 0.7 else None,
+                             self.tags.sample(rng, rng.randint(1, self.tags_per_image))
+                             if rng.random() < 0.95 else None)
+
+
+def generate_metadata(size: int, seed: int = 0, profile: Optional[CollectionProfile] = None,
+                      directory: Path = Path('/collection')) -> Iterator[Optional[ImageMetadata]]:
+    """
+    Generate the metadata of the images of a synthetic collection, in memory.
+
+    :param size: how many images there are
+    :param seed: the seed of the generation
+    :param profile: the shape of the collection, the default one if not given
+    :param directory: the directory the images are supposed to be in
+    :return: an iterator over the metadata of each image, None for the images without metadata
+    """
+
+    profile = profile if profile is not None else CollectionProfile(seed)
+    rng = Random(seed)
+    for n in range(0, size):
+        yield profile.metadata(rng, directory / "{:07}.png".format(n))
+
+
+def populate(directory: Path, size: int, seed: int = 0, profile: Optional[CollectionProfile] = None,
+             collection: bool = False) -> List[Path]:
+    """
+    Create a synthetic collection of placeholder images and their metadata in a directory.
+
+    Metadata is written without the synchronization `write_meta()` performs, since collections are disposable.
+
+    :param directory: the directory receiving the collection, which must exist
+    :param size: how many images to create
+    :param seed: the seed of the generation
+    :param profile: the shape of the collection, the default one if not given
+    :param collection: whether metadata goes into a collection file, rather than into metadata files (see
+                       `data.storage`)
+    :return: the paths of the images
+    """
+
+    images = []
+    documents = []
+    for n, metadata in enumerate(generate_metadata(size, seed, profile, directory)):
+        img = directory / "{:07}.png".format(n)
+        img.write_bytes(PLACEHOLDER)
+        images.append(img)
+
+        if metadata is None:
+            continue
+        elif collection:
+            documents.append(generate_xml(metadata))
+        else:
+            img.with_suffix('.xml').write_text(generate_xml(metadata), encoding='utf-8')
+
+    if collection:
+        with (directory / CollectionStore.FILE_NAME).open('w', encoding='utf-8') as collection_file:
+            collection_file.write('<collection>')
+            for document in documents:
+                collection_file.write('\n' + document)
+            collection_file.write('\n</collection>\n')
+
+    return images
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create a synthetic image collection.")
+    parser.add_argument('directory', type=Path, help="the directory receiving the collection")
+    parser.add_argument('size', type=int, help="how many images to create")
+    parser.add_argument('--seed', type=int, default=0, help="the seed of the generation")
+    parser.add_argument('--collection', action='store_true', help="write metadata into a collection file")
+    args = parser.parse_args()
+
+    # Images are identified by their URI, which only absolute paths have
+    directory = args.directory.resolve()
+    directory.mkdir(parents=True, exist_ok=True)
+    populate(directory, args.size, args.seed, collection=args.collection)
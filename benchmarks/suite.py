@@ -0,0 +1,288 @@
+"""
+The benchmark suite, measuring how the core operations of HImaKura scale with the size of collections.
+
+Each benchmark is run over synthetic collections of the requested sizes (see `benchmarks.collection`), and compared
+with the baseline stored in `baseline.json`: timings slower than the baseline by more than the tolerance are reported
+as regressions, and make the suite exit with a non-zero status. Baselines are recorded with `--save`, and committed
+along with the changes that move them: they are only compared with timings taken on the same machine and Python
+version, other timings being just reported.
+
+Run with `python -m benchmarks.suite [--sizes SIZE ...] [--select PATTERN] [--save] [--tolerance RATIO]` from the
+repository root, or through `make bench`.
+"""
+
+import argparse
+import json
+import platform
+import sys
+from fnmatch import fnmatch
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from timeit import repeat
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from benchmarks.collection import CollectionProfile, generate_metadata, populate
+from data.cache import metadata_cache
+from data.common import ImageMetadata
+from data.filexp import Carousel, load_meta
+from data.filtering import FilterBuilder
+from data.normalise import normalise
+from data.storage import CollectionStore
+from data.xmngr import generate_xml, parse_xml
+
+BASELINE = Path(__file__).parent / 'baseline.json'
+
+# The workload of a benchmark, prepared for a collection and timed on its own
+Workload = Callable[[], object]
+
+
+class Fixtures:
+    """The collections benchmarks run over, generated once per size and shared among benchmarks."""
+
+    def __init__(self):
+        self._directory = TemporaryDirectory()
+        self._collections: Dict[Tuple[int, bool], Tuple[Path, List[Path]]] = {}
+        self._metadata: Dict[int, List[ImageMetadata]] = {}
+
+    def collection(self, size: int, collection_file: bool = False) -> Tuple[Path, List[Path]]:
+        """Return the directory of a collection on disk and its images, with metadata files or a collection file."""
+
+        key = (size, collection_file)
+        if key not in self._collections:
+            directory = Path(self._directory.name) / "{}{}".format(size, "-collection" if collection_file else "")
+            directory.mkdir()
+            self._collections[key] = (directory, populate(directory, size, collection=collection_file))
+
+        return self._collections[key]
+
+    def metadata(self, size: int) -> List[ImageMetadata]:
+        """Return the metadata of the described images of a collection, in memory."""
+
+        if size not in self._metadata:
+            self._metadata[size] = [meta for meta in generate_metadata(size) if meta is not None]
+
+        return self._metadata[size]
+
+    def close(self) -> None:
+        self._directory.cleanup()
+
+
+class Benchmark(NamedTuple):
+    """
+    A benchmark of the suite.
+
+    prepare - the function preparing the workload for a collection of the given size
+    repeat - how many times the workload is timed, the fastest run being kept
+    """
+
+    prepare: Callable[[Fixtures, int], Workload]
+    repeat: int
+
+
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def benchmark(repeat_count: int = 3):
+    """Register the decorated function, preparing the workload of a benchmark, under its name."""
+
+    def register(prepare: Callable[[Fixtures, int], Workload]) -> Callable[[Fixtures, int], Workload]:
+        BENCHMARKS[prepare.__name__] = Benchmark(prepare, repeat_count)
+        return prepare
+
+    return register
+
+
+# The most common tag of synthetic collections
+COMMON_TAG = CollectionProfile().tags.values[0]
+
+
+def _selective_filters() -> FilterBuilder:
+    return FilterBuilder().tag_constraint(COMMON_TAG).author_constraint(None, True).universe_constraint(None, True)
+
+
+@benchmark()
+def carousel_scan(fixtures: Fixtures, size: int) -> Workload:
+    directory, _ = fixtures.collection(size)
+    return lambda: Carousel(directory)
+
+
+@benchmark()
+def carousel_filter(fixtures: Fixtures, size: int) -> Workload:
+    directory, _ = fixtures.collection(size)
+
+    def workload():
+        # Parse every metadata file, as when a directory is first filtered
+        metadata_cache.clear()
+        return Carousel(directory, _selective_filters())
+
+    return workload
+
+
+@benchmark()
+def carousel_filter_collection(fixtures: Fixtures, size: int) -> Workload:
+    directory, _ = fixtures.collection(size, collection_file=True)
+
+    def workload():
+        with CollectionStore(directory) as store:
+            return Carousel(directory, _selective_filters(), store=store)
+
+    return workload
+
+
+@benchmark()
+def load_meta_cold(fixtures: Fixtures, size: int) -> Workload:
+    _, images = fixtures.collection(size)
+
+    def workload():
+        metadata_cache.clear()
+        return [load_meta(img) for img in images]
+
+    return workload
+
+
+@benchmark()
+def load_meta_warm(fixtures: Fixtures, size: int) -> Workload:
+    _, images = fixtures.collection(size)
+    metadata_cache.clear()
+    for img in images:
+        load_meta(img)
+
+    return lambda: [load_meta(img) for img in images]
+
+
+@benchmark()
+def xml_generate(fixtures: Fixtures, size: int) -> Workload:
+    metadata = fixtures.metadata(size)
+    return lambda: [generate_xml(meta) for meta in metadata]
+
+
+@benchmark()
+def xml_parse(fixtures: Fixtures, size: int) -> Workload:
+    documents = [generate_xml(meta) for meta in fixtures.metadata(size)]
+    return lambda: [parse_xml(document) for document in documents]
+
+
+@benchmark()
+def filter_predicates(fixtures: Fixtures, size: int) -> Workload:
+    metadata = fixtures.metadata(size)
+    predicate = _selective_filters().compile()
+    return lambda: [meta for meta in metadata if predicate(meta)]
+
+
+@benchmark()
+def normalise_text(fixtures: Fixtures, size: int) -> Workload:
+    # Tags as typed in the tags box, with irregular spacing and the odd control character
+    texts = [", ".join(meta.tags).replace(", ", ",\t  ", 1) + " \n" for meta in fixtures.metadata(size)
+             if meta.tags is not None]
+    return lambda: [normalise(text) for text in texts]
+
+
+def run(names: List[str], sizes: List[int]) -> Dict[str, Dict[str, float]]:
+    """
+    Run benchmarks over collections of the given sizes.
+
+    :return: the fastest time of each benchmark, in seconds, by name and size
+    """
+
+    fixtures = Fixtures()
+    results = {}
+    try:
+        for name in names:
+            results[name] = {}
+            for size in sizes:
+                workload = BENCHMARKS[name].prepare(fixtures, size)
+                results[name][str(size)] = min(repeat(workload, number=1, repeat=BENCHMARKS[name].repeat))
+    finally:
+        fixtures.close()
+
+    return results
+
+
+def _read_baseline(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def _recorded_here(stored: dict) -> bool:
+    # Timings taken on other machines or Python versions say nothing about changes to the code
+    return stored.get('machine') == platform.platform() and stored.get('python') == platform.python_version()
+
+
+def load_baseline(path: Path = BASELINE) -> Dict[str, Dict[str, float]]:
+    """Load the stored baseline, empty if there's none or it was recorded on another machine or Python version."""
+
+    stored = _read_baseline(path)
+    return stored.get('results', {}) if _recorded_here(stored) else {}
+
+
+def save_baseline(results: Dict[str, Dict[str, float]], path: Path = BASELINE) -> None:
+    """
+    Store results as the baseline, replacing the timings of the same benchmarks and sizes.
+
+    A baseline recorded on another machine or Python version is replaced as a whole.
+    """
+
+    baseline = load_baseline(path)
+    for name, timings in results.items():
+        baseline.setdefault(name, {}).update((size, round(time, 6)) for size, time in timings.items())
+
+    path.write_text(json.dumps({'machine': platform.platform(), 'python': platform.python_version(),
+                                'results': baseline}, indent=2, sort_keys=True) + '\n')
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float) -> List[Tuple[str, str, float, float]]:
+    """
+    Compare results with a baseline.
+
+    :return: the benchmarks slower than the baseline by more than the tolerance, as tuples of name, size, time and
+             baseline time
+    """
+
+    return [(name, size, time, baseline[name][size]) for name, timings in results.items()
+            for size, time in timings.items()
+            if size in baseline.get(name, {}) and time > baseline[name][size] * tolerance]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and compare it with the stored baseline.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000],
+                        help="the numbers of images of the collections, from 1000 to 1000000")
+    parser.add_argument('--select', default='*', metavar='PATTERN', help="only run the benchmarks matching a pattern")
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help="how much slower than the baseline a benchmark can be before it counts as a regression")
+    parser.add_argument('--save', action='store_true', help="store the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    names = [name for name in BENCHMARKS if fnmatch(name, args.select)]
+    results = run(names, args.sizes)
+    baseline = load_baseline()
+
+    stored = _read_baseline(BASELINE)
+    if len(stored) > 0 and not _recorded_here(stored):
+        print("The baseline was recorded on {} with Python {}, not compared with: record one here with --save"
+              .format(stored.get('machine'), stored.get('python')), file=sys.stderr)
+
+    for name, timings in results.items():
+        for size, time in timings.items():
+            reference = baseline.get(name, {}).get(size)
+            comparison = "{:5.2f}x baseline".format(time / reference) if reference else "no baseline"
+            print("{:<28} {:>8} images {:10.4f} s  {}".format(name, size, time, comparison))
+
+    if args.save:
+        save_baseline(results)
+        print("Baseline saved to {}".format(BASELINE))
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name, size, time, reference in regressions:
+        print("Regression: {} over {} images took {:.4f} s instead of {:.4f} s".format(name, size, time, reference),
+              file=sys.stderr)
+
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,305 @@
+"""
+The command line interface of HImaKura, for querying and editing metadata without a display.
+
+Only the argument parser is set up at import time: the modules doing the actual work are imported by the commands that
+need them, so that short jobs start quickly, and the GUI toolkit is never loaded.
+"""
+
+import argparse
+import os
+import sys
+from contextlib import ExitStack
+from pathlib import Path
+from typing import List, Optional
+
+# The commands of the command line interface, whose presence tells the command line from the GUI apart
+COMMANDS = ('query', 'stats', 'export', 'edit')
+
+# Names of the properties on the command line, and the properties of `ImageMetadata` they stand for
+_EDITABLE = {'author': 'author', 'universe': 'universe', 'character': 'characters', 'tag': 'tags'}
+# Names of the properties on the command line, and the `FilterBuilder` methods constraining them
+_CONSTRAINTS = {'id': 'id_constraint',
+                'filename': 'filename_constraint',
+                'author': 'author_constraint',
+                'universe': 'universe_constraint',
+                'character': 'character_constraint',
+                'tag': 'tag_constraint'}
+# Properties whose values are counted by the stats command
+_STATISTICS = ('author', 'universe', 'characters', 'tags')
+# The formats metadata can be exported to, as named by `data.export.EXPORT_FORMATS`, which isn't imported up front
+_EXPORT_FORMATS = ('jsonl', 'csv', 'xml')
+
+
+class _EditAction(argparse.Action):
+    # Collect edits of all kinds into a single list, keeping the order in which they were given
+    def __call__(self, parser, namespace, values, option_string=None):
+        from data.bulk import Edit, Operation
+
+        field, *values = values
+        if field not in _EDITABLE:
+            parser.error("{}: unknown property '{}', expected one of: {}".format(option_string, field,
+                                                                                 ', '.join(_EDITABLE)))
+
+        operation = Operation(self.const)
+        if operation is Operation.REPLACE:
+            # The last value is the replacement, none at all meaning removal
+            edit = Edit(operation, _EDITABLE[field], tuple(values[:-1]), values[-1] or None)
+        else:
+            edit = Edit(operation, _EDITABLE[field], tuple(values))
+
+        edits = getattr(namespace, self.dest) or []
+        setattr(namespace, self.dest, edits + [edit])
+
+
+def _directory(path: str) -> Path:
+    # Images are identified by their URI, which only absolute paths have
+    return Path(os.path.abspath(path))
+
+
+def _add_selection_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('directory', type=_directory, help="the directory containing the images")
+    parser.add_argument('-r', '--recursive', action='store_true', help="include the images in subdirectories")
+    parser.add_argument('--exclude', action='append', default=[], metavar='PATTERN',
+                        help="skip the images and directories matching a glob pattern")
+    parser.add_argument('--where', action='append', default=[], metavar='PROPERTY=VALUE',
+                        help="only select images having the value (no value for images missing the property); "
+                             "properties are: " + ', '.join(_CONSTRAINTS))
+    parser.add_argument('--where-not', action='append', default=[], metavar='PROPERTY=VALUE',
+                        help="only select images not having the value")
+    parser.add_argument('--any-character', action='store_true',
+                        help="select images having any of the given characters, rather than all of them")
+    parser.add_argument('--any-tag', action='store_true',
+                        help="select images having any of the given tags, rather than all of them")
+    parser.add_argument('--vocabulary', type=Path, metavar='FILE',
+                        help="compare tags through a vocabulary, one canonical tag per line followed by its aliases, "
+                             "all separated by commas; tags are compared regardless of case and spacing")
+    parser.add_argument('-j', '--jobs', type=int, default=8, help="how many metadata files to read at once")
+
+
+def _filters(parser: argparse.ArgumentParser, args: argparse.Namespace, vocabulary=None):
+    from data.filtering import FilterBuilder
+
+    builder = FilterBuilder().with_vocabulary(vocabulary)
+
+    for constraints, exclude in ((args.where, False), (args.where_not, True)):
+        for constraint in constraints:
+            field, separator, value = constraint.partition('=')
+            if separator == '' or field not in _CONSTRAINTS:
+                parser.error("invalid constraint '{}', expected PROPERTY=VALUE with a property among: {}"
+                             .format(constraint, ', '.join(_CONSTRAINTS)))
+
+            getattr(builder, _CONSTRAINTS[field])(value if len(value) > 0 else None, exclude)
+
+    return builder.characters_as_disjunctive(args.any_character).tags_as_disjunctive(args.any_tag)
+
+
+class _Selection:
+    # The resources needed for going through the selected images, released on exit
+    def __init__(self, parser: argparse.ArgumentParser, args: argparse.Namespace, use_index: bool = True):
+        self.parser = parser
+        self.args = args
+        self.use_index = use_index
+        self._resources = ExitStack()
+
+    def __enter__(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from data.storage import open_store
+
+        with ExitStack() as resources:
+            self.vocabulary = self._load_vocabulary()
+            self.filters = _filters(self.parser, self.args, self.vocabulary)
+            self.store = resources.enter_context(open_store(self.args.directory))
+            self.executor = resources.enter_context(ThreadPoolExecutor(self.args.jobs)) if self.args.jobs > 1 \
+                else None
+            self.index = None
+            # The index is only useful when filtering metadata files, as in the GUI
+            if self.use_index and self.store.paired_files and len(self.filters.constrained_fields()) > 0:
+                self.index = self._open_index(resources)
+
+            self._resources = resources.pop_all()
+
+        return self
+
+    def _load_vocabulary(self):
+        if self.args.vocabulary is None:
+            return None
+
+        from data.normalise import TagVocabulary
+
+        return TagVocabulary.load(self.args.vocabulary)
+
+    def _open_index(self, resources: ExitStack):
+        import sqlite3
+        from data.index import MetadataIndex
+
+        try:
+            return resources.enter_context(MetadataIndex(self.args.directory))
+        except sqlite3.Error:
+            # The directory is probably read-only: just go on without an index
+            return None
+
+    def __exit__(self, *args):
+        self._resources.close()
+
+    def iter_image_metadata(self):
+        from data.export import iter_image_metadata
+
+        return iter_image_metadata(self.args.directory, self.filters, self.index, self.executor,
+                                   None if self.args.recursive else 0, self.args.exclude, self.store)
+
+
+def _query(parser: argparse.ArgumentParser, args: argparse.Namespace) -> int:
+    count = 0
+    with _Selection(parser, args) as selection:
+        for img, _ in selection.iter_image_metadata():
+            count += 1
+            if not args.count:
+                print(img)
+
+    if args.count:
+        print(count)
+
+    return 0
+
+
+def _stats(parser: argparse.ArgumentParser, args: argparse.Namespace) -> int:
+    from collections import Counter
+
+    counters = {field: Counter() for field in _STATISTICS}
+    images = described = 0
+
+    with _Selection(parser, args) as selection:
+        for _, meta in selection.iter_image_metadata():
+            images += 1
+            values = [getattr(meta, field) for field in _STATISTICS]
+            if any(value is not None for value in values):
+                described += 1
+
+            for field, value in zip(_STATISTICS, values):
+                if value is None:
+                    continue
+                if field == 'tags' and selection.vocabulary is not None:
+                    # Aliases are counted as the tags they stand for
+                    value = {selection.vocabulary.canonical(tag) for tag in value}
+                counters[field].update([value] if isinstance(value, str) else value)
+
+    print("{} images, {} with metadata".format(images, described))
+    for field in _STATISTICS:
+        counter = counters[field]
+        print("\n{} ({} distinct):".format(field, len(counter)))
+        for value, count in counter.most_common(args.top if args.top > 0 else None):
+            print("{:>8} {}".format(count, value))
+
+    return 0
+
+
+def _export(parser: argparse.ArgumentParser, args: argparse.Namespace) -> int:
+    from data.export import export_metadata
+
+    with _Selection(parser, args) as selection, ExitStack() as output:
+        stream = output.enter_context(args.output.open('w', newline='')) if args.output is not None else sys.stdout
+        count = export_metadata((meta for _, meta in selection.iter_image_metadata()), stream, args.format)
+
+    print("{} images exported".format(count), file=sys.stderr)
+    return 0
+
+
+def _edit(parser: argparse.ArgumentParser, args: argparse.Namespace) -> int:
+    from data.bulk import bulk_edit
+
+    if not args.edits:
+        parser.error("no edit given")
+
+    # Edits are checked against the metadata files, not against the index
+    with _Selection(parser, args, use_index=False) as selection:
+        result = bulk_edit(args.directory, selection.filters, args.edits, selection.store,
+                           executor=selection.executor, max_depth=None if args.recursive else 0,
+                           exclude=args.exclude, dry_run=args.dry_run, vocabulary=selection.vocabulary)
+
+    if args.verbose:
+        for img in result.changed:
+            print(img)
+
+    for img, error in result.failed:
+        print("{}: {}".format(img, error), file=sys.stderr)
+
+    print("{} images selected, {} {}, {} failed".format(result.selected, len(result.changed),
+                                                       "to be changed" if args.dry_run else "changed",
+                                                       len(result.failed)), file=sys.stderr)
+
+    return 1 if len(result.failed) > 0 else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the parser of the command line."""
+
+    parser = argparse.ArgumentParser(prog='himakura', description="Query and edit image metadata.")
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND', required=True)
+
+    query = commands.add_parser('query', help="list the images selected by filters",
+                                description="Print the paths of the selected images, one per line.")
+    _add_selection_arguments(query)
+    query.add_argument('-c', '--count', action='store_true', help="only print how many images were selected")
+    query.set_defaults(handler=_query)
+
+    stats = commands.add_parser('stats', help="count the values of the properties of the selected images",
+                                description="Print how many of the selected images have each author, universe, "
+                                            "character and tag, most frequent first.")
+    _add_selection_arguments(stats)
+    stats.add_argument('--top', type=int, default=10, help="how many values to print for each property, 0 for all")
+    stats.set_defaults(handler=_stats)
+
+    export = commands.add_parser('export', help="write the metadata of the selected images to a file",
+                                 description="Write the metadata of the selected images in one of the supported "
+                                             "formats, without holding all of it in memory.")
+    _add_selection_arguments(export)
+    export.add_argument('-f', '--format', choices=_EXPORT_FORMATS, default='jsonl', help="the format of the output")
+    export.add_argument('-o', '--output', type=Path, help="the file metadata is written to, the standard output if "
+                                                          "not given")
+    export.set_defaults(handler=_export)
+
+    edit = commands.add_parser('edit', help="edit the metadata of many images at once",
+                               description="Edit the metadata of all the selected images. Edits are applied in the "
+                                           "order they are given, and images whose metadata wouldn't change are "
+                                           "left untouched.")
+    _add_selection_arguments(edit)
+    edit.add_argument('--add', dest='edits', action=_EditAction, const='add', nargs=2,
+                      metavar=('PROPERTY', 'VALUE'),
+                      help="add a value to a property; author and universe are only set when missing")
+    edit.add_argument('--remove', dest='edits', action=_EditAction, const='remove', nargs=2,
+                      metavar=('PROPERTY', 'VALUE'), help="remove a value from a property")
+    edit.add_argument('--clear', dest='edits', action=_EditAction, const='remove', nargs=1,
+                      metavar='PROPERTY', help="remove all values of a property")
+    edit.add_argument('--replace', dest='edits', action=_EditAction, const='replace', nargs=3,
+                      metavar=('PROPERTY', 'OLD', 'NEW'),
+                      help="replace a value of a property with another one, or remove it if the new one is empty")
+    edit.add_argument('--set', dest='edits', action=_EditAction, const='replace', nargs=2,
+                      metavar=('PROPERTY', 'VALUE'), help="replace all values of a property with the given one")
+    edit.add_argument('-n', '--dry-run', action='store_true',
+                      help="only count the images that would change, without writing anything")
+    edit.add_argument('-v', '--verbose', action='store_true', help="list the images that changed")
+    edit.set_defaults(handler=_edit)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run the command line interface.
+
+    :param argv: the arguments, those of the process if not given
+    :return: the exit status
+    """
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        return args.handler(parser, args)
+    except (OSError, ValueError) as error:
+        print("himakura: {}".format(error), file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+from collections import deque
+from concurrent.futures import Executor
+from enum import Enum
+from pathlib import Path
+from typing import Callable, Iterable, List, NamedTuple, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from data.common import ImageMetadata
+from data.export import iter_image_metadata
+from data.filexp import Filters
+from data.normalise import TagVocabulary, normalise
+from data.storage import MetadataStore, SidecarStore
+
+if TYPE_CHECKING:
+    from data.index import MetadataIndex
+
+
+class Operation(Enum):
+    """What an edit does to a property."""
+
+    ADD = 'add'
+    REMOVE = 'remove'
+    REPLACE = 'replace'
+
+
+class Edit(NamedTuple):
+    """
+    An edit of a property of image metadata.
+
+    operation - what to do with the values
+    field - the property to be edited: 'author', 'universe', 'characters' or 'tags'
+    values - the values to be added or removed, or to be replaced (any of them, if none is given)
+    replacement - the value replacing the given ones, or None for removing them without replacement
+
+    On single-valued properties, adding a value only sets it when there's none.
+    """
+
+    operation: Operation
+    field: str
+    values: Tuple[str, ...] = ()
+    replacement: Optional[str] = None
+
+
+class BulkEditResult(NamedTuple):
+    """
+    The outcome of a bulk edit.
+
+    selected - how many images were selected by the filters
+    changed - the images whose metadata was changed, or would have been during a dry run
+    failed - the images whose metadata could not be written, together with the error
+    """
+
+    selected: int
+    changed: List[Path]
+    failed: List[Tuple[Path, OSError]]
+
+
+# Properties that can be edited, grouped by cardinality
+SINGLE_VALUED = ('author', 'universe')
+MULTI_VALUED = ('characters', 'tags')
+
+
+def check_edit(edit: Edit) -> None:
+    """
+    Check that an edit makes sense.
+
+    :raise ValueError: when the edit targets a property that cannot be edited, or adds many values to a single-valued
+                       property, or adds nothing
+    """
+
+    if edit.field not in SINGLE_VALUED and edit.field not in MULTI_VALUED:
+        raise ValueError("Property cannot be edited: {}".format(edit.field))
+
+    if edit.operation is Operation.ADD:
+        if len(edit.values) == 0:
+            raise ValueError("No value to be added to {}".format(edit.field))
+        if edit.field in SINGLE_VALUED and len(edit.values) > 1:
+            raise ValueError("Too many values for {}: {}".format(edit.field, ', '.join(edit.values)))
+
+
+def normalise_edit(edit: Edit, vocabulary: Optional[TagVocabulary] = None) -> Edit:
+    """
+    Normalise the values of an edit, as those entered in the GUI (see `data.normalise.normalise()`).
+
+    :param edit: the edit to be normalised
+    :param vocabulary: the vocabulary whose canonical tags replace aliases, if any
+    :return: the normalised edit
+    """
+
+    clean = vocabulary.canonical if edit.field == 'tags' and vocabulary is not None else normalise
+    return edit._replace(values=tuple(clean(value) for value in edit.values),
+                         replacement=clean(edit.replacement) if edit.replacement is not None else None)
+
+
+def _edit_single(value: Optional[str], edit: Edit) -> Optional[str]:
+    if edit.operation is Operation.ADD:
+        return value if value is not None else edit.values[0]
+
+    matches = len(edit.values) == 0 or value in edit.values
+    if edit.operation is Operation.REMOVE:
+        return None if matches else value
+
+    return edit.replacement if matches else value
+
+
+def _unique(values: Iterable[str], key: Callable[[str], str]) -> List[str]:
+    # Drop the values whose key is the same as that of a previous value
+    unique = {}
+    for value in values:
+        unique.setdefault(key(value), value)
+
+    return list(unique.values())
+
+
+def _edit_multi(values: List[str], edit: Edit, key: Callable[[str], str]) -> List[str]:
+    edited_keys = set(map(key, edit.values))
+
+    if edit.operation is Operation.ADD:
+        present = set(map(key, values))
+        return values + [value for value in _unique(edit.values, key) if key(value) not in present]
+
+    if edit.operation is Operation.REMOVE:
+        return [value for value in values if len(edit.values) > 0 and key(value) not in edited_keys]
+
+    # Replace the given values, or all of them, dropping duplicates
+    replacement = [edit.replacement] if edit.replacement is not None else []
+    if len(edit.values) == 0:
+        return replacement
+
+    edited = []
+    for value in values:
+        edited.extend(replacement if key(value) in edited_keys else [value])
+
+    return _unique(edited, key)
+
+
+def _identity(value: str) -> str:
+    return value
+
+
+def _comparable(field: str, value):
+    # Multi-valued properties may be any iterable
+    return list(value) if field in MULTI_VALUED and value is not None else value
+
+
+def apply_edits(metadata: ImageMetadata, edits: Sequence[Edit],
+                vocabulary: Optional[TagVocabulary] = None) -> ImageMetadata:
+    """
+    Apply edits to metadata, in order.
+
+    :param metadata: the metadata to be edited
+    :param edits: the edits to be applied
+    :param vocabulary: the vocabulary tags are compared through, so that aliases match each other, if any
+    :return: the edited metadata, or the very same object if nothing changed
+    """
+
+    tag_key = vocabulary.key if vocabulary is not None else _identity
+    changes = {}
+    for edit in edits:
+        current = changes.get(edit.field, getattr(metadata, edit.field))
+        if edit.field in MULTI_VALUED:
+            # Empty lists are recorded as missing values
+            changes[edit.field] = _edit_multi(list(current) if current is not None else [], edit,
+                                                 tag_key if edit.field == 'tags' else _identity) or None
+        else:
+            changes[edit.field] = _edit_single(current, edit)
+
+    changes = {field: value for field, value in changes.items()
+               if _comparable(field, value) != _comparable(field, getattr(metadata, field))}
+
+    return metadata._replace(**changes) if len(changes) > 0 else metadata
+
+
+def bulk_edit(directory: Path, metadata_filters: Filters, edits: Sequence[Edit],
+              store: Optional[MetadataStore] = None, index: Optional['MetadataIndex'] = None,
+              executor: Optional[Executor] = None, max_depth: Optional[int] = 0, exclude: Iterable[str] = (),
+              dry_run: bool = False, window: int = 256,
+              vocabulary: Optional[TagVocabulary] = None) -> BulkEditResult:
+    """
+    Edit the metadata of all the images of a directory selected by filters.
+
+    Metadata is read, edited and written as a pipeline: the metadata of the next images is being loaded while the
+    edited metadata of the previous ones is being written, both through the executor if given (which must be a thread
+    pool, since stores cannot be shared with other processes). Images whose metadata wouldn't change are not written.
+    Metadata is written atomically, and the store is synchronized once at the end (see `MetadataStore.sync()`).
+    Edited values are normalised first (see `normalise_edit()`).
+
+    Filters, index, depth and exclusion patterns play the same role as in `Carousel`.
+
+    :param directory: the directory under which images are looked up
+    :param metadata_filters: an iterable of callables or a filter builder selecting the images
+    :param edits: the edits to be applied, in order
+    :param store: the store holding the metadata of the images, metadata files paired with images if not given
+    :param index: a metadata index to be used for retrieving metadata
+    :param executor: a thread pool to be used for loading and writing metadata concurrently
+    :param max_depth: how many levels of subdirectories to look into, or None for no limit
+    :param exclude: glob patterns matching the paths of images and directories to be skipped
+    :param dry_run: whether to only find out which images would change, without writing anything
+    :param window: the maximum number of images being loaded or written at once
+    :param vocabulary: the vocabulary whose canonical tags replace aliases in the edits, and through which tags are
+                       compared, if any
+    :return: the outcome of the edit
+    :raise ValueError: when some edit doesn't make sense (see `check_edit()`)
+    :raise FileNotFoundError: when no directory exists at the specified path
+    :raise NotADirectoryException: when the provided path points to a file that is not a directory
+    :raise OSError: when the store could not be synchronized after writing
+    """
+
+    for edit in edits:
+        check_edit(edit)
+    edits = [normalise_edit(edit, vocabulary) for edit in edits]
+
+    store = store if store is not None else SidecarStore()
+    selected, changed, failed = 0, [], []
+    # Writes under way, oldest first
+    writing = deque()
+
+    def collect():
+        img, future = writing.popleft()
+        try:
+            future.result()
+            changed.append(img)
+        except OSError as error:
+            failed.append((img, error))
+
+    for img, metadata in iter_image_metadata(directory, metadata_filters, index, executor, max_depth, exclude, store,
+                                             window):
+        selected += 1
+        edited = apply_edits(metadata, edits, vocabulary)
+        if edited is metadata:
+            continue
+
+        if dry_run:
+            changed.append(img)
+        elif executor is not None:
+            writing.append((img, executor.submit(store.write, edited, img)))
+            if len(writing) > window:
+                collect()
+        else:
+            try:
+                store.write(edited, img)
+                changed.append(img)
+            except OSError as error:
+                failed.append((img, error))
+
+    while writing:
+        collect()
+
+    if not dry_run and len(changed) > 0:
+        store.sync(changed)
+
+    return BulkEditResult(selected, changed, failed)
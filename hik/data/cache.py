@@ -0,0 +1,155 @@
+import os
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import NamedTuple, Optional, Tuple
+
+from data.common import ImageMetadata
+
+
+class CacheStatistics(NamedTuple):
+    """
+    A snapshot of the activity of a cache, such as a metadata cache.
+
+    hits - how many lookups were served by the cache
+    misses - how many lookups found no valid entry
+    evictions - how many entries were dropped to stay within budget
+    entries - how many entries are currently held
+    size - the total size of the entries currently held, in bytes (of the metadata files, for metadata caches)
+    """
+
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    size: int
+
+
+class MetadataCache:
+    """
+    A cache of parsed metadata files, evicting the least recently used entries first.
+
+    Entries are keyed by the path of the metadata file and validated against its modification time and size, so that
+    outdated metadata is never served. The cache can be bounded by a number of entries, by the total size of the cached
+    files (a rough estimate of the memory they take once parsed), or by both.
+
+    All methods are thread-safe.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_size: Optional[int] = None):
+        """
+        Instantiate a new empty cache.
+
+        :param max_entries: the maximum number of entries, or None for no limit
+        :param max_size: the maximum total size of the cached files in bytes, or None for no limit
+        """
+
+        self._entries: OrderedDict[str, Tuple[int, int, ImageMetadata]] = OrderedDict()
+        self._lock = Lock()
+        self._max_entries = max_entries
+        self._max_size = max_size
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def configure(self, max_entries: Optional[int] = None, max_size: Optional[int] = None) -> None:
+        """Change the budget of the cache, evicting entries if needed."""
+
+        with self._lock:
+            self._max_entries = max_entries
+            self._max_size = max_size
+            self._evict()
+
+    def _evict(self) -> None:
+        while len(self._entries) > 0 and ((self._max_entries is not None and len(self._entries) > self._max_entries) or
+                                          (self._max_size is not None and self._size > self._max_size)):
+            _, (_, size, _) = self._entries.popitem(last=False)
+            self._size -= size
+            self._evictions += 1
+
+    def get(self, meta_file: Path, stat: os.stat_result) -> Optional[ImageMetadata]:
+        """
+        Look up the metadata parsed from a metadata file.
+
+        :param meta_file: the path of the metadata file
+        :param stat: the current status of the metadata file
+        :return: the cached metadata, or None if there's none or it is outdated
+        """
+
+        key = str(meta_file)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != stat.st_mtime_ns or entry[1] != stat.st_size:
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[2]
+
+    def put(self, meta_file: Path, stat: os.stat_result, metadata: ImageMetadata) -> None:
+        """
+        Record the metadata parsed from a metadata file.
+
+        :param meta_file: the path of the metadata file
+        :param stat: the status of the metadata file that was parsed
+        :param metadata: the parsed metadata
+        """
+
+        key = str(meta_file)
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[1]
+
+            self._entries[key] = (stat.st_mtime_ns, stat.st_size, metadata)
+            self._size += stat.st_size
+            self._evict()
+
+    def discard(self, meta_file: Path) -> None:
+        """Forget about a metadata file."""
+
+        with self._lock:
+            previous = self._entries.pop(str(meta_file), None)
+            if previous is not None:
+                self._size -= previous[1]
+
+    def clear(self) -> None:
+        """Forget about all metadata files and reset statistics."""
+
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self._hits = self._misses = self._evictions = 0
+
+    def statistics(self) -> CacheStatistics:
+        """Return the statistics of the cache since it was created or last cleared."""
+
+        with self._lock:
+            return CacheStatistics(self._hits, self._misses, self._evictions, len(self._entries), self._size)
+
+
+# The environment variable setting the budget of `metadata_cache`, in mebibytes of metadata files
+CACHE_SIZE_VARIABLE = 'HIMAKURA_METADATA_CACHE'
+# The default budget of `metadata_cache`, in mebibytes of metadata files: enough for the metadata of about a hundred
+# thousand images, taking a few hundred bytes each
+DEFAULT_CACHE_SIZE = 32
+
+
+def _cache_size() -> int:
+    # Fall back to the default budget when the environment variable is unset or invalid
+    try:
+        size = int(os.environ.get(CACHE_SIZE_VARIABLE, DEFAULT_CACHE_SIZE))
+    except ValueError:
+        size = DEFAULT_CACHE_SIZE
+
+    return max(size, 0) * 1024 * 1024
+
+
+# The cache used by load_meta() and write_meta(), shared by the whole process. It is bounded by the size of the cached
+# files rather than by their number, so that opening a large directory doesn't keep evicting the metadata of the very
+# images being browsed: set `CACHE_SIZE_VARIABLE` to change its budget, 0 turning it off
+metadata_cache = MetadataCache(max_size=_cache_size())
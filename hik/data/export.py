@@ -0,0 +1,176 @@
+import csv
+import json
+from collections import deque
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, Optional, TextIO, Tuple, TYPE_CHECKING
+
+from more_itertools import chunked
+
+from data.common import ImageMetadata
+from data.filexp import Filters, _as_predicates, _check_directory, _load_entries_meta, _split_filters
+from data.scanner import walk_images
+from data.xmngr import generate_xml
+
+if TYPE_CHECKING:
+    from data.index import MetadataIndex
+    from data.storage import MetadataStore
+
+
+def iter_image_metadata(directory: Path, metadata_filters: Filters = (), index: Optional['MetadataIndex'] = None,
+                        executor: Optional[Executor] = None, max_depth: Optional[int] = 0, exclude: Iterable[str] = (),
+                        store: Optional['MetadataStore'] = None,
+                        window: int = 256) -> Iterator[Tuple[Path, ImageMetadata]]:
+    """
+    Lazily produce the images contained in a directory together with their metadata, as `iter_metadata()` does.
+
+    :return: an iterator over the paths of the selected images and their metadata
+    """
+
+    _check_directory(directory)
+
+    name_filter, metadata_filters = _split_filters(metadata_filters)
+    predicates = _as_predicates(metadata_filters)
+
+    entries = walk_images(directory, max_depth, exclude)
+    if name_filter is not None:
+        entries = (entry for entry in entries if name_filter(entry.path.name))
+
+    def selected(batch, metadata):
+        return ((entry.path, meta) for entry, meta in zip(batch, metadata) if all(map(lambda f: f(meta), predicates)))
+
+    # Batches and their metadata being loaded, oldest first
+    pending = deque()
+    for batch in chunked(entries, max(window // 2, 1)):
+        pending.append((batch, _load_entries_meta(batch, index, executor, store)))
+        if len(pending) > 1:
+            yield from selected(*pending.popleft())
+
+    while pending:
+        yield from selected(*pending.popleft())
+
+
+def iter_metadata(directory: Path, metadata_filters: Filters = (), index: Optional['MetadataIndex'] = None,
+                  executor: Optional[Executor] = None, max_depth: Optional[int] = 0, exclude: Iterable[str] = (),
+                  store: Optional['MetadataStore'] = None, window: int = 256) -> Iterator[ImageMetadata]:
+    """
+    Lazily produce the metadata of the images contained in a directory, in the same order as a `Carousel` would.
+
+    Filters, index, executor, depth, exclusion patterns and store play the same role as in `Carousel`. Images are
+    found and filtered while the iteration proceeds, without ever holding more than a window of them in memory: when an
+    executor is given, the metadata of the next half of the window is being loaded while the current half is consumed.
+
+    :param directory: the directory under which images are looked up
+    :param metadata_filters: an iterable of callables or a filter builder selecting the images
+    :param index: a metadata index to be used for retrieving metadata
+    :param executor: an executor to be used for loading metadata files concurrently
+    :param max_depth: how many levels of subdirectories to look into, or None for no limit
+    :param exclude: glob patterns matching the paths of images and directories to be skipped
+    :param store: the store holding the metadata of the images
+    :param window: the maximum number of images being handled at once
+    :return: an iterator over the metadata of the selected images
+    :raise FileNotFoundError: when no directory exists at the specified path
+    :raise NotADirectoryException: when the provided path points to a file that is not a directory
+    """
+
+    return (meta for _, meta in iter_image_metadata(directory, metadata_filters, index, executor, max_depth, exclude,
+                                                    store, window))
+
+
+def _as_record(metadata: ImageMetadata) -> Dict:
+    return {'id': str(metadata.img_id),
+            'file': str(metadata.file),
+            'author': metadata.author,
+            'universe': metadata.universe,
+            'characters': list(metadata.characters) if metadata.characters is not None else None,
+            'tags': list(metadata.tags) if metadata.tags is not None else None}
+
+
+def write_jsonl(metadata: Iterable[ImageMetadata], output: TextIO) -> int:
+    """
+    Write metadata as JSON Lines, one object per image.
+
+    :param metadata: the metadata to be written
+    :param output: the stream metadata is written to
+    :return: the number of images written
+    """
+
+    count = 0
+    for meta in metadata:
+        output.write(json.dumps(_as_record(meta), ensure_ascii=False) + '\n')
+        count += 1
+
+    return count
+
+
+def write_csv(metadata: Iterable[ImageMetadata], output: TextIO) -> int:
+    """
+    Write metadata as CSV, with a header row and one row per image.
+
+    Characters and tags are written as comma-separated lists, in the same way the user interface shows them. Missing
+    values are written as empty fields.
+
+    :param metadata: the metadata to be written
+    :param output: the stream metadata is written to, which should have been opened with `newline=''`
+    :return: the number of images written
+    """
+
+    writer = csv.writer(output)
+    writer.writerow(['id', 'file', 'author', 'universe', 'characters', 'tags'])
+
+    count = 0
+    for meta in metadata:
+        writer.writerow([meta.img_id, meta.file, meta.author, meta.universe,
+                         ', '.join(meta.characters) if meta.characters is not None else None,
+                         ', '.join(meta.tags) if meta.tags is not None else None])
+        count += 1
+
+    return count
+
+
+def write_xml(metadata: Iterable[ImageMetadata], output: TextIO) -> int:
+    """
+    Write metadata as the concatenation of the metadata documents of the images, enclosed into a `<collection>` element.
+
+    The result has the same format as collection files (see `CollectionStore`).
+
+    :param metadata: the metadata to be written
+    :param output: the stream metadata is written to
+    :return: the number of images written
+    """
+
+    output.write('<collection>')
+
+    count = 0
+    for meta in metadata:
+        output.write('\n' + generate_xml(meta))
+        count += 1
+
+    output.write('\n</collection>\n')
+    return count
+
+
+# Writers for the supported export formats
+EXPORT_FORMATS: Dict[str, Callable[[Iterable[ImageMetadata], TextIO], int]] = {
+    'jsonl': write_jsonl,
+    'csv': write_csv,
+    'xml': write_xml
+}
+
+
+def export_metadata(metadata: Iterable[ImageMetadata], output: TextIO, export_format: str) -> int:
+    """
+    Write metadata to a stream in one of the `EXPORT_FORMATS`, consuming it as it is produced.
+
+    :param metadata: the metadata to be written, such as the one produced by `iter_metadata()`
+    :param output: the stream metadata is written to
+    :param export_format: the name of the format
+    :return: the number of images written
+    :raise ValueError: when the format is not supported
+    """
+
+    writer = EXPORT_FORMATS.get(export_format)
+    if writer is None:
+        raise ValueError("Unsupported export format: {}.".format(export_format))
+
+    return writer(metadata, output)
@@ -1,13 +1,70 @@
-from mimetypes import guess_type
+import os
+from concurrent.futures import Executor
+from glob import escape as glob_escape
 from pathlib import Path
-from typing import List, Callable, Iterable
+from threading import Condition, Thread, get_ident
+from typing import List, Callable, Iterable, Iterator, Optional, Set, Tuple, Union, TYPE_CHECKING
 from uuid import uuid3, NAMESPACE_URL
 from xml.etree.ElementTree import ParseError
 
+from more_itertools import chunked
 from uri import URI
 
+from data.cache import metadata_cache
 from data.common import ImageMetadata
-from data.xmngr import parse_xml, generate_xml
+from data.filtering import FilterBuilder
+from data.postings import PostingIndexCache
+from data.scanner import METADATA_EXTENSION, ImageEntry, is_excluded, is_image_name, iter_images, walk_images
+from data.watch import ChangeKind, DirectoryWatcher, open_watcher
+from data.xmngr import parse_xml, generate_xml, read_back
+from instrumentation import count, measure, timed
+
+if TYPE_CHECKING:
+    from data.index import MetadataIndex
+    from data.storage import MetadataStore
+
+
+# Filters accepted by carousels
+Filters = Union[FilterBuilder, Iterable[Callable[[ImageMetadata], bool]]]
+
+# The posting index of the images last filtered by carousels, reused while their metadata doesn't change
+postings_cache = PostingIndexCache()
+
+
+def _as_predicates(metadata_filters: Filters) -> List[Callable[[ImageMetadata], bool]]:
+    # Turn filters into a list of predicates, which is empty when nothing is filtered out
+    if isinstance(metadata_filters, FilterBuilder):
+        return [timed('filter.predicate')(metadata_filters.compile())] \
+            if len(metadata_filters.constrained_fields()) > 0 else []
+
+    return [timed('filter.predicate')(metadata_filter) for metadata_filter in metadata_filters]
+
+
+def _split_filters(metadata_filters: Filters) -> Tuple[Optional[Callable[[str], bool]], Filters]:
+    # Separate the constraints on file names, which can be checked on directory listings, from the rest
+    if isinstance(metadata_filters, FilterBuilder):
+        fields = metadata_filters.constrained_fields()
+        if 'file' in fields:
+            fields.remove('file')
+            return metadata_filters.get_value_filter('file'), metadata_filters.restricted(fields)
+
+    return None, metadata_filters
+
+
+def _metadata_source(index: Optional['MetadataIndex'], store: Optional['MetadataStore']):
+    # Where metadata is loaded from while filtering: the index only serves metadata kept in files paired with images
+    if store is not None and not store.paired_files:
+        return store
+
+    return index
+
+
+def _check_directory(directory: Path) -> None:
+    if not directory.exists():
+        raise FileNotFoundError("Directory not found or inaccessible.")
+
+    if not directory.is_dir():
+        raise NotADirectoryError("Not a directory.")
 
 
 class Carousel:
@@ -22,46 +79,75 @@ class Carousel:
     _image_files: List[Path]
     _current: int
 
-    def __init__(self, directory: Path, metadata_filters: Iterable[Callable[[ImageMetadata], bool]] = ()):
+    @timed('Carousel.__init__')
+    def __init__(self, directory: Path, metadata_filters: Filters = (),
+                 index: Optional['MetadataIndex'] = None, executor: Optional[Executor] = None,
+                 max_depth: Optional[int] = 0, exclude: Iterable[str] = (), store: Optional['MetadataStore'] = None):
         """
         Instantiates a new slider over the collection of images under the given path.
 
+        By default, only the images contained directly in the directory are considered. A maximum depth can be given
+        to include those in its subdirectories, too, as well as glob patterns for excluding some of them (see
+        `walk_images()`).
+
         Optionally, a collection of filter functions can be provided to make the carousel more selective over which
         images it must iterate on. Each function will be called by passing the image's metadata object as the sole
         argument and must return a boolean value. Only images for which all the filter functions return `True` will be
         contemplated. Any exception will propagate upwards freely.
 
+        Alternatively, a `FilterBuilder` can be provided, whose constraints are evaluated all at once over an inverted
+        index of the metadata (see `data.postings.PostingIndex`), which is reused by the next carousel filtering the
+        same metadata. In that case, constraints on file names are checked against the
+        names of the images found in the directory, before any metadata is loaded, so that only the metadata files of
+        the remaining images are read.
+
+        When filtering, metadata is retrieved from the given metadata index, if any, so that only metadata files that
+        changed since the last time they were indexed need to be parsed again. Metadata files are loaded through the
+        given executor, if any (see `load_meta_many()`). Metadata is loaded from the given metadata store, if any, or
+        from the metadata files paired with images otherwise (see `data.storage`).
+
         :param directory: a directory path under which the slider will look-up images
-        :param metadata_filters: an iterable of callables to be used for filtering explored images
+        :param metadata_filters: an iterable of callables or a filter builder to be used for filtering explored images
+        :param index: a metadata index to be used for retrieving metadata while filtering
+        :param executor: an executor to be used for loading metadata files concurrently while filtering
+        :param max_depth: how many levels of subdirectories to look into, or None for no limit
+        :param exclude: glob patterns matching the paths of images and directories to be skipped
+        :param store: the store holding the metadata of the images
         :raise FileNotFoundError: when no directory exists at the specified path
         :raise NotADirectoryException: when the provided path points to a file that is not a directory
         """
 
-        if not directory.exists():
-            raise FileNotFoundError("Directory not found or inaccessible.")
-
-        if not directory.is_dir():
-            raise NotADirectoryError("Not a directory.")
-
-        # Reify the filter collection
-        metadata_filters = list(metadata_filters)
-
-        # Apply filtering to a file path
-        def apply_filters(p: Path) -> bool:
-            if p.is_file() and (guess_type(p)[0] is not None) and (guess_type(p)[0].partition('/')[0] == 'image'):
-                if len(metadata_filters) > 0:
-                    metadata = load_meta(p)
-                    return all(map(lambda f: f(metadata), metadata_filters))
-                else:
-                    return True
-
-            return False
+        _check_directory(directory)
 
         # List the directory's contents and apply filters
-        self._image_files = [img for img in directory.iterdir() if apply_filters(img)]
+        with measure('Carousel.scan'):
+            entries = list(walk_images(directory, max_depth, exclude))
+        name_filter, metadata_filters = _split_filters(metadata_filters)
+        if name_filter is not None:
+            entries = [entry for entry in entries if name_filter(entry.path.name)]
+
+        # Filter builders are evaluated over the posting index, other filters one image at a time
+        predicates = _as_predicates(metadata_filters) if not isinstance(metadata_filters, FilterBuilder) else []
+        if isinstance(metadata_filters, FilterBuilder) and len(metadata_filters.constrained_fields()) > 0:
+            # Only the properties that are actually constrained need to be indexed
+            with measure('filter.postings'):
+                postings = postings_cache.index(list(_load_entries_meta(entries, index, executor, store)),
+                                                metadata_filters.constrained_fields(), metadata_filters.vocabulary)
+                self._image_files = [entries[position].path for position in postings.matches(metadata_filters)]
+        elif len(predicates) == 0:
+            self._image_files = [entry.path for entry in entries]
+        else:
+            metadata = _load_entries_meta(entries, index, executor, store)
+            self._image_files = [entry.path for entry, meta in zip(entries, metadata)
+                                 if all(map(lambda f: f(meta), predicates))]
+
         # The first step should bring us at position 0
         self._current = -1
 
+    def _is_gone(self, img: Path) -> bool:
+        # Tell whether an image has been deleted after being found
+        return not img.exists()
+
     def has_prev(self) -> bool:
         """
         Tell if the carousel can presently go back to a previous image.
@@ -73,7 +159,7 @@ class Carousel:
 
         if self._current > 0:
             precedent = self._current - 1
-            if not self._image_files[precedent].exists():
+            if self._is_gone(self._image_files[precedent]):
                 del self._image_files[precedent]
                 self._current -= precedent
                 return self.has_prev()
@@ -96,22 +182,26 @@ class Carousel:
         self._current -= 1
         return self._image_files[self._current]
 
-    def has_next(self) -> bool:
+    def has_next(self, wait: bool = True) -> Optional[bool]:
         """
         Tell if the carousel can presently move forward to the next image.
 
         If there was an image following the current one, but it has been deleted since the instantiation of the object,
         then invoking this method alters the state of the carousel by removing the non-existent image(s) from the
         internal record.
+
+        Carousels that discover images lazily may not know the answer yet: if `wait` is `False`, they return `None`
+        instead of looking for the next image. Other carousels always know, and ignore the flag.
+
+        :param wait: whether to look for the next image, if it has not been discovered yet
         """
 
-        if self._current < len(self._image_files) - 1:
+        while self._current < len(self._image_files) - 1:
             follower = self._current + 1
-            if not self._image_files[follower].exists():
-                del self._image_files[follower]
-                return self.has_next()
+            if not self._is_gone(self._image_files[follower]):
+                return True
 
-            return True
+            del self._image_files[follower]
 
         return False
 
@@ -129,6 +219,386 @@ class Carousel:
         self._current += 1
         return self._image_files[self._current]
 
+    def peek(self, offset: int) -> Optional[Path]:
+        """
+        Get the image at the given distance from the current one, without moving.
+
+        Nothing is looked up: images that have not been discovered yet are not returned, and images that have been
+        deleted may be.
+
+        :param offset: the distance from the current image, negative for preceding images
+        :return: a Path pointing to the image, or None if there's no such image or it is not known yet
+        """
+
+        position = self._current + offset
+        if 0 <= position < len(self._image_files):
+            return self._image_files[position]
+
+        return None
+
+    def images(self) -> List[Path]:
+        """Return the images in the carousel, as far as they are known, in order."""
+
+        return list(self._image_files)
+
+    def seek(self, img: Path) -> Path:
+        """
+        Move to the given image.
+
+        :param img: the image to move to, which must be known to the carousel
+        :return: a Path pointing to the new current image
+        :raise ValueError: when the image is not in the carousel
+        """
+
+        self._current = self._image_files.index(img)
+        return img
+
+    def close(self) -> None:
+        """Release any resource held by the carousel."""
+
+        pass
+
+
+class StreamingCarousel(Carousel):
+    """
+    A carousel that discovers images while being slid over, instead of scanning the whole directory up-front.
+
+    Images are looked up and filtered on demand, when moving forward, or by a background thread that consumes the
+    directory while the carousel is already in use. In both cases, the first image is available as soon as it is found.
+    """
+
+    # Number of images whose metadata is loaded at once through an executor
+    BATCH_SIZE = 32
+
+    def __init__(self, directory: Path, metadata_filters: Filters = (),
+                 index: Optional['MetadataIndex'] = None, executor: Optional[Executor] = None,
+                 max_depth: Optional[int] = 0, exclude: Iterable[str] = (), background: bool = False,
+                 store: Optional['MetadataStore'] = None):
+        """
+        Instantiates a new streaming slider over the collection of images under the given path.
+
+        Filters, index, executor, depth, exclusion patterns and store play the same role as in `Carousel`, except that
+        images are always filtered one by one, after checking their names against the constraints on file names, if any.
+        When an executor is given, metadata is loaded in batches of `BATCH_SIZE`.
+
+        :param directory: a directory path under which the slider will look-up images
+        :param metadata_filters: an iterable of callables or a filter builder to be used for filtering explored images
+        :param index: a metadata index to be used for retrieving metadata while filtering
+        :param executor: an executor to be used for loading metadata files concurrently while filtering
+        :param max_depth: how many levels of subdirectories to look into, or None for no limit
+        :param exclude: glob patterns matching the paths of images and directories to be skipped
+        :param background: whether to look-up images in a background thread
+        :param store: the store holding the metadata of the images
+        :raise FileNotFoundError: when no directory exists at the specified path
+        :raise NotADirectoryException: when the provided path points to a file that is not a directory
+        """
+
+        _check_directory(directory)
+
+        self._image_files = []
+        self._current = -1
+        if max_depth == 0:
+            images = iter_images(directory, exclude)
+        else:
+            images = (entry.path for entry in walk_images(directory, max_depth, exclude))
+
+        self._name_filter, metadata_filters = _split_filters(metadata_filters)
+        if self._name_filter is not None:
+            images = (img for img in images if self._name_filter(img.name))
+
+        self._filters = _as_predicates(metadata_filters)
+        self._source = self._discover(images, self._filters, _metadata_source(index, store), executor)
+        self._exhausted = False
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        # Guards the list of images, which is extended by the background thread
+        self._lock = Condition()
+
+        if background:
+            self._feeder = Thread(target=self._feed, name="CarouselFeeder", daemon=True)
+            self._feeder.start()
+        else:
+            self._feeder = None
+
+    @classmethod
+    def _discover(cls, images: Iterator[Path], metadata_filters: List[Callable[[ImageMetadata], bool]],
+                  index: Optional['MetadataIndex'], executor: Optional[Executor]) -> Iterator[Path]:
+        if len(metadata_filters) == 0:
+            yield from images
+        elif executor is None:
+            for img in images:
+                meta = index.load(img) if index is not None else load_meta(img)
+                if all(map(lambda f: f(meta), metadata_filters)):
+                    yield img
+        else:
+            for batch in chunked(images, cls.BATCH_SIZE):
+                metadata = index.load_many(batch, executor) if index is not None else load_meta_many(batch, executor)
+                yield from (img for img, meta in zip(batch, metadata) if all(map(lambda f: f(meta), metadata_filters)))
+
+    def _feed(self) -> None:
+        try:
+            for img in self._source:
+                with self._lock:
+                    if self._closed:
+                        break
+
+                    self._append(img)
+                    self._lock.notify_all()
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._source.close()
+            with self._lock:
+                self._exhausted = True
+                self._lock.notify_all()
+
+    def _discover_next(self) -> None:
+        # Make some progress in the discovery of images, either directly or by waiting for the background thread
+        if self._feeder is not None:
+            self._lock.wait()
+        else:
+            try:
+                self._append(next(self._source))
+            except StopIteration:
+                self._exhausted = True
+
+    def _append(self, img: Path) -> None:
+        # Add a newly-discovered image to the carousel
+        self._image_files.append(img)
+
+    @property
+    def exhausted(self) -> bool:
+        """Tell whether all the images in the directory have been discovered."""
+
+        return self._exhausted
+
+    def has_prev(self) -> bool:
+        with self._lock:
+            return super().has_prev()
+
+    def prev(self) -> Path:
+        with self._lock:
+            return super().prev()
+
+    def has_next(self, wait: bool = True) -> Optional[bool]:
+        """
+        Tell if the carousel can presently move forward to the next image.
+
+        If the next image has not been discovered yet, either look for it or, when `wait` is `False`, return `None`.
+
+        :param wait: whether to look for the next image, if it has not been discovered yet
+        :raise OSError: when the directory could not be scanned
+        """
+
+        with self._lock:
+            while not super().has_next():
+                if self._error is not None:
+                    raise self._error
+
+                if self._exhausted:
+                    return False
+
+                if not wait:
+                    return None
+
+                self._discover_next()
+
+            return True
+
+    def next(self) -> Path:
+        with self._lock:
+            return super().next()
+
+    def peek(self, offset: int) -> Optional[Path]:
+        with self._lock:
+            return super().peek(offset)
+
+    def images(self) -> List[Path]:
+        with self._lock:
+            return super().images()
+
+    def seek(self, img: Path) -> Path:
+        with self._lock:
+            return super().seek(img)
+
+    def close(self) -> None:
+        """Stop discovering images."""
+
+        with self._lock:
+            self._closed = True
+
+        if self._feeder is None:
+            self._source.close()
+
+
+class LiveCarousel(StreamingCarousel):
+    """
+    A streaming carousel that keeps up with the changes to the contents of its directory.
+
+    Changes are detected by a directory watcher (see `data.watch`) and applied when `sync()` is called: new images are
+    appended to the carousel, deleted ones are removed, and images whose metadata file changes are filtered again.
+    Since the carousel is always up to date, sliding over it never touches the file system.
+
+    Only the images contained directly in the directory are considered.
+    """
+
+    def __init__(self, directory: Path, metadata_filters: Filters = (),
+                 index: Optional['MetadataIndex'] = None, executor: Optional[Executor] = None,
+                 exclude: Iterable[str] = (), background: bool = False, watcher: Optional[DirectoryWatcher] = None,
+                 store: Optional['MetadataStore'] = None):
+        """
+        Instantiates a new live slider over the collection of images under the given path.
+
+        Filters, index, executor, exclusion patterns, the background flag and the store play the same role as in
+        `StreamingCarousel`. Changes to the files of the store itself cause the whole directory to be filtered again.
+
+        :param directory: a directory path under which the slider will look-up images
+        :param metadata_filters: an iterable of callables or a filter builder to be used for filtering explored images
+        :param index: a metadata index to be used for retrieving metadata while filtering
+        :param executor: an executor to be used for loading metadata files concurrently while filtering
+        :param exclude: glob patterns matching the names of images to be skipped
+        :param background: whether to look-up images in a background thread
+        :param watcher: the watcher reporting changes to the directory, the best one available if not provided
+        :param store: the store holding the metadata of the images
+        :raise FileNotFoundError: when no directory exists at the specified path
+        :raise NotADirectoryException: when the provided path points to a file that is not a directory
+        """
+
+        _check_directory(directory)
+
+        self._directory = directory
+        self._index = index
+        self._store = store
+        self._exclude = tuple(exclude)
+        self._members: Set[Path] = set()
+        # Images reported as removed, which the scan may still find if it hasn't gone past them yet
+        self._removed: Set[Path] = set()
+        # Start watching before scanning, so that no change can go unnoticed
+        self._watcher = watcher if watcher is not None else open_watcher(directory)
+
+        super().__init__(directory, metadata_filters, index, executor, 0, self._exclude, background, store)
+
+    def _is_gone(self, img: Path) -> bool:
+        # Deletions are reported by the watcher
+        return False
+
+    def _append(self, img: Path) -> None:
+        # The same image may be both discovered by the scan and reported by the watcher
+        if img not in self._members and img not in self._removed:
+            self._members.add(img)
+            self._image_files.append(img)
+
+    def _remove(self, img: Path) -> bool:
+        self._removed.add(img)
+        if img not in self._members:
+            return False
+
+        position = self._image_files.index(img)
+        del self._image_files[position]
+        self._members.remove(img)
+
+        # If the current image is removed, its follower becomes the next one
+        if position <= self._current:
+            self._current -= 1
+
+        return True
+
+    def _matches(self, img: Path) -> bool:
+        if self._name_filter is not None and not self._name_filter(img.name):
+            return False
+
+        if len(self._filters) == 0:
+            return True
+
+        source = _metadata_source(self._index, self._store)
+        meta = source.load(img) if source is not None else load_meta(img)
+        return all(map(lambda f: f(meta), self._filters))
+
+    def _reevaluate(self, img: Path) -> bool:
+        # Add or remove the image, according to its present metadata
+        matches = self._matches(img)
+
+        with self._lock:
+            self._removed.discard(img)
+            if matches and img not in self._members:
+                self._append(img)
+                self._lock.notify_all()
+                return True
+
+            if not matches:
+                return self._remove(img)
+
+            return False
+
+    def _rescan(self) -> None:
+        images = [img for img in iter_images(self._directory, self._exclude) if self._matches(img)]
+
+        with self._lock:
+            current = self._image_files[self._current] if self._current >= 0 else None
+            self._image_files = images
+            self._members = set(images)
+            self._removed = set()
+            self._current = images.index(current) if current in self._members else -1
+
+    def fileno(self) -> Optional[int]:
+        """Return a file descriptor that becomes readable when changes are pending, if the watcher has one."""
+
+        return self._watcher.fileno()
+
+    def sync(self) -> bool:
+        """
+        Apply the changes that occurred in the directory since the last synchronization.
+
+        :return: whether images were added to or removed from the carousel
+        :raise OSError: when the directory needs to be scanned again, but it cannot be listed anymore
+        """
+
+        changed = False
+
+        for change in self._watcher.poll():
+            if change.kind is ChangeKind.RESCAN:
+                self._rescan()
+                changed = True
+                continue
+
+            if self._store is not None and self._store.is_store_file(change.path):
+                # Any image may be affected
+                if self._store.refresh():
+                    self._rescan()
+                    changed = True
+
+                continue
+
+            name = change.path.name
+            if name.endswith(METADATA_EXTENSION):
+                # Look for the images described by the metadata file, both among the known ones and on disk
+                stem = name[:-len(METADATA_EXTENSION)]
+                with self._lock:
+                    described = {img for img in self._members if img.stem == stem}
+                described.update(img for img in self._directory.glob(glob_escape(stem) + '.*')
+                                 if img.stem == stem and is_image_name(img.name))
+
+                for img in described:
+                    if self._index is not None:
+                        self._index.invalidate(img)
+
+                    if not (self._exclude and is_excluded(img.name, self._exclude)):
+                        changed |= self._reevaluate(img)
+            elif is_image_name(name) and not (self._exclude and is_excluded(name, self._exclude)):
+                if change.kind is ChangeKind.REMOVED:
+                    with self._lock:
+                        changed |= self._remove(change.path)
+                else:
+                    changed |= self._reevaluate(change.path)
+
+        return changed
+
+    def close(self) -> None:
+        """Stop discovering images and watching the directory."""
+
+        super().close()
+        self._watcher.close()
+
 
 def _construct_metadata_path(image_path: Path) -> Path:
     return image_path.parent / (image_path.stem + '.xml')
@@ -143,42 +613,138 @@ def _old_to_new_schema(img_path: Path, old_meta: ImageMetadata):
                          tags=old_meta.tags)
 
 
+def _blank_meta(img_file: Path) -> ImageMetadata:
+    return ImageMetadata(uuid3(NAMESPACE_URL, str(URI(img_file))), URI(img_file), None, None, None, None)
+
+
+@timed('load_meta')
 def load_meta(img_file: Path) -> ImageMetadata:
     """
     Load the metadata tuple for a given image file.
 
     If no metadata file is present, or it is currently inaccessible, return a blank metadata tuple.
 
+    Parsed metadata files are kept in the process-wide `metadata_cache`, and parsed again only when they change.
+
     :arg img_file: a path pointing to a managed image for which we want to load metadata
     :return: the associated metadata as a tuple, or a blank metadata tuple
     """
 
     meta_file = _construct_metadata_path(img_file)
 
-    if meta_file.exists():
-        try:
+    # A missing file is just another OSError
+    try:
+        metadata = metadata_cache.get(meta_file, os.stat(meta_file))
+        if metadata is None:
             with meta_file.open() as mf:
+                stat = os.fstat(mf.fileno())
                 metadata = parse_xml(mf.read())
+            count('load_meta.parsed')
 
-                # Check if 'file' is a valid URI, otherwise make it so (for retro-compatibility with older schema)
-                if metadata.file.scheme is None:
-                    metadata = _old_to_new_schema(img_file, metadata)
-        except (OSError, ParseError):
-            metadata = ImageMetadata(uuid3(NAMESPACE_URL, str(URI(img_file))), URI(img_file), None, None, None, None)
-    else:
-        metadata = ImageMetadata(uuid3(NAMESPACE_URL, str(URI(img_file))), URI(img_file), None, None, None, None)
+            metadata_cache.put(meta_file, stat, metadata)
+    except (OSError, ParseError):
+        return _blank_meta(img_file)
+
+    # Check if 'file' is a valid URI, otherwise make it so (for retro-compatibility with older schema)
+    if metadata.file.scheme is None:
+        metadata = _old_to_new_schema(img_file, metadata)
 
     return metadata
 
 
-def write_meta(metadata: ImageMetadata, img_file: Path) -> None:
+def load_meta_many(img_files: Iterable[Path], executor: Optional[Executor] = None,
+                   chunksize: int = 64) -> Iterator[ImageMetadata]:
+    """
+    Load the metadata tuples for multiple image files, in the same order as they are provided.
+
+    Metadata files are loaded sequentially, unless an executor is given: in that case, they are loaded concurrently
+    by its workers. A `ThreadPoolExecutor` suits best directories on network-mounted storage, where most time is spent
+    waiting for I/O, while a `ProcessPoolExecutor` allows parsing to be spread over all cores when storage is fast.
+
+    :param img_files: paths pointing to the managed images for which we want to load metadata
+    :param executor: the executor used for loading metadata concurrently
+    :param chunksize: the number of images that are submitted at once to a `ProcessPoolExecutor`
+    :return: an iterator over the associated metadata
+    """
+
+    if executor is None:
+        return map(load_meta, img_files)
+
+    return executor.map(load_meta, img_files, chunksize=chunksize)
+
+
+def _load_entries_meta(entries: List[ImageEntry], index: Optional['MetadataIndex'], executor: Optional[Executor],
+                       store: Optional['MetadataStore'] = None) -> Iterator[ImageMetadata]:
+    # Load metadata for scanned images from wherever it is kept
+    if store is not None and not store.paired_files:
+        return store.load_many([entry.path for entry in entries], executor)
+
+    return _load_paired_meta(entries, index, executor)
+
+
+def _load_paired_meta(entries: List[ImageEntry], index: Optional['MetadataIndex'],
+                      executor: Optional[Executor]) -> Iterator[ImageMetadata]:
+    # Load metadata for scanned images, skipping any I/O for those known not to have metadata files. When an executor
+    # is given, loading starts right away, even if results are consumed later.
+    paired = [entry.path for entry in entries if entry.metadata_file is not None]
+    loaded = index.load_many(paired, executor) if index is not None else load_meta_many(paired, executor)
+
+    return (next(loaded) if entry.metadata_file is not None else _blank_meta(entry.path) for entry in entries)
+
+
+def fsync_directory(directory: Path) -> None:
+    """
+    Make the latest changes to the entries of a directory durable, such as files being created or renamed.
+
+    :raise OSError: when the directory could not be synchronized
+    """
+
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@timed('write_meta')
+def write_meta(metadata: ImageMetadata, img_file: Path, sync_directory: bool = True) -> None:
     """
     Write the updated metadata for a given image.
+
+    The metadata file is replaced atomically: its document is written to a temporary file, synchronized to disk and
+    then renamed over the previous one, so that a crash never leaves an empty or partial metadata file behind. The
+    rename itself becomes durable once the directory is synchronized, which can be skipped for synchronizing it once
+    after many writes (see `fsync_directory()`).
     
     :param metadata: the metadata object to be written out
     :param img_file: the image to which the metadata is associated
+    :param sync_directory: whether to synchronize the directory of the metadata file
+    :raise OSError: when the metadata could not be written
     """
 
     dst = _construct_metadata_path(img_file)
-    with dst.open('w') as o:
-        o.write(generate_xml(metadata))
+    document = generate_xml(metadata)
+    # Hidden and not ending in the metadata extension, so that no one mistakes it for a metadata file
+    temporary = dst.with_name(".{}.{}-{}.tmp".format(dst.name, os.getpid(), get_ident()))
+
+    try:
+        with temporary.open('w') as o:
+            o.write(document)
+            o.flush()
+            os.fsync(o.fileno())
+            stat = os.fstat(o.fileno())
+
+        os.replace(temporary, dst)
+    except OSError:
+        if temporary.exists():
+            temporary.unlink()
+        raise
+
+    if sync_directory:
+        fsync_directory(dst.parent)
+
+    # Cache the metadata exactly as it will be read back, or leave it to be read when that isn't known
+    try:
+        metadata_cache.put(dst, stat, read_back(metadata, document))
+    except ParseError:
+        metadata_cache.discard(dst)
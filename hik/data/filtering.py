@@ -2,12 +2,13 @@ from __future__ import annotations
 
 from functools import singledispatch
 from operator import attrgetter
-from typing import Callable, Dict, Set, List, Optional, Iterable, TypeVar
+from typing import Callable, Dict, Set, List, Optional, Iterable, TypeVar, Tuple, FrozenSet
 
 from more_itertools import partition
 from uri import URI
 
 from data.common import ImageMetadata
+from data.normalise import TagVocabulary
 
 T = TypeVar('T')
 
@@ -31,6 +32,11 @@ def _(i: URI) -> str:
     return i.path.name
 
 
+def _as_string(o) -> Optional[str]:
+    # Same as stringify(), but faster on the common cases
+    return o if o is None or type(o) is str else stringify(o)
+
+
 class FilterBuilder:
     """
     Builder for filters on image metadata.
@@ -40,8 +46,15 @@ class FilterBuilder:
     in that set or only some.
 
     Be careful with the logic intricacies caused by disjunctive sets.
+
+    Tags are compared as they are, unless a vocabulary is given (see `with_vocabulary()`), in which case they are
+    compared by their key in it.
     """
 
+    # Properties of `ImageMetadata`, grouped by cardinality
+    SINGLE_VALUED = ('img_id', 'file', 'author', 'universe')
+    MULTI_VALUED = ('characters', 'tags')
+
     class Constraint:
         def __init__(self, match: Optional[str], inverted: bool):
             self.match = match
@@ -57,25 +70,91 @@ class FilterBuilder:
 
         self._sets: Dict[str, FilterBuilder.ConstraintsSet] = {}
         # TODO can this be made reflective on ImageMetadata?
-        for field in ['img_id', 'file', 'author', 'universe', 'characters', 'tags']:
+        # Set disjunctive default as True for single-valued properties.
+        for field in self.SINGLE_VALUED:
+            self._sets[field] = FilterBuilder.ConstraintsSet(set(), True)
+        for field in self.MULTI_VALUED:
             self._sets[field] = FilterBuilder.ConstraintsSet(set(), False)
 
-        # Set disjunctive default as True for single-valued properties.
-        self._sets['img_id'].is_disjunctive = True
-        self._sets['file'].is_disjunctive = True
-        self._sets['author'].is_disjunctive = True
-        self._sets['universe'].is_disjunctive = True
+        self.vocabulary: Optional[TagVocabulary] = None
 
     def _set_constraint(self, constraints_set: str, match: Optional[str], exclude: bool) -> FilterBuilder:
         self._sets[constraints_set].constraints.add(FilterBuilder.Constraint(match, exclude))
         return self
 
-    # TODO store info about property cardinality inside the unified structure
+    def get_constraints(self, field: str) -> Tuple[FrozenSet[Optional[str]], FrozenSet[Optional[str]], bool]:
+        """
+        Get the constraints set on a property of `ImageMetadata`.
+
+        :param field: the name of the property
+        :return: the included values, the excluded values and whether the set is disjunctive, tags being replaced by
+                 their keys if a vocabulary is in use
+        """
+
+        included, excluded = partition(attrgetter('inverted'), self._sets[field].constraints)
+        included, excluded = map(attrgetter('match'), included), map(attrgetter('match'), excluded)
+        if field == 'tags' and self.vocabulary is not None:
+            included, excluded = map(self.vocabulary.key, included), map(self.vocabulary.key, excluded)
+
+        return frozenset(included), frozenset(excluded), self._sets[field].is_disjunctive
+
+    def constrained_fields(self) -> List[str]:
+        """Get the names of the properties on which constraints have been set."""
+
+        return [field for field, constraints_set in self._sets.items() if len(constraints_set.constraints) > 0]
+
+    def restricted(self, fields: Iterable[str]) -> FilterBuilder:
+        """
+        Get a copy of this builder, retaining only the constraints on the given properties.
+
+        :param fields: the names of the properties whose constraints are retained
+        :return: a new builder
+        """
+
+        builder = FilterBuilder()
+        for field in fields:
+            builder._sets[field] = FilterBuilder.ConstraintsSet(set(self._sets[field].constraints),
+                                                                self._sets[field].is_disjunctive)
+
+        return builder.with_vocabulary(self.vocabulary)
+
+    def get_values(self, field: str) -> Callable[[ImageMetadata], Optional[Iterable[Optional[str]]]]:
+        """
+        Get an accessor to the values of a multi-valued property, as they are compared with constraints.
+
+        :param field: the name of the property
+        :return: a function returning the values of the property, or their keys in the vocabulary for tags
+        """
+
+        if field == 'tags' and self.vocabulary is not None:
+            vocabulary = self.vocabulary
+            return lambda metadata: vocabulary.keys(metadata.tags)
+
+        return attrgetter(field)
+
+    def get_value_filter(self, field: str) -> Callable[[Optional[str]], bool]:
+        """
+        Get a filter for the string form of a single-valued property, as returned by `stringify()`.
+
+        This allows constraints to be checked on values that are known before any metadata is loaded, such as the names
+        of image files.
+
+        :param field: the name of the property
+        :return: a filter accepting a string or None
+        """
+
+        included, excluded, _ = self.get_constraints(field)
+
+        if len(excluded) > 0:
+            return lambda value: value not in excluded
+        elif len(included) > 0:
+            return included.__contains__
+        else:
+            return lambda _: True
+
     # Generate filters for single-valued properties
     def _make_single_value_filter(self, constraints_set: str) -> Callable[[ImageMetadata], bool]:
-        included, excluded = partition(attrgetter('inverted'), self._sets[constraints_set].constraints)
-        included = frozenset(map(attrgetter('match'), included))
-        excluded = frozenset(map(attrgetter('match'), excluded))
+        included, excluded, _ = self.get_constraints(constraints_set)
 
         # Filters for single-valued properties are only useful if disjunctive
         if len(excluded) > 0:
@@ -90,21 +169,20 @@ class FilterBuilder:
 
     # Generate filters for multi-valued properties
     def _make_multi_value_filter(self, constraints_set: str) -> Callable[[ImageMetadata], bool]:
-        included, excluded = partition(attrgetter('inverted'), self._sets[constraints_set].constraints)
-        included = frozenset(map(attrgetter('match'), included))
-        excluded = frozenset(map(attrgetter('match'), excluded))
+        included, excluded, is_disjunctive = self.get_constraints(constraints_set)
+        values = self.get_values(constraints_set)
 
         if len(included) == 0 == len(excluded):
             # No constraints specified: match anything
             return lambda _: True
-        elif self._sets[constraints_set].is_disjunctive:
+        elif is_disjunctive:
             # Matched images must satisfy some positive constraints OR not satisfy at least one one negative constraint
-            return lambda metadata: not included.isdisjoint(wrap_none(getattr(metadata, constraints_set))) \
-                                    or not excluded.issubset(wrap_none(getattr(metadata, constraints_set)))
+            return lambda metadata: not included.isdisjoint(wrap_none(values(metadata))) \
+                                    or not excluded.issubset(wrap_none(values(metadata)))
         else:
             # Matched images must satisfy all positive constraints AND not satisfy any negative constraint
-            return lambda metadata: included.issubset(wrap_none(getattr(metadata, constraints_set))) \
-                                    and excluded.isdisjoint(wrap_none(getattr(metadata, constraints_set)))
+            return lambda metadata: included.issubset(wrap_none(values(metadata))) \
+                                    and excluded.isdisjoint(wrap_none(values(metadata)))
 
     def id_constraint(self, img_id: str, exclude: bool = False) -> FilterBuilder:
         """Set a disjunctive constraint on the ID."""
@@ -173,11 +251,105 @@ class FilterBuilder:
         self._sets['tags'].is_disjunctive = flag
         return self
 
+    def with_vocabulary(self, vocabulary: Optional[TagVocabulary]) -> FilterBuilder:
+        """Compare tags by their key in a vocabulary, or as they are if None."""
+
+        self.vocabulary = vocabulary
+        return self
+
     def get_tag_filter(self) -> Callable[[ImageMetadata], bool]:
         """Get the tags filter."""
 
         return self._make_multi_value_filter('tags')
 
+    # Accessors to the string forms of single-valued properties, skipping the dispatch of `stringify()` where possible
+    _STRING_ACCESSORS: Dict[str, Callable[[ImageMetadata], Optional[str]]] = {
+        'img_id': lambda metadata: str(metadata.img_id) if metadata.img_id is not None else None,
+        'file': lambda metadata: metadata.file.path.name if isinstance(metadata.file, URI)
+        else stringify(metadata.file),
+        'author': lambda metadata: _as_string(metadata.author),
+        'universe': lambda metadata: _as_string(metadata.universe)
+    }
+
+    def _compile_single_value(self, field: str) -> Tuple[Tuple[int, int], Callable[[ImageMetadata], bool]]:
+        included, excluded, _ = self.get_constraints(field)
+        accessor = self._STRING_ACCESSORS[field]
+
+        if len(excluded) > 0:
+            # Exclusions let most images through, hence they come after inclusions
+            return (1, -len(excluded)), lambda metadata: accessor(metadata) not in excluded
+        else:
+            # The fewer the accepted values, the more images are discarded early
+            return (0, len(included)), lambda metadata: accessor(metadata) in included
+
+    def _compile_multi_value(self, field: str) -> Tuple[Tuple[int, int], Callable[[ImageMetadata], bool]]:
+        included, excluded, is_disjunctive = self.get_constraints(field)
+        accessor = self.get_values(field)
+
+        # Terms that are constant given the constraints are left out of the expressions
+        if is_disjunctive:
+            if len(excluded) == 0:
+                def predicate(metadata):
+                    return not included.isdisjoint(wrap_none(accessor(metadata)))
+            elif len(included) == 0:
+                def predicate(metadata):
+                    return not excluded.issubset(wrap_none(accessor(metadata)))
+            else:
+                def predicate(metadata):
+                    values = wrap_none(accessor(metadata))
+                    return not included.isdisjoint(values) or not excluded.issubset(values)
+
+            return (3, 0), predicate
+        else:
+            if len(excluded) == 0:
+                def predicate(metadata):
+                    return included.issubset(wrap_none(accessor(metadata)))
+            elif len(included) == 0:
+                def predicate(metadata):
+                    return excluded.isdisjoint(wrap_none(accessor(metadata)))
+            else:
+                def predicate(metadata):
+                    values = wrap_none(accessor(metadata))
+                    return included.issubset(values) and excluded.isdisjoint(values)
+
+            # Requiring more values discards more images
+            return (2 if len(included) > 0 else 3, -len(included)), predicate
+
+    def compile(self) -> Callable[[ImageMetadata], bool]:
+        """
+        Generate a single filter, equivalent to all the filters returned by `get_all_filters()` taken together.
+
+        Unconstrained properties are not evaluated at all. Checks on single-valued properties, which are cheaper, come
+        before those on multi-valued properties, and more selective checks come first within each group, so that most
+        images are discarded as early as possible.
+        """
+
+        predicates = []
+        for field in self.constrained_fields():
+            if field in self.SINGLE_VALUED:
+                predicates.append(self._compile_single_value(field))
+            else:
+                predicates.append(self._compile_multi_value(field))
+
+        predicates = [predicate for _, predicate in sorted(predicates, key=lambda p: p[0])]
+
+        if len(predicates) == 0:
+            return lambda _: True
+        elif len(predicates) == 1:
+            return predicates[0]
+        elif len(predicates) == 2:
+            first, second = predicates
+            return lambda metadata: first(metadata) and second(metadata)
+        else:
+            def fused(metadata):
+                for predicate in predicates:
+                    if not predicate(metadata):
+                        return False
+
+                return True
+
+            return fused
+
     def get_all_filters(self) -> List[Callable[[ImageMetadata], bool]]:
         """
         Generate a list of all the filters.
@@ -0,0 +1,169 @@
+import json
+import os
+import sqlite3
+from concurrent.futures import Executor
+from pathlib import Path
+from threading import RLock
+from typing import Iterable, Iterator, Optional, List, Tuple
+from uuid import UUID
+
+from uri import URI
+
+from data.common import ImageMetadata
+from data.filexp import load_meta, load_meta_many, _blank_meta, _construct_metadata_path
+
+
+class MetadataIndex:
+    """
+    A persistent cache of parsed image metadata, stored as an SQLite database under the indexed directory.
+
+    Every row records the metadata of an image together with the modification time and size of the metadata file it
+    was parsed from. When an image's metadata is requested, its metadata file is checked against these values: if they
+    still match, the cached metadata is returned as-is, otherwise the file is parsed again and the row refreshed.
+
+    Images without a metadata file are never stored, since their blank metadata can be computed for free.
+    """
+
+    DB_NAME = '.himakura.db'
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS metadata (
+            image TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            img_id TEXT NOT NULL,
+            file TEXT NOT NULL,
+            author TEXT,
+            universe TEXT,
+            characters TEXT,
+            tags TEXT
+        )
+    """
+
+    def __init__(self, root: Path, db_file: Optional[Path] = None):
+        """
+        Open the index of the given directory, creating it if necessary.
+
+        :param root: the directory whose images are indexed
+        :param db_file: the location of the database, `DB_NAME` under the root if not specified
+        :raise sqlite3.Error: when the database cannot be opened or initialized
+        """
+
+        self._root = root
+        self._lock = RLock()
+        self._connection = sqlite3.connect(str(db_file if db_file is not None else root / self.DB_NAME),
+                                           check_same_thread=False)
+
+        with self._connection:
+            self._connection.execute(self._SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    def _key(self, img_file: Path) -> str:
+        # Keep keys relative to the root, so that the whole directory can be moved around
+        try:
+            return img_file.relative_to(self._root).as_posix()
+        except ValueError:
+            return str(img_file)
+
+    def _lookup(self, key: str, stat: os.stat_result) -> Optional[ImageMetadata]:
+        row = self._connection.execute("SELECT mtime_ns, size, img_id, file, author, universe, characters, tags "
+                                       "FROM metadata WHERE image = ?", (key,)).fetchone()
+
+        if row is None or row[0] != stat.st_mtime_ns or row[1] != stat.st_size:
+            return None
+
+        return ImageMetadata(img_id=UUID(row[2]),
+                             file=URI(row[3]),
+                             author=row[4],
+                             universe=row[5],
+                             characters=json.loads(row[6]) if row[6] is not None else None,
+                             tags=json.loads(row[7]) if row[7] is not None else None)
+
+    def _store(self, key: str, stat: os.stat_result, metadata: ImageMetadata) -> None:
+        self._connection.execute("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 (key, stat.st_mtime_ns, stat.st_size,
+                                  str(metadata.img_id), str(metadata.file), metadata.author, metadata.universe,
+                                  json.dumps(list(metadata.characters)) if metadata.characters is not None else None,
+                                  json.dumps(list(metadata.tags)) if metadata.tags is not None else None))
+
+    def _probe(self, img_file: Path) -> Tuple[str, Optional[os.stat_result], Optional[ImageMetadata]]:
+        # Return the key and metadata file status of an image, plus its metadata if it can be served without parsing
+        key = self._key(img_file)
+        try:
+            stat = os.stat(_construct_metadata_path(img_file))
+        except OSError:
+            # No metadata file (anymore): forget about the image and use blank metadata
+            self._connection.execute("DELETE FROM metadata WHERE image = ?", (key,))
+            return key, None, _blank_meta(img_file)
+
+        return key, stat, self._lookup(key, stat)
+
+    def load(self, img_file: Path) -> ImageMetadata:
+        """
+        Load the metadata of an image, parsing its metadata file only if it changed since it was last indexed.
+
+        :param img_file: a path pointing to the image for which metadata is requested
+        :return: the associated metadata, or a blank metadata tuple
+        """
+
+        with self._lock, self._connection:
+            key, stat, metadata = self._probe(img_file)
+            if metadata is None:
+                metadata = load_meta(img_file)
+                self._store(key, stat, metadata)
+
+            return metadata
+
+    def load_many(self, img_files: Iterable[Path], executor: Optional[Executor] = None) -> Iterator[ImageMetadata]:
+        """
+        Load the metadata of multiple images, in the same order as they are provided.
+
+        Metadata files that need to be parsed again are loaded through `load_meta_many()`, using the given executor.
+        All the resulting updates are committed to the database at once.
+
+        :param img_files: the paths pointing to the images for which metadata is requested
+        :param executor: the executor used for loading metadata files concurrently
+        :return: an iterator over the associated metadata
+        """
+
+        img_files = list(img_files)
+        results: List[Optional[ImageMetadata]] = []
+        stale: List[Tuple[int, str, os.stat_result]] = []
+
+        with self._lock:
+            for position, img_file in enumerate(img_files):
+                key, stat, metadata = self._probe(img_file)
+                if metadata is None:
+                    stale.append((position, key, stat))
+
+                results.append(metadata)
+
+        parsed = load_meta_many((img_files[position] for position, _, _ in stale), executor)
+
+        with self._lock, self._connection:
+            for (position, key, stat), metadata in zip(stale, parsed):
+                self._store(key, stat, metadata)
+                results[position] = metadata
+
+        return iter(results)
+
+    def invalidate(self, img_file: Path) -> None:
+        """Forget the cached metadata of an image, forcing a new parse on the next request."""
+
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM metadata WHERE image = ?", (self._key(img_file),))
+
+    def close(self) -> None:
+        """Close the underlying database."""
+
+        with self._lock:
+            self._connection.close()
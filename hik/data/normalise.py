@@ -0,0 +1,157 @@
+"""
+Normalisation of the text entered as metadata, and the vocabulary tags are compared through.
+
+Text is normalised by turning control and space characters into plain spaces, and collapsing runs of them into single
+spaces, through a translation table computed once. Optionally, text can also be brought into NFKC form and case-folded,
+so that strings that only differ in the way they were typed compare equal.
+"""
+
+import sys
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+from unicodedata import normalize, ucd_3_2_0
+
+# Control characters not in the Cc category, as listed in table C.2.2 of RFC 3454
+_CONTROL_SPECIALS = (0x06DD, 0x070F, 0x180E, 0x200C, 0x200D, 0x2028, 0x2029, 0x2060, 0x2061, 0x2062, 0x2063, 0x206A,
+                     0x206B, 0x206C, 0x206D, 0x206E, 0x206F, 0xFEFF, 0xFFF9, 0xFFFA, 0xFFFB, 0xFFFC, 0x1D173, 0x1D174,
+                     0x1D175, 0x1D176, 0x1D177, 0x1D178, 0x1D179, 0x1D17A)
+
+
+@lru_cache(maxsize=None)
+def _space_table() -> Dict[int, str]:
+    # The characters of tables C.1 and C.2 of RFC 3454 (spaces and controls, as in `stringprep`), all mapped to a space.
+    # There are no space or Cc characters outside of the BMP, so only the BMP is scanned, and only on first use.
+    table = {code: ' ' for code in range(0, 0x10000) if ucd_3_2_0.category(chr(code)) in ('Zs', 'Cc')}
+    table.update((code, ' ') for code in _CONTROL_SPECIALS)
+    return table
+
+
+def normalise(text: str, nfkc: bool = False, casefold: bool = False) -> str:
+    """
+    Substitute runs of control and space characters with single spaces, and strip them from the ends of text.
+
+    :param text: the text to be normalised
+    :param nfkc: whether to bring text into Unicode normal form KC first
+    :param casefold: whether to case-fold text, for caseless comparisons
+    :return: the normalised text
+    """
+
+    if nfkc:
+        text = normalize('NFKC', text)
+    if casefold:
+        text = text.casefold()
+
+    return ' '.join(text.translate(_space_table()).split())
+
+
+def normalise_list(text: str, nfkc: bool = False, casefold: bool = False) -> List[str]:
+    """
+    Split a comma-separated list, normalising its items.
+
+    :param text: the comma-separated list
+    :param nfkc: whether to bring items into Unicode normal form KC
+    :param casefold: whether to case-fold items
+    :return: the normalised items, in order
+    """
+
+    return [item.strip() for item in normalise(text, nfkc, casefold).split(',')]
+
+
+class TagVocabulary:
+    """
+    A vocabulary of canonical tags, each one with its aliases.
+
+    Tags are compared by their key: the normalised (see `normalise()`), NFKC and case-folded form of the canonical tag
+    they stand for, or of themselves if they aren't known aliases. Keys are interned, and the keys of the tags seen so
+    far are remembered, so that comparing tags by key is as fast as comparing them as they are.
+    """
+
+    def __init__(self, tags: Optional[Dict[str, Iterable[str]]] = None):
+        """
+        Instantiate a new vocabulary.
+
+        :param tags: the aliases of canonical tags, by canonical tag
+        """
+
+        # Canonical tags, by the key of the tag or of any of its aliases
+        self._canonical: Dict[str, str] = {}
+        # Keys by tag, as it was given
+        self._keys: Dict[str, str] = {}
+
+        for canonical, aliases in (tags or {}).items():
+            self.add(canonical, aliases)
+
+    @classmethod
+    def load(cls, path: Path) -> 'TagVocabulary':
+        """
+        Load a vocabulary from a text file.
+
+        Every line holds a canonical tag, followed by its aliases, if any, all separated by commas. Empty lines and
+        lines starting with `#` are ignored.
+
+        :param path: the path of the file
+        :return: the vocabulary
+        :raise OSError: when the file could not be read
+        """
+
+        vocabulary = cls()
+        for line in path.read_text(encoding='utf-8').splitlines():
+            if len(line.strip()) > 0 and not line.lstrip().startswith('#'):
+                canonical, *aliases = normalise_list(line)
+                vocabulary.add(canonical, aliases)
+
+        return vocabulary
+
+    def add(self, canonical: str, aliases: Iterable[str] = ()) -> None:
+        """
+        Add a canonical tag to the vocabulary, along with its aliases.
+
+        :param canonical: the canonical tag
+        :param aliases: the tags standing for the canonical one
+        :raise ValueError: when the canonical tag or an alias is empty, or an alias already stands for another tag
+        """
+
+        canonical = normalise(canonical)
+        key = normalise(canonical, True, True)
+        for tag in (canonical, *aliases):
+            tag_key = normalise(tag, True, True)
+            if len(tag_key) == 0:
+                raise ValueError("Empty tag in the aliases of: {}".format(canonical))
+
+            known = self._canonical.get(tag_key)
+            if known is not None and normalise(known, True, True) != key:
+                raise ValueError("Tag {} already stands for: {}".format(tag, known))
+
+            self._canonical[tag_key] = canonical
+
+        # Previously computed keys might be out of date
+        self._keys.clear()
+
+    def __contains__(self, tag: str) -> bool:
+        return normalise(tag, True, True) in self._canonical
+
+    def canonical(self, tag: str) -> str:
+        """Return the canonical tag a tag stands for, or the tag itself, normalised, if it isn't a known alias."""
+
+        tag = normalise(tag)
+        return self._canonical.get(normalise(tag, True, True), tag)
+
+    def key(self, tag: Optional[str]) -> Optional[str]:
+        """Return the key tags are compared by, None being its own key."""
+
+        if tag is None:
+            return None
+
+        key = self._keys.get(tag)
+        if key is None:
+            tag_key = normalise(tag, True, True)
+            canonical = self._canonical.get(tag_key)
+            key = self._keys[tag] = sys.intern(normalise(canonical, True, True) if canonical is not None else tag_key)
+
+        return key
+
+    def keys(self, tags: Optional[Iterable[Optional[str]]]) -> Optional[Set[Optional[str]]]:
+        """Return the keys of some tags, or None if there are none."""
+
+        return {self.key(tag) for tag in tags} if tags is not None else None
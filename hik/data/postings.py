@@ -0,0 +1,192 @@
+from array import array
+from functools import reduce
+from operator import and_, or_
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from data.common import ImageMetadata
+from data.filtering import FilterBuilder, stringify, wrap_none
+from data.normalise import TagVocabulary
+
+
+class PostingIndex:
+    """
+    An inverted index over a sequence of image metadata, able to evaluate the constraints of a `FilterBuilder`.
+
+    Images are identified by their position in the sequence. For every value of every indexed property, the index keeps
+    the sorted list of the images having that value, including images for which the property is missing (the `None`
+    value). Constraints are then evaluated by turning these lists into bitsets and combining them, instead of testing
+    each image in turn.
+
+    Results are exactly the same as those of the filters generated by `FilterBuilder`, provided that the builder and the
+    index compare tags through the same vocabulary.
+    """
+
+    def __init__(self, metadata: Iterable[ImageMetadata] = (), fields: Optional[Iterable[str]] = None,
+                 vocabulary: Optional[TagVocabulary] = None):
+        """
+        Build an index over the given metadata.
+
+        :param metadata: the metadata of the images to be indexed, in order
+        :param fields: the properties to be indexed, all of them if not specified
+        :param vocabulary: the vocabulary whose keys tags are indexed by, if any
+        """
+
+        fields = fields if fields is not None else FilterBuilder.SINGLE_VALUED + FilterBuilder.MULTI_VALUED
+        self._postings: Dict[str, Dict[Optional[str], array]] = {field: {} for field in fields}
+        self._bitsets: Dict[str, Dict[Optional[str], int]] = {field: {} for field in fields}
+        self._size = 0
+        self._vocabulary = vocabulary
+
+        for meta in metadata:
+            self.add(meta)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, metadata: ImageMetadata) -> int:
+        """
+        Append an image to the index.
+
+        :param metadata: the metadata of the image
+        :return: the position of the new image
+        """
+
+        position = self._size
+        self._size += 1
+
+        for field, postings in self._postings.items():
+            if field in FilterBuilder.SINGLE_VALUED:
+                keys = (stringify(getattr(metadata, field)),)
+            elif field == 'tags' and self._vocabulary is not None:
+                keys = wrap_none(self._vocabulary.keys(metadata.tags))
+            else:
+                keys = set(wrap_none(getattr(metadata, field)))
+
+            for key in keys:
+                posting = postings.get(key)
+                if posting is None:
+                    posting = postings[key] = array('L')
+
+                posting.append(position)
+
+            # Cached bitsets don't know about the new image
+            self._bitsets[field].clear()
+
+        return position
+
+    def _bitset(self, field: str, key: Optional[str]) -> int:
+        bitset = self._bitsets[field].get(key)
+
+        if bitset is None:
+            bits = bytearray((self._size + 7) // 8)
+            for position in self._postings[field].get(key, ()):
+                bits[position >> 3] |= 1 << (position & 7)
+
+            bitset = self._bitsets[field][key] = int.from_bytes(bits, 'little')
+
+        return bitset
+
+    def _evaluate(self, builder: FilterBuilder, field: str, universe: int) -> int:
+        included, excluded, is_disjunctive = builder.get_constraints(field)
+        included = [self._bitset(field, key) for key in included]
+        excluded = [self._bitset(field, key) for key in excluded]
+
+        if field in FilterBuilder.SINGLE_VALUED:
+            # Negative matches in a disjunctive evaluation totally eclipse positive matches
+            if len(excluded) > 0:
+                return universe & ~reduce(or_, excluded)
+            elif len(included) > 0:
+                return reduce(or_, included)
+            else:
+                return universe
+
+        if len(included) == 0 == len(excluded):
+            return universe
+        elif is_disjunctive:
+            # Some positive constraints satisfied OR at least one negative constraint not satisfied
+            return reduce(or_, included, 0) | (universe & ~reduce(and_, excluded, universe))
+        else:
+            # All positive constraints satisfied AND no negative constraint satisfied
+            return reduce(and_, included, universe) & ~reduce(or_, excluded, 0)
+
+    def select(self, builder: FilterBuilder) -> int:
+        """
+        Evaluate the constraints of a filter builder.
+
+        :param builder: the filter builder whose constraints must be satisfied
+        :return: a bitset in which the bit of every matching image is set
+        :raise KeyError: when some constrained properties have not been indexed
+        """
+
+        universe = (1 << self._size) - 1
+        return reduce(and_, (self._evaluate(builder, field, universe) for field in builder.constrained_fields()),
+                      universe)
+
+    def matches(self, builder: FilterBuilder) -> List[int]:
+        """
+        Get the positions of the images satisfying the constraints of a filter builder.
+
+        :param builder: the filter builder whose constraints must be satisfied
+        :return: the positions of the matching images, in ascending order
+        :raise KeyError: when some constrained properties have not been indexed
+        """
+
+        return list(positions(self.select(builder)))
+
+
+class PostingIndexCache:
+    """
+    A holder of the posting index of the metadata it was last asked for, so that evaluating other constraints over the
+    same metadata, as when filters are changed, doesn't require indexing it again.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._metadata: List[ImageMetadata] = []
+        self._fields: Set[str] = set()
+        self._vocabulary: Optional[TagVocabulary] = None
+        self._postings: Optional[PostingIndex] = None
+
+    def index(self, metadata: List[ImageMetadata], fields: Iterable[str],
+              vocabulary: Optional[TagVocabulary] = None) -> PostingIndex:
+        """
+        Get an index of some metadata, reusing the last one if the metadata is the same.
+
+        :param metadata: the metadata of the images to be indexed, in order
+        :param fields: the properties that must be indexed
+        :param vocabulary: the vocabulary whose keys tags are indexed by, if any
+        :return: an index of the metadata, over the given properties at least
+        """
+
+        fields = set(fields)
+        with self._lock:
+            if self._postings is not None and vocabulary is self._vocabulary \
+                    and len(metadata) == len(self._metadata) \
+                    and all(new is old or new == old for new, old in zip(metadata, self._metadata)):
+                if fields.issubset(self._fields):
+                    return self._postings
+
+                # Keep the properties indexed so far, for the next constraints
+                fields.update(self._fields)
+
+            postings = PostingIndex(metadata, fields, vocabulary)
+            self._metadata, self._fields, self._vocabulary, self._postings = metadata, fields, vocabulary, postings
+
+            return postings
+
+    def clear(self) -> None:
+        """Forget the last index."""
+
+        with self._lock:
+            self._metadata, self._fields, self._vocabulary, self._postings = [], set(), None, None
+
+
+def positions(bitset: int) -> Iterator[int]:
+    """Iterate over the positions of the bits that are set in a bitset, in ascending order."""
+
+    for offset, byte in enumerate(bitset.to_bytes((bitset.bit_length() + 7) // 8, 'little')):
+        if byte:
+            for bit in range(0, 8):
+                if byte & (1 << bit):
+                    yield (offset << 3) | bit
@@ -0,0 +1,184 @@
+import mimetypes
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+from typing import FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+if not mimetypes.inited:
+    mimetypes.init()
+
+# Extensions that map to image types, in the same (strict) way `mimetypes.guess_type()` maps them
+IMAGE_EXTENSIONS: FrozenSet[str] = frozenset(ext.lower() for ext, mime in mimetypes.types_map.items()
+                                             if mime.partition('/')[0] == 'image')
+# Extensions that `mimetypes.guess_type()` handles by looking beyond the last suffix
+_COMPOUND_EXTENSIONS: FrozenSet[str] = frozenset(mimetypes.suffix_map.keys()) | \
+    frozenset(mimetypes.encodings_map.keys())
+
+METADATA_EXTENSION = '.xml'
+
+
+class ImageEntry(NamedTuple):
+    """
+    An image found while scanning a directory.
+
+    path - the path of the image
+    metadata_file - the path of its metadata file, or None if the image has none
+    """
+
+    path: Path
+    metadata_file: Optional[Path]
+
+
+def _split_ext(name: str) -> Tuple[str, str]:
+    # Same as os.path.splitext(), minus the separator handling that bare file names don't need
+    dot = name.rfind('.')
+    if dot > 0 and name[:dot].lstrip('.'):
+        return name[:dot], name[dot:]
+
+    return name, ''
+
+
+def is_image_name(name: str) -> bool:
+    """Tell whether a file name denotes an image, judging by its extension."""
+
+    ext = _split_ext(name)[1]
+
+    if ext in _COMPOUND_EXTENSIONS:
+        # Rare enough to be left to the full-blown guesser
+        mime = mimetypes.guess_type(name)[0]
+        return mime is not None and mime.partition('/')[0] == 'image'
+
+    return ext.lower() in IMAGE_EXTENSIONS
+
+
+def _list_directory(directory: Path) -> Tuple[List[ImageEntry], List[str]]:
+    # List the images in a directory, paired with their metadata files, plus the names of its subdirectories
+    images = []
+    subdirectories = []
+    metadata_stems = set()
+
+    with os.scandir(directory) as listing:
+        for entry in listing:
+            name = entry.name
+            if name.endswith(METADATA_EXTENSION):
+                metadata_stems.add(name[:-len(METADATA_EXTENSION)])
+            elif is_image_name(name):
+                if entry.is_file():
+                    images.append(name)
+            elif entry.is_dir(follow_symlinks=False):
+                subdirectories.append(name)
+
+    entries = []
+    for name in images:
+        stem = _split_ext(name)[0]
+        entries.append(ImageEntry(directory / name,
+                                  directory / (stem + METADATA_EXTENSION) if stem in metadata_stems else None))
+
+    return entries, subdirectories
+
+
+def is_excluded(relative_path: str, exclude: Iterable[str]) -> bool:
+    """Tell whether a relative path is matched by any of the given glob patterns, as `PurePath.match()` does."""
+
+    return any(PurePosixPath(relative_path).match(pattern) for pattern in exclude)
+
+
+def scan_images(directory: Path) -> List[ImageEntry]:
+    """
+    List the images contained in a directory, pairing each of them with its metadata file.
+
+    The directory is listed only once, and the type information gathered while listing is reused for telling files
+    apart, so that no additional system call is made for each entry on most file systems. Images are returned in
+    directory order.
+
+    :param directory: the directory to be scanned
+    :return: a list of the images found in the directory
+    :raise OSError: when the directory cannot be listed
+    """
+
+    return _list_directory(directory)[0]
+
+
+def iter_images(directory: Path, exclude: Iterable[str] = ()) -> Iterator[Path]:
+    """
+    Lazily list the images contained in a directory, in directory order.
+
+    Unlike `scan_images()`, images are produced while the directory is being listed, therefore they cannot be paired
+    with their metadata files.
+
+    :param directory: the directory to be scanned
+    :param exclude: glob patterns matching the names of images to be skipped
+    :return: an iterator over the paths of the images found in the directory
+    :raise OSError: when the directory cannot be listed
+    """
+
+    exclude = tuple(exclude)
+
+    with os.scandir(directory) as listing:
+        for entry in listing:
+            name = entry.name
+            if is_image_name(name) and entry.is_file() and not (exclude and is_excluded(name, exclude)):
+                yield directory / name
+
+
+def walk_images(root: Path, max_depth: Optional[int] = None, exclude: Iterable[str] = (),
+                workers: int = 4) -> Iterator[ImageEntry]:
+    """
+    Lazily list the images contained in a directory tree, pairing each of them with its metadata file.
+
+    The tree is visited depth-first: the images of a directory come in directory order, followed by the contents of its
+    subdirectories, visited in name order. Symbolic links to directories are not followed, and subdirectories that
+    cannot be listed are skipped.
+
+    Directories are listed by a pool of worker threads, which stay ahead of the visit by a bounded number of
+    directories, so that only the listings of the directories being visited next are ever held in memory.
+
+    Exclusion patterns are matched against paths relative to the root, in the same way as `PurePath.match()` does:
+    relative patterns such as `*.gif` or `drafts` apply at any depth.
+
+    :param root: the root of the directory tree
+    :param max_depth: how many levels of subdirectories to visit, or None for no limit
+    :param exclude: glob patterns matching the paths of images and directories to be skipped
+    :param workers: the number of directories that are listed concurrently
+    :return: an iterator over the images found in the tree
+    :raise OSError: when the root directory cannot be listed
+    """
+
+    exclude = tuple(exclude)
+
+    def is_kept(path: Path) -> bool:
+        return not (exclude and is_excluded(path.relative_to(root).as_posix(), exclude))
+
+    if max_depth == 0:
+        yield from filter(lambda e: is_kept(e.path), scan_images(root))
+        return
+
+    lister = ThreadPoolExecutor(workers, thread_name_prefix="DirectoryLister")
+    try:
+        # Directories still to be visited, the next one being the last, each with its depth and its pending listing
+        pending: List[Tuple[Path, int, Optional[Future]]] = [(root, 0, lister.submit(_list_directory, root))]
+
+        while pending:
+            directory, depth, listing = pending.pop()
+
+            try:
+                entries, subdirectories = listing.result()
+            except OSError:
+                if directory == root:
+                    raise
+
+                continue
+
+            yield from filter(lambda e: is_kept(e.path), entries)
+
+            if max_depth is None or depth < max_depth:
+                subdirectories = filter(is_kept, (directory / name for name in sorted(subdirectories, reverse=True)))
+                pending.extend((subdirectory, depth + 1, None) for subdirectory in subdirectories)
+
+            # Start listing the directories that come next
+            for position in range(len(pending) - 1, max(len(pending) - 1 - 2 * workers, -1), -1):
+                if pending[position][2] is None:
+                    pending[position] = (pending[position][0], pending[position][1],
+                                         lister.submit(_list_directory, pending[position][0]))
+    finally:
+        lister.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,382 @@
+import os
+import re
+from abc import ABCMeta, abstractmethod
+from concurrent.futures import Executor
+from html import unescape
+from pathlib import Path
+from threading import RLock
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import unquote
+from xml.etree.ElementTree import ParseError
+
+from uri import URI
+
+from data.common import ImageMetadata
+from data.filexp import fsync_directory, load_meta, load_meta_many, write_meta, _blank_meta, \
+    _construct_metadata_path, _old_to_new_schema
+from data.xmngr import generate_xml, parse_xml
+
+
+class MetadataStore(metaclass=ABCMeta):
+    """
+    A place where image metadata is kept.
+
+    Images without recorded metadata are served blank metadata, exactly as `load_meta()` does.
+    """
+
+    # Whether metadata is kept in files paired with images, whose presence is detected while scanning directories
+    paired_files = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @abstractmethod
+    def has_metadata(self, img_file: Path) -> bool:
+        """Tell whether metadata has been recorded for an image."""
+
+        pass
+
+    @abstractmethod
+    def load(self, img_file: Path) -> ImageMetadata:
+        """
+        Load the metadata of an image.
+
+        :param img_file: a path pointing to the image for which metadata is requested
+        :return: the associated metadata, or a blank metadata tuple
+        """
+
+        pass
+
+    def load_many(self, img_files: Iterable[Path], executor: Optional[Executor] = None) -> Iterator[ImageMetadata]:
+        """
+        Load the metadata of multiple images, in the same order as they are provided.
+
+        :param img_files: the paths pointing to the images for which metadata is requested
+        :param executor: the executor used for loading metadata concurrently
+        :return: an iterator over the associated metadata
+        """
+
+        return map(self.load, img_files)
+
+    @abstractmethod
+    def write(self, metadata: ImageMetadata, img_file: Path) -> None:
+        """
+        Record the updated metadata of an image.
+
+        :param metadata: the metadata object to be written out
+        :param img_file: the image to which the metadata is associated
+        :raise OSError: when the metadata could not be written
+        """
+
+        pass
+
+    def sync(self, img_files: Iterable[Path]) -> None:
+        """
+        Make the metadata written for the given images durable, such that it survives crashes.
+
+        Writes are atomic, but may not be durable until the store is synchronized: synchronizing once after many writes
+        is cheaper than synchronizing after each one.
+
+        :param img_files: the images whose metadata was written
+        :raise OSError: when the store could not be synchronized
+        """
+
+        pass
+
+    def is_store_file(self, path: Path) -> bool:
+        """Tell whether a file is one of the files the store itself is made of, rather than one paired with images."""
+
+        return False
+
+    def refresh(self) -> bool:
+        """
+        Take into account changes made to the store by others, if any.
+
+        :return: whether the store changed
+        """
+
+        return False
+
+    def close(self) -> None:
+        """Release the resources held by the store."""
+
+        pass
+
+
+class SidecarStore(MetadataStore):
+    """The original store, keeping the metadata of every image in an XML file beside it (see `load_meta()`)."""
+
+    paired_files = True
+
+    def has_metadata(self, img_file: Path) -> bool:
+        return _construct_metadata_path(img_file).exists()
+
+    def load(self, img_file: Path) -> ImageMetadata:
+        return load_meta(img_file)
+
+    def load_many(self, img_files: Iterable[Path], executor: Optional[Executor] = None) -> Iterator[ImageMetadata]:
+        return load_meta_many(img_files, executor)
+
+    def write(self, metadata: ImageMetadata, img_file: Path) -> None:
+        write_meta(metadata, img_file, sync_directory=False)
+
+    def sync(self, img_files: Iterable[Path]) -> None:
+        # Metadata files are synchronized as they are written, while their directories are not
+        for directory in {_construct_metadata_path(img_file).parent for img_file in img_files}:
+            fsync_directory(directory)
+
+
+def _parse_record(img_file: Path, record: Optional[bytes]) -> ImageMetadata:
+    # Module-level, so that records can be parsed by process pools, too
+    if record is None:
+        return _blank_meta(img_file)
+
+    try:
+        metadata = parse_xml(record.decode('utf-8'))
+    except (ParseError, UnicodeDecodeError):
+        return _blank_meta(img_file)
+
+    # Same as load_meta(), for documents using the older schema
+    if metadata.file.scheme is None:
+        metadata = _old_to_new_schema(img_file, metadata)
+
+    return metadata
+
+
+class CollectionStore(MetadataStore):
+    """
+    A store keeping the metadata of all the images of a directory in a single collection file.
+
+    The collection file is the concatenation of the metadata documents of the images, enclosed into a `<collection>`
+    root element: it can be processed as a whole by any XML tool. Documents are appended whenever metadata is updated,
+    the last document about an image superseding the previous ones, until the collection is compacted.
+
+    When opened, the collection is read once for locating its documents, which are then read and parsed on demand.
+    Documents are associated with images through the file URI they contain.
+    """
+
+    FILE_NAME = '.himakura-collection.xml'
+
+    _HEADER = b'<collection>'
+    _FOOTER = b'\n</collection>\n'
+    # The start tags of documents, and the markup that may contain anything, including text looking like a start tag:
+    # comments, CDATA sections, processing instructions and document type declarations, which are skipped. Since '<' is
+    # always escaped inside text and attribute values, start tags cannot be found anywhere else.
+    _DOCUMENT = re.compile(rb'<!--.*?-->|<!\[CDATA\[.*?]]>|<\?.*?\?>|<!DOCTYPE(?:[^\[>]|\[.*?])*>|(<image[\s/>])',
+                           re.DOTALL)
+    _FILE_ATTRIBUTE = re.compile(rb'\s(file|filename)="([^"]*)"')
+
+    def __init__(self, directory: Path, collection_file: Optional[Path] = None):
+        """
+        Open the collection of the given directory, creating it if necessary.
+
+        :param directory: the directory whose images are described by the collection
+        :param collection_file: the location of the collection, `FILE_NAME` under the directory if not specified
+        :raise OSError: when the collection cannot be opened or created
+        """
+
+        self._directory = directory
+        self._path = collection_file if collection_file is not None else directory / self.FILE_NAME
+        self._lock = RLock()
+        self._file = open(os.open(self._path, os.O_RDWR | os.O_CREAT, 0o666), 'r+b')
+        # Where documents start and end, by image path
+        self._documents: Dict[str, Tuple[int, int]] = {}
+        # Where the next document goes
+        self._end = 0
+        self._status: Optional[Tuple[int, int, int]] = None
+
+        with self._lock:
+            self._read_index()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @staticmethod
+    def _key(img_file: Path) -> str:
+        return os.path.abspath(img_file)
+
+    def _document_key(self, start_tag: bytes) -> Optional[str]:
+        # Find out the image described by a document, without going through URI parsing
+        attributes = dict(self._FILE_ATTRIBUTE.findall(start_tag))
+        uri = attributes.get(b'file', attributes.get(b'filename'))
+        if uri is None:
+            return None
+
+        uri = unescape(uri.decode('utf-8', errors='replace'))
+        if uri.startswith('file://'):
+            uri = uri[len('file://'):]
+
+        # Legacy documents only contain file names
+        return os.path.abspath(os.path.join(self._directory, unquote(uri)))
+
+    def _stat(self) -> Tuple[int, int, int]:
+        stat = os.stat(self._path)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _read_index(self) -> None:
+        self._file.seek(0)
+        data = self._file.read()
+
+        if len(data) == 0:
+            self._file.write(self._HEADER + self._FOOTER)
+            self._file.flush()
+            data = self._HEADER + self._FOOTER
+
+        documents = {}
+        matches = [match for match in self._DOCUMENT.finditer(data) if match.group(1) is not None]
+        footer = data.rfind(self._FOOTER.strip())
+        end = footer if footer >= 0 else len(data)
+
+        for position, match in enumerate(matches):
+            document_end = matches[position + 1].start() if position + 1 < len(matches) else end
+            key = self._document_key(data[match.start():data.find(b'>', match.start()) + 1])
+            if key is not None:
+                # Later documents supersede earlier ones
+                documents[key] = (match.start(), document_end)
+
+        self._documents = documents
+        # Documents are appended after the last one, which may have been left incomplete
+        self._end = len(data[:end].rstrip())
+        self._status = self._stat()
+
+    def is_store_file(self, path: Path) -> bool:
+        return path == self._path
+
+    def refresh(self) -> bool:
+        with self._lock:
+            status = self._stat()
+            if status == self._status:
+                return False
+
+            if status[0] != os.fstat(self._file.fileno()).st_ino:
+                # The file has been replaced
+                self._file.close()
+                self._file = open(self._path, 'r+b')
+
+            self._read_index()
+            return True
+
+    def has_metadata(self, img_file: Path) -> bool:
+        return self._key(img_file) in self._documents
+
+    def _read(self, img_file: Path) -> Optional[bytes]:
+        with self._lock:
+            location = self._documents.get(self._key(img_file))
+            if location is None:
+                return None
+
+            self._file.seek(location[0])
+            return self._file.read(location[1] - location[0])
+
+    def load(self, img_file: Path) -> ImageMetadata:
+        return _parse_record(img_file, self._read(img_file))
+
+    def load_many(self, img_files: Iterable[Path], executor: Optional[Executor] = None) -> Iterator[ImageMetadata]:
+        """
+        Load the metadata of multiple images, in the same order as they are provided.
+
+        Documents are read sequentially, and parsed through the given executor, if any.
+        """
+
+        img_files = list(img_files)
+        records = [self._read(img_file) for img_file in img_files]
+
+        if executor is None:
+            return map(_parse_record, img_files, records)
+
+        return executor.map(_parse_record, img_files, records, chunksize=64)
+
+    def write(self, metadata: ImageMetadata, img_file: Path) -> None:
+        """
+        Append the updated metadata of an image to the collection.
+
+        The file URI of the metadata is set to the image's.
+        """
+
+        document = generate_xml(metadata._replace(file=URI(img_file))).encode('utf-8')
+
+        with self._lock:
+            # Overwrite the footer, so that the collection stays well-formed
+            self._file.seek(self._end)
+            self._file.write(b'\n' + document + self._FOOTER)
+            self._file.truncate()
+            self._file.flush()
+
+            self._documents[self._key(img_file)] = (self._end + 1, self._end + 1 + len(document))
+            self._end += 1 + len(document)
+            self._status = self._stat()
+
+    def sync(self, img_files: Iterable[Path]) -> None:
+        with self._lock:
+            os.fsync(self._file.fileno())
+
+    def compact(self) -> None:
+        """
+        Rewrite the collection, dropping superseded documents.
+
+        :raise OSError: when the collection could not be rewritten
+        """
+
+        with self._lock:
+            documents = sorted(self._documents.values())
+            temporary = self._path.with_name(self._path.name + '.tmp')
+
+            with temporary.open('wb') as output:
+                output.write(self._HEADER)
+                for start, end in documents:
+                    self._file.seek(start)
+                    output.write(b'\n' + self._file.read(end - start).rstrip())
+
+                output.write(self._FOOTER)
+                output.flush()
+                os.fsync(output.fileno())
+
+            os.replace(temporary, self._path)
+            self._file.close()
+            self._file = open(self._path, 'r+b')
+            self._read_index()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def open_store(directory: Path) -> MetadataStore:
+    """
+    Open the store holding the metadata of the images of a directory.
+
+    :param directory: the directory whose images are described by the store
+    :return: the collection of the directory, if it has one, or a sidecar store otherwise
+    :raise OSError: when the collection cannot be opened
+    """
+
+    if (directory / CollectionStore.FILE_NAME).exists():
+        return CollectionStore(directory)
+
+    return SidecarStore()
+
+
+def copy_metadata(img_files: Iterable[Path], source: MetadataStore, destination: MetadataStore) -> int:
+    """
+    Copy the metadata of some images from a store to another, for converting between storage formats.
+
+    Images without recorded metadata are skipped.
+
+    :param img_files: the images whose metadata is copied
+    :param source: the store metadata is read from
+    :param destination: the store metadata is written to
+    :return: the number of images whose metadata was copied
+    :raise OSError: when metadata could not be written
+    """
+
+    img_files: List[Path] = [img_file for img_file in img_files if source.has_metadata(img_file)]
+
+    for img_file, metadata in zip(img_files, source.load_many(img_files)):
+        destination.write(metadata, img_file)
+
+    destination.sync(img_files)
+    return len(img_files)
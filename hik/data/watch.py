@@ -0,0 +1,229 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+from abc import ABCMeta, abstractmethod
+from enum import Enum
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class ChangeKind(Enum):
+    """The kinds of change a directory watcher can report."""
+
+    # A file has been created or modified, or moved into the directory
+    UPDATED = 1
+    # A file has been deleted, or moved out of the directory
+    REMOVED = 2
+    # Some changes have been lost, and the whole directory should be examined again
+    RESCAN = 3
+
+
+class Change(NamedTuple):
+    """
+    A change that occurred inside a watched directory.
+
+    path - the path of the changed file, or of the directory itself for rescan requests
+    kind - what happened to the file
+    """
+
+    path: Path
+    kind: ChangeKind
+
+
+class DirectoryWatcher(metaclass=ABCMeta):
+    """
+    An observer of the changes to the files contained in a directory.
+
+    Changes are accumulated by the watcher and handed out through `poll()`, which never blocks.
+    """
+
+    def __init__(self, directory: Path):
+        self._directory = directory
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def directory(self) -> Path:
+        return self._directory
+
+    def fileno(self) -> Optional[int]:
+        """Return a file descriptor that becomes readable when changes are available, if the watcher has one."""
+
+        return None
+
+    @abstractmethod
+    def poll(self) -> List[Change]:
+        """
+        Return the changes that occurred since the last call, in chronological order.
+
+        Multiple changes to the same file are coalesced into the last one.
+        """
+
+        pass
+
+    def close(self) -> None:
+        """Stop watching the directory."""
+
+        pass
+
+
+class InotifyWatcher(DirectoryWatcher):
+    """A directory watcher relying on the Linux inotify API, accessed through ctypes."""
+
+    _IN_CLOSE_WRITE = 0x00000008
+    _IN_MOVED_FROM = 0x00000040
+    _IN_MOVED_TO = 0x00000080
+    _IN_CREATE = 0x00000100
+    _IN_DELETE = 0x00000200
+    _IN_DELETE_SELF = 0x00000400
+    _IN_MOVE_SELF = 0x00000800
+    _IN_Q_OVERFLOW = 0x00004000
+    _IN_ISDIR = 0x40000000
+    _IN_NONBLOCK = os.O_NONBLOCK
+    _IN_CLOEXEC = 0o2000000
+
+    _EVENT_HEADER = struct.Struct('iIII')
+
+    _libc = None
+
+    def __init__(self, directory: Path):
+        """
+        Start watching a directory.
+
+        :param directory: the directory to be watched
+        :raise OSError: when inotify is not available or the directory cannot be watched
+        """
+
+        super().__init__(directory)
+
+        if InotifyWatcher._libc is None:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            if not hasattr(libc, 'inotify_init1'):
+                raise OSError("inotify is not available on this platform.")
+
+            InotifyWatcher._libc = libc
+
+        self._fd = self._libc.inotify_init1(self._IN_NONBLOCK | self._IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        # Files can appear without being written, such as hard links
+        mask = (self._IN_CLOSE_WRITE | self._IN_MOVED_FROM | self._IN_MOVED_TO | self._IN_CREATE | self._IN_DELETE |
+                self._IN_DELETE_SELF | self._IN_MOVE_SELF)
+        if self._libc.inotify_add_watch(self._fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, os.strerror(errno), str(directory))
+
+    def fileno(self) -> Optional[int]:
+        return self._fd
+
+    def _read_events(self) -> List[Tuple[int, str]]:
+        events = []
+        while True:
+            try:
+                buffer = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+
+            offset = 0
+            while offset < len(buffer):
+                _, mask, _, length = self._EVENT_HEADER.unpack_from(buffer, offset)
+                offset += self._EVENT_HEADER.size
+                name = os.fsdecode(buffer[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                events.append((mask, name))
+
+    def poll(self) -> List[Change]:
+        changes: Dict[Path, ChangeKind] = {}
+
+        for mask, name in self._read_events():
+            if mask & (self._IN_Q_OVERFLOW | self._IN_DELETE_SELF | self._IN_MOVE_SELF):
+                # Events went missing or the directory itself is gone: there's nothing to do but start over
+                return [Change(self._directory, ChangeKind.RESCAN)]
+
+            if mask & self._IN_ISDIR or len(name) == 0:
+                continue
+
+            path = self._directory / name
+            # Keep chronological order among coalesced changes
+            changes.pop(path, None)
+            if mask & (self._IN_CLOSE_WRITE | self._IN_MOVED_TO | self._IN_CREATE):
+                changes[path] = ChangeKind.UPDATED
+            else:
+                changes[path] = ChangeKind.REMOVED
+
+        return [Change(path, kind) for path, kind in changes.items()]
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher(DirectoryWatcher):
+    """
+    A directory watcher that detects changes by comparing successive listings of the directory.
+
+    This is a portable fallback: every poll costs a full listing, plus one status query per file on some platforms.
+    """
+
+    def __init__(self, directory: Path):
+        """
+        Start watching a directory.
+
+        :param directory: the directory to be watched
+        :raise OSError: when the directory cannot be listed
+        """
+
+        super().__init__(directory)
+        self._snapshot = self._take_snapshot()
+
+    def _take_snapshot(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        with os.scandir(self._directory) as listing:
+            for entry in listing:
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    # Vanished while listing
+                    pass
+
+        return snapshot
+
+    def poll(self) -> List[Change]:
+        try:
+            snapshot = self._take_snapshot()
+        except OSError:
+            return [Change(self._directory, ChangeKind.RESCAN)]
+
+        changes = [Change(self._directory / name, ChangeKind.REMOVED)
+                   for name in self._snapshot.keys() - snapshot.keys()]
+        changes.extend(Change(self._directory / name, ChangeKind.UPDATED)
+                       for name, status in snapshot.items() if self._snapshot.get(name) != status)
+        self._snapshot = snapshot
+
+        return changes
+
+
+def open_watcher(directory: Path) -> DirectoryWatcher:
+    """
+    Start watching a directory with the best watcher available on this platform.
+
+    :param directory: the directory to be watched
+    :return: an inotify-based watcher, if possible, or a polling one
+    :raise OSError: when the directory cannot be watched at all
+    """
+
+    try:
+        return InotifyWatcher(directory)
+    except (OSError, AttributeError):
+        return PollingWatcher(directory)
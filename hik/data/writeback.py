@@ -0,0 +1,135 @@
+import logging
+import os
+from pathlib import Path
+from threading import Condition, Thread
+from typing import Callable, Dict, Optional, Tuple
+
+from data.common import ImageMetadata
+from data.storage import MetadataStore
+
+_logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """
+    A queue of metadata updates, written to a metadata store by a background thread.
+
+    Updates are accepted right away and written in batches: repeated updates of the same image that are still queued
+    are coalesced into the latest one, and the store is synchronized once per batch (see `MetadataStore.sync()`).
+    Queued updates are served by `pending()`, so that they can be read back before being written.
+
+    Errors are reported through a callback, run through a scheduling function which is expected to run it on the
+    thread owning the queue (for instance, `GLib.idle_add` for the GTK main loop). Unexpected errors, which are not
+    `OSError`s, are logged instead, and don't stop the writing thread.
+    """
+
+    def __init__(self, store: MetadataStore, on_error: Callable[[Path, OSError], object],
+                 schedule: Callable[..., object] = lambda callback, *args: callback(*args)):
+        """
+        Start a new queue.
+
+        :param store: the store updates are written to
+        :param on_error: the function called with the image and the error, when the metadata of an image could not be
+                         written
+        :param schedule: a function running the given callback, with the given arguments, on the owning thread; by
+                         default, callbacks run on the writing thread
+        """
+
+        self._store = store
+        self._on_error = on_error
+        self._schedule = schedule
+        self._condition = Condition()
+        # Updates waiting to be written, and those being written, by image path
+        self._queued: Dict[str, Tuple[ImageMetadata, Path]] = {}
+        self._writing: Dict[str, Tuple[ImageMetadata, Path]] = {}
+        self._closed = False
+
+        self._writer = Thread(target=self._run, name="MetadataWriter", daemon=True)
+        self._writer.start()
+
+    @staticmethod
+    def _key(img_file: Path) -> str:
+        return os.path.abspath(img_file)
+
+    def _report(self, img_file: Path, error: OSError) -> None:
+        self._schedule(self._on_error, img_file, error)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while len(self._queued) == 0 and not self._closed:
+                    self._condition.wait()
+
+                if len(self._queued) == 0:
+                    return
+
+                self._writing, self._queued = self._queued, {}
+
+            try:
+                self._write_batch()
+            finally:
+                with self._condition:
+                    self._writing = {}
+                    self._condition.notify_all()
+
+    def _write_batch(self) -> None:
+        written = []
+        for metadata, img_file in self._writing.values():
+            try:
+                self._store.write(metadata, img_file)
+                written.append(img_file)
+            except OSError as error:
+                self._report(img_file, error)
+            except Exception:
+                _logger.exception("Could not write the metadata of %s", img_file)
+
+        try:
+            self._store.sync(written)
+        except OSError as error:
+            for img_file in written:
+                self._report(img_file, error)
+        except Exception:
+            _logger.exception("Could not synchronize the metadata store")
+
+    def submit(self, metadata: ImageMetadata, img_file: Path) -> None:
+        """
+        Queue the updated metadata of an image, superseding any queued update of the same image.
+
+        :raise RuntimeError: when the queue has been closed
+        """
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Metadata updates submitted after closing the queue.")
+
+            self._queued[self._key(img_file)] = (metadata, img_file)
+            self._condition.notify_all()
+
+    def pending(self, img_file: Path) -> Optional[ImageMetadata]:
+        """Return the metadata of an image that is waiting to be written, if any."""
+
+        key = self._key(img_file)
+        with self._condition:
+            update = self._queued.get(key, self._writing.get(key))
+
+        return update[0] if update is not None else None
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for all queued updates to be written.
+
+        :param timeout: how long to wait at most, in seconds, or None for no limit
+        :return: whether all updates were written
+        """
+
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self._queued) == 0 and len(self._writing) == 0, timeout)
+
+    def close(self) -> None:
+        """Write all queued updates and stop the writing thread."""
+
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+        self._writer.join()
@@ -1,61 +1,178 @@
+import re
 import xml.etree.ElementTree as ElTree
+from typing import List, Optional
 from uuid import UUID
+
 from uri import URI
 
 from data.common import ImageMetadata
+from instrumentation import timed
+
+
+# Characters that cannot appear in XML documents at all, which are left out of them
+_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+# Characters that don't read back as they were written: those left out, and carriage returns, which parsers turn into
+# line feeds
+_UNSTABLE = re.compile('[\x00-\x08\x0b-\x1f\ud800-\udfff\ufffe\uffff]')
+
+
+def _escape_text(text: str) -> str:
+    # Escape character data exactly as ElementTree does, except for leaving out characters that would make the
+    # document not well-formed
+    if _INVALID.search(text) is not None:
+        text = _INVALID.sub('', text)
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+
+    return text
+
+
+def _escape_attribute(text: str) -> str:
+    # Escape attribute values exactly as ElementTree does, line breaks and tabs included
+    text = _escape_text(text)
+    if "\"" in text:
+        text = text.replace("\"", "&quot;")
+    if "\r" in text:
+        text = text.replace("\r", "&#13;")
+    if "\n" in text:
+        text = text.replace("\n", "&#10;")
+    if "\t" in text:
+        text = text.replace("\t", "&#09;")
+
+    return text
+
+
+def _text_element(tag: str, text: Optional[str]) -> str:
+    # Elements without text are written in short form, like ElementTree does
+    if text:
+        return "<" + tag + ">" + _escape_text(text) + "</" + tag + ">"
+
+    return "<" + tag + " />"
+
+
+def _list_element(tag: str, item_tag: str, items: List[Optional[str]]) -> str:
+    if len(items) == 0:
+        return "<" + tag + " />"
+
+    return "<" + tag + ">" + "".join([_text_element(item_tag, item) for item in items]) + "</" + tag + ">"
 
 
 def generate_xml(metadata: ImageMetadata) -> str:
     """
     Generate a new XML document containing the metadata for a given image.
 
+    The document is produced from a template, and is identical to the one ElementTree would produce, except that
+    characters which cannot appear in XML documents are left out, so that the document can always be read back.
+
     :arg metadata: an image metadata object
     :return: the generated XML in Unicode string format
     """
 
-    new_xml_root = ElTree.Element('image', {'id': str(metadata.img_id), 'file': str(metadata.file)})
+    head = '<image id="' + _escape_attribute(str(metadata.img_id)) + '" file="' + \
+           _escape_attribute(str(metadata.file)) + '"'
+    body = []
 
     if metadata.author is not None:
-        ElTree.SubElement(new_xml_root, 'author').text = metadata.author
+        body.append(_text_element('author', metadata.author))
 
     if metadata.universe is not None:
-        ElTree.SubElement(new_xml_root, 'universe').text = metadata.universe
+        body.append(_text_element('universe', metadata.universe))
 
     if metadata.characters is not None:
-        section = ElTree.SubElement(new_xml_root, 'characters')
-        for char in metadata.characters:
-            ElTree.SubElement(section, 'character').text = char
+        body.append(_list_element('characters', 'character', list(metadata.characters)))
 
     if metadata.tags is not None:
-        section = ElTree.SubElement(new_xml_root, 'tags')
-        for tag in metadata.tags:
-            ElTree.SubElement(section, 'tag').text = tag
+        body.append(_list_element('tags', 'tag', list(metadata.tags)))
 
-    return ElTree.tostring(new_xml_root, encoding="unicode")
+    if len(body) == 0:
+        return head + " />"
 
+    return head + ">" + "".join(body) + "</image>"
 
+
+def read_back(metadata: ImageMetadata, document: str) -> ImageMetadata:
+    """
+    Get the metadata that `parse_xml()` reads from the document generated for the given metadata.
+
+    The metadata is built directly out of the given one, without parsing the document, unless it contains characters
+    that were left out of the document or would be altered by the parser.
+
+    :param metadata: an image metadata object
+    :param document: the XML document generated for it by `generate_xml()`
+    :return: the metadata read from the document
+    :raise ParseError: when the document is not well-formed
+    """
+
+    texts = [str(metadata.file), metadata.author, metadata.universe]
+    texts.extend(metadata.characters or ())
+    texts.extend(metadata.tags or ())
+    if _UNSTABLE.search("".join([text for text in texts if text])) is not None:
+        return parse_xml(document)
+
+    def read_list(items):
+        # Empty lists are read as missing, and items without text as None
+        if items is None:
+            return None
+
+        read = [item or None for item in items]
+        return read if len(read) > 0 else None
+
+    return ImageMetadata(img_id=metadata.img_id if isinstance(metadata.img_id, UUID) else UUID(str(metadata.img_id)),
+                         file=metadata.file if isinstance(metadata.file, URI) else URI(str(metadata.file)),
+                         author=metadata.author or None,
+                         universe=metadata.universe or None,
+                         characters=read_list(metadata.characters),
+                         tags=read_list(metadata.tags))
+
+
+def _make_metadata(img_id: Optional[str], file: Optional[str], author: Optional[str], universe: Optional[str],
+                   characters: List[Optional[str]], tags: List[Optional[str]]) -> ImageMetadata:
+    return ImageMetadata(img_id=UUID(img_id),
+                         file=URI(file),
+                         author=author,
+                         universe=universe,
+                         characters=characters if len(characters) != 0 else None,
+                         tags=tags if len(tags) != 0 else None)
+
+
+@timed('parse_xml')
 def parse_xml(data: str) -> ImageMetadata:
     """Parse an XML containing image metadata.
 
+    The children of the root element are examined directly, instead of being looked up through path expressions, with
+    the same outcome.
+
     :param data: a string containing valid image metadata
-    :return: an image metadata object"""
+    :return: an image metadata object
+    :raise ParseError: when the document is not well-formed"""
 
     image_elem = ElTree.fromstring(data)
-    img_id = image_elem.get('id')
-    file = image_elem.get('file')
+    author = universe = None
+    has_author = has_universe = False
+    characters = []
+    tags = []
+
+    for child in image_elem:
+        tag = child.tag
+        # Only the first occurrence of single-valued elements counts, while lists are merged
+        if tag == 'author':
+            if not has_author:
+                author, has_author = child.text, True
+        elif tag == 'universe':
+            if not has_universe:
+                universe, has_universe = child.text, True
+        elif tag == 'characters':
+            characters.extend([char.text for char in child if char.tag == 'character'])
+        elif tag == 'tags':
+            tags.extend([item.text for item in child if item.tag == 'tag'])
 
+    file = image_elem.get('file')
     # If we were presented with a legacy XML not containing 'file', use the legacy name 'filename'
     if file is None:
         file = image_elem.get('filename')
 
-    author = image_elem.find("./author")
-    universe = image_elem.find("./universe")
-    characters = [char.text for char in image_elem.findall("./characters/character")]
-    tags = [tag.text for tag in image_elem.findall("./tags/tag")]
-
-    return ImageMetadata(img_id=UUID(img_id),
-                         file=URI(file),
-                         author=author.text if author is not None else None,
-                         universe=universe.text if universe is not None else None,
-                         characters=characters if len(characters) != 0 else None,
-                         tags=tags if len(tags) != 0 else None)
+    return _make_metadata(image_elem.get('id'), file, author, universe, characters, tags)
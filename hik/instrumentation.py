@@ -0,0 +1,202 @@
+"""
+Timers and counters around the hot paths of HImaKura, for finding out where time goes.
+
+Instrumentation is switched on by environment variables, read once at startup:
+
+- `HIMAKURA_INSTRUMENT` enables timers and counters, whose histograms are reported on exit, to the standard error if
+  set to `1` or to the file it names otherwise;
+- `HIMAKURA_PROFILE` names a file receiving the `cProfile` statistics of the main thread over the whole session, to
+  be read with `pstats`;
+- `HIMAKURA_TRACEMALLOC` names a file receiving the lines of code that allocated the most memory, and the peak.
+
+When disabled, instrumented functions are left untouched and timed blocks run in a shared null context, so that
+instrumentation costs next to nothing.
+"""
+
+import atexit
+import os
+import sys
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Dict, Iterator, TextIO, TypeVar
+
+INSTRUMENT_VARIABLE = 'HIMAKURA_INSTRUMENT'
+PROFILE_VARIABLE = 'HIMAKURA_PROFILE'
+TRACEMALLOC_VARIABLE = 'HIMAKURA_TRACEMALLOC'
+
+F = TypeVar('F', bound=Callable)
+
+_DISABLED = nullcontext()
+# How many of the lines of code allocating the most memory are written
+_ALLOCATIONS_SHOWN = 50
+
+
+class Histogram:
+    """The durations of the runs of an operation, bucketed by powers of two of microseconds."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        # Runs by bucket, bucket n holding durations from 2^n to 2^(n+1) microseconds
+        self.buckets: Dict[int, int] = Counter()
+
+    def add(self, duration: float) -> None:
+        """Record a run lasting the given number of seconds."""
+
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.buckets[max(int(duration * 1e6), 1).bit_length() - 1] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """Return an upper bound of the duration within which the given fraction of runs ended, in seconds."""
+
+        runs = 0
+        for bucket in sorted(self.buckets):
+            runs += self.buckets[bucket]
+            if runs >= fraction * self.count:
+                return min(2 ** (bucket + 1) / 1e6, self.max)
+
+        return self.max
+
+
+class Recorder:
+    """A collector of timings and counts, by name of the operation."""
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = Counter()
+        self._lock = Lock()
+
+    def record(self, name: str, duration: float) -> None:
+        """Record a run of an operation lasting the given number of seconds."""
+
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(duration)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """Increase a counter, if enabled."""
+
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += amount
+
+    def timed(self, name: str) -> Callable[[F], F]:
+        """Decorate a function so that its calls are timed, if enabled, or leave it untouched otherwise."""
+
+        def decorate(function: F) -> F:
+            if not self.enabled:
+                return function
+
+            @wraps(function)
+            def timed_function(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(name, perf_counter() - start)
+
+            return timed_function
+
+        return decorate
+
+    def measure(self, name: str):
+        """Return a context manager timing the block it wraps, if enabled."""
+
+        return self._measure(name) if self.enabled else _DISABLED
+
+    @contextmanager
+    def _measure(self, name: str) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, perf_counter() - start)
+
+    def report(self, output: TextIO) -> None:
+        """Write the histograms of the operations, slowest overall first, and the counters."""
+
+        with self._lock:
+            histograms = sorted(self.histograms.items(), key=lambda item: item[1].total, reverse=True)
+            counters = sorted(self.counters.items())
+
+        for name, histogram in histograms:
+            print("{}: {} runs, {:.3f} ms total, mean {:.3f} ms, p50 {:.3f} ms, p90 {:.3f} ms, p99 {:.3f} ms, "
+                  "max {:.3f} ms".format(name, histogram.count, histogram.total * 1e3,
+                                         histogram.total / histogram.count * 1e3, histogram.percentile(0.5) * 1e3,
+                                         histogram.percentile(0.9) * 1e3, histogram.percentile(0.99) * 1e3,
+                                         histogram.max * 1e3), file=output)
+
+            widest = max(histogram.buckets.values())
+            for bucket in sorted(histogram.buckets):
+                runs = histogram.buckets[bucket]
+                print("    {:>9} - {:<9} us {:<40} {}".format(2 ** bucket, 2 ** (bucket + 1),
+                                                               '#' * max(runs * 40 // widest, 1), runs), file=output)
+
+        for name, value in counters:
+            print("{}: {}".format(name, value), file=output)
+
+
+# The recorder of the whole application
+recorder = Recorder(bool(os.environ.get(INSTRUMENT_VARIABLE)))
+timed = recorder.timed
+measure = recorder.measure
+count = recorder.count
+
+
+def _write_report(destination: str) -> None:
+    if destination == '1':
+        recorder.report(sys.stderr)
+    else:
+        with open(destination, 'w') as output:
+            recorder.report(output)
+
+
+def start_session() -> None:
+    """
+    Start profiling and tracing memory allocations, if requested, and arrange for the results to be written on exit.
+
+    Should be called once, as early as possible.
+    """
+
+    instrument = os.environ.get(INSTRUMENT_VARIABLE)
+    if instrument:
+        atexit.register(_write_report, instrument)
+
+    profile_file = os.environ.get(PROFILE_VARIABLE)
+    if profile_file:
+        import cProfile
+
+        profiler = cProfile.Profile()
+
+        def write_profile():
+            profiler.disable()
+            profiler.dump_stats(profile_file)
+
+        atexit.register(write_profile)
+        profiler.enable()
+
+    allocations_file = os.environ.get(TRACEMALLOC_VARIABLE)
+    if allocations_file:
+        import tracemalloc
+
+        def write_allocations():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            with open(allocations_file, 'w') as output:
+                print("current {:.1f} KiB, peak {:.1f} KiB".format(current / 1024, peak / 1024), file=output)
+                for statistic in snapshot.statistics('lineno')[:_ALLOCATIONS_SHOWN]:
+                    print(statistic, file=output)
+
+        tracemalloc.start()
+        atexit.register(write_allocations)
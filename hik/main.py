@@ -1,4 +1,20 @@
-from ui.gui_gtk.application import GtkInstance
+import sys
+from time import perf_counter
+
+# Taken before importing anything else, so that startup traces account for every import
+started = perf_counter()
+
+import cli
+import instrumentation
 
 if __name__ == '__main__':
-    GtkInstance().run()
+    instrumentation.start_session()
+
+    # Commands run headless, without ever loading the GUI toolkit
+    if len(sys.argv) > 1 and sys.argv[1] in cli.COMMANDS + ('-h', '--help'):
+        sys.exit(cli.main())
+
+    from ui.trace import StartupTrace
+    from ui.gui_gtk.application import GtkInstance
+
+    GtkInstance(StartupTrace.from_environment(started)).run()
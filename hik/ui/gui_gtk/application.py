@@ -1,8 +1,11 @@
 from importlib import resources
+from typing import Optional
 
 from gi.repository import Gtk, Gio
 
 from ui.gui_gtk.interface import Signals, State
+from ui.gui_gtk.render import ImageRenderer
+from ui.trace import StartupTrace
 
 
 class GtkInstance(Gtk.Application):
@@ -10,9 +13,21 @@ class GtkInstance(Gtk.Application):
 
     appId = "network.entropic.himakura"
     interface_markup = resources.read_text('ui.gui_gtk', 'HImaKura.glade')
+    # Descriptions of the secondary windows and dialogs, which are only built when first shown
+    deferred_markup = ['ChangedWarningDialog.glade', 'DirectoryOpener.glade', 'ErrorDialog.glade',
+                       'FilterEditor.glade', 'ThumbnailBrowser.glade']
+
+    def __init__(self, trace: Optional[StartupTrace] = None):
+        """
+        Instantiate the application.
+
+        :param trace: the trace of startup, whose import phase ends here, if startup is being traced
+        """
 
-    def __init__(self):
         super().__init__(application_id=self.appId, flags=Gio.ApplicationFlags.FLAGS_NONE)
+        self._trace = trace
+        if trace is not None:
+            trace.mark("import")
 
         # Connect signal handlers for this application
         self.connect("startup", self.startup)
@@ -20,11 +35,17 @@ class GtkInstance(Gtk.Application):
         self.connect("shutdown", self.shutdown)
 
     def startup(self, *args):
-        """Load the interface description file and connect the signal handlers."""
+        """Load the interface description of the main window and connect the signal handlers."""
+
+        if self._trace is not None:
+            self._trace.mark("registration")
 
         State.builder = Gtk.Builder.new_from_string(self.interface_markup, -1)
         State.builder.connect_signals(Signals.handlers)
-        
+        for markup_file in self.deferred_markup:
+            State.defer(resources.read_text('ui.gui_gtk', markup_file))
+        State.renderer = ImageRenderer(State.get_object("ImageSurface"))
+
         # Attach special change-detection handler to the buffer of the tags box, since it can't be done from Glade
         State.get_object("TagsField").get_buffer().connect("changed", Signals.handlers["set_changed_flag"])
 
@@ -33,9 +54,33 @@ class GtkInstance(Gtk.Application):
 
         main_window = State.get_object("MainWindow")
         self.add_window(main_window)
+
+        if self._trace is not None:
+            self._trace.mark("builder")
+
+            def first_drawn(*args):
+                main_window.disconnect(handler)
+                self._trace.mark("first present")
+                self._trace.report()
+                self._trace = None
+
+            handler = main_window.connect_after("draw", first_drawn)
+
         main_window.present()
 
     def shutdown(self, *args):
-        """Destroy the application window."""
+        """Destroy the application window and release the metadata index, store, loaders and thumbnail generators."""
 
         State.get_object("MainWindow").destroy()
+        State.loader.shutdown()
+
+        if State.grid is not None:
+            State.grid.close()
+
+        if State.index is not None:
+            State.index.close()
+
+        if State.store is not None:
+            # Write pending metadata before letting the store go
+            State.writer.close()
+            State.store.close()
@@ -1,11 +1,21 @@
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Callable, Optional, MutableMapping
+from typing import Callable, Dict, Optional, MutableMapping, Tuple
 
-from gi.repository import Gtk, GLib
-from gi.repository.GdkPixbuf import InterpType
+from gi.repository import Gdk, Gtk, GLib
 
 from data.filtering import FilterBuilder
+from data.index import MetadataIndex
+from data.storage import MetadataStore, SidecarStore, open_store
+from data.writeback import WriteBehindQueue
+from instrumentation import timed
+from ui.gui_gtk.render import ImageRenderer
+from ui.gui_gtk.thumbnails import ThumbnailGrid, generate_thumbnail
 from ui.gui_gtk.view import GtkView
+from ui.render import Debouncer, Size
+from ui.thumbnails import ThumbnailCache, ThumbnailLoader
 
 
 class Signals:
@@ -26,14 +36,42 @@ class State:
     """Impure class containing the few stateful objects for the GTK interface."""
 
     builder: Gtk.Builder = None
+    # UI descriptions not built yet, by the IDs of the objects they describe
+    deferred: Dict[str, str] = dict()
     view: GtkView = None
+    renderer: ImageRenderer = None
+    grid: ThumbnailGrid = None
+    grid_source: Optional[int] = None
+    # Where the pointer was when dragging the image, if it is being dragged
+    pan_origin: Optional[Tuple[float, float]] = None
+    index: Optional[MetadataIndex] = None
+    store: Optional[MetadataStore] = None
+    store_directory: Optional[Path] = None
+    writer: Optional[WriteBehindQueue] = None
+    # Metadata files often live on network mounts, hence use threads for loading them
+    loader: ThreadPoolExecutor = ThreadPoolExecutor(thread_name_prefix="MetadataLoader")
+    watch_source: Optional[int] = None
     inhibit_changed: bool = False
     changed: bool = False
     interrupted_action: Optional[Callable] = None
 
+    @classmethod
+    def defer(cls, markup: str) -> None:
+        """Postpone building the objects of a UI description until one of them is retrieved."""
+
+        for obj_id in re.findall(r'<object class="[^"]+" id="([^"]+)"', markup):
+            cls.deferred[obj_id] = markup
+
     @classmethod
     def get_object(cls, obj_id: str):
-        """Retrieve the GTK object identified by the specified ID."""
+        """Retrieve the GTK object identified by the specified ID, building it first if it was deferred."""
+
+        markup = cls.deferred.get(obj_id)
+        if markup is not None:
+            cls.deferred = {deferred_id: m for deferred_id, m in cls.deferred.items() if m is not markup}
+            # Objects refer to the ones already built, such as the main window, and get their handlers connected
+            cls.builder.add_from_string(markup)
+            cls.builder.connect_signals(Signals.handlers)
 
         return cls.builder.get_object(obj_id)
 
@@ -59,6 +97,14 @@ def metadata_box_sensitiveness(sensitive: bool):
     State.get_object("ClearButton").set_sensitive(sensitive)
 
 
+def navigation_sensitiveness():
+    """Set sensitivity for the navigation buttons, according to the current view."""
+
+    State.get_object("PrevButton").set_sensitive(State.view.has_prev())
+    # Don't wait for the next image to be discovered: if we'll find nothing, the button will be disabled then
+    State.get_object("NextButton").set_sensitive(State.view.has_next(wait=False) is not False)
+
+
 def trigger_unsaved_warning(continuation: Callable):
     """Display the 'unsaved changes' warning and record the suspended action."""
 
@@ -141,6 +187,65 @@ def hide(obj):
     obj.hide()
 
 
+@Signals.register
+def show_directory_opener(*args):
+    State.get_object("DirectoryOpener").show_all()
+
+
+@Signals.register
+def show_filter_editor(*args):
+    State.get_object("FilterEditor").show_all()
+
+
+def open_index(directory: Path) -> Optional[MetadataIndex]:
+    """Return the metadata index of the given directory, reusing the current one whenever possible."""
+
+    if State.index is not None:
+        if State.index.root == directory:
+            return State.index
+
+        State.index.close()
+        State.index = None
+
+    try:
+        State.index = MetadataIndex(directory)
+    except sqlite3.Error:
+        # The directory is probably read-only: just go on without an index
+        pass
+
+    return State.index
+
+
+def open_metadata_store(directory: Path) -> MetadataStore:
+    """Return the metadata store of the given directory, reusing the current one whenever possible."""
+
+    if State.store is not None:
+        if State.store_directory == directory:
+            return State.store
+
+        # Pending updates go to the store they were meant for
+        State.writer.close()
+        State.writer = None
+        State.store.close()
+        State.store = None
+
+    try:
+        State.store = open_store(directory)
+    except OSError:
+        # The collection file is unreadable: fall back to metadata files, which are read-only at worst
+        State.store = SidecarStore()
+
+    State.store_directory = directory
+    State.writer = WriteBehindQueue(State.store, report_write_error, GLib.idle_add)
+    return State.store
+
+
+def report_write_error(img: Path, error: OSError):
+    """Notify that the metadata of an image could not be written in the background."""
+
+    notify_error("<b>Error while saving metadata of " + img.name + "</b>", str(error))
+
+
 # Image and metadata handling and navigation #
 @Signals.register
 def setup_view(chooser, filtering_context: Optional[FilterBuilder] = None):
@@ -155,20 +260,35 @@ def setup_view(chooser, filtering_context: Optional[FilterBuilder] = None):
         return
 
     try:
-        State.view = GtkView(Path(chooser.get_filename()), filtering_context)
+        if State.view is not None:
+            State.view.close()
+            if State.grid is not None:
+                State.grid.clear()
+
+        directory = Path(chooser.get_filename())
+        store = open_metadata_store(directory)
+        # The index is only useful when filtering metadata files, so don't litter directories with it otherwise
+        index = open_index(directory) if filtering_context is not None and store.paired_files else None
+        # Follow the changes to the directory, unless we're exploring a whole tree
+        max_depth = None if State.get_object("RecursiveSwitch").get_active() else 0
+        State.view = GtkView(directory, filtering_context, index, State.loader, streaming=True, max_depth=max_depth,
+                             live=max_depth == 0, store=store, writer=State.writer)
+        view_alloc = State.get_object("ImagePort").get_allocation()
+        State.view.set_display_size(view_alloc.width, view_alloc.height)
+        watch_view()
 
-        # Initialize the UI only if the selected directory has images inside
+        # Initialize the UI only if the selected directory has images inside, as soon as the first one is found
         if State.view.has_next():
             State.view.load_next()
-            refresh_image()
+            show_new_image()
             load_meta()
-            State.get_object("PrevButton").set_sensitive(State.view.has_prev())
-            State.get_object("NextButton").set_sensitive(State.view.has_next())
+            navigation_sensitiveness()
 
             metadata_box_sensitiveness(True)
             State.get_object("FilterEditorButton").set_sensitive(True)
+            State.get_object("ThumbnailBrowserButton").set_sensitive(True)
         else:
-            State.get_object("ImageSurface").clear()
+            State.renderer.clear()
     except OSError as ose:
         # Show error popup
         notify_error("<b>Error opening " + chooser.get_filename() + "</b>", str(ose))
@@ -179,26 +299,128 @@ def setup_view(chooser, filtering_context: Optional[FilterBuilder] = None):
         State.get_object("NextButton").set_sensitive(True)
 
 
+def watch_view():
+    """Apply the changes to the directory of the current view as they happen, if the view is live."""
+
+    if State.watch_source is not None:
+        GLib.source_remove(State.watch_source)
+        State.watch_source = None
+
+    if State.view.live:
+        fd = State.view.watch_fileno()
+        if fd is not None:
+            State.watch_source = GLib.io_add_watch(fd, GLib.PRIORITY_DEFAULT, GLib.IO_IN, sync_view)
+        else:
+            # The watcher has to poll the directory, so don't do it too often
+            State.watch_source = GLib.timeout_add_seconds(2, sync_view)
+
+
+def sync_view(*args) -> bool:
+    """Apply pending changes to the current view and update navigation accordingly."""
+
+    try:
+        if State.view.sync():
+            navigation_sensitiveness()
+    except OSError as ose:
+        notify_error("<b>Error while following changes to the directory</b>", str(ose))
+        State.watch_source = None
+        return GLib.SOURCE_REMOVE
+
+    return GLib.SOURCE_CONTINUE
+
+
+def display_size() -> Size:
+    """Return the size of the area the image is displayed in."""
+
+    view_alloc = State.get_object("ImagePort").get_allocation()
+    return view_alloc.width, view_alloc.height
+
+
 @Signals.register
+@timed('refresh_image')
 def refresh_image(*args):
-    """Reload, resize and refresh the displayed image, taking it from the backing View object."""
+    """Render the displayed image for the current size of the visible area, taking it from the backing View object."""
+
+    resize_debouncer.cancel()
 
     if State.view is not None and State.view.has_image_data():
-        panel = State.get_object("ImageSurface")
-        img_pix = State.view.get_image_data()
-        img_width, img_height = img_pix.get_width(), img_pix.get_height()
-        # Get the visible area's size
-        view_alloc = State.get_object("ImagePort").get_allocation()
-        view_width, view_height = view_alloc.width, view_alloc.height
+        display = display_size()
+        # Have the image decoded no larger than the visible area, unless it is magnified by zooming in
+        State.view.set_display_size(*display)
+        State.renderer.set_image(State.view.get_image_data())
+        if State.renderer.magnifies(display):
+            State.renderer.set_image(State.view.get_image_data(full_resolution=True))
+
+        State.renderer.render(display)
 
-        # If the visible area is smaller than the image, calculate the scaling factor and set the new image sizes
-        # (Thanks to https://stackoverflow.com/a/1106367/13140497 for leading me down the right path)
-        if img_width > view_width or img_height > view_height:
-            s_fact = min(view_width / img_width, view_height / img_height)
-            img_width, img_height = img_width * s_fact, img_height * s_fact
 
-        # Load and resize the image
-        panel.set_from_pixbuf(img_pix.scale_simple(img_width, img_height, InterpType.BILINEAR))
+# Resizing the window allocates the image area many times in a row, so only render once it stops
+resize_debouncer = Debouncer(refresh_image, 50, GLib.timeout_add, GLib.source_remove)
+
+
+@Signals.register
+def resize_image(*args):
+    """Render the displayed image again once the visible area stops changing size."""
+
+    resize_debouncer()
+
+
+def show_new_image():
+    """Display the image the view has just moved to, as a whole."""
+
+    State.renderer.viewport.reset()
+    refresh_image()
+
+
+@Signals.register
+def zoom_image(widget, event) -> bool:
+    """Zoom in or out of the displayed image with the scroll wheel, around the pointer."""
+
+    if State.view is None or not State.view.has_image_data():
+        return False
+
+    if event.direction == Gdk.ScrollDirection.UP:
+        factor = 1.25
+    elif event.direction == Gdk.ScrollDirection.DOWN:
+        factor = 1 / 1.25
+    elif event.direction == Gdk.ScrollDirection.SMOOTH:
+        factor = 1.25 ** -event.delta_y
+    else:
+        return False
+
+    try:
+        State.renderer.zoom(factor, (event.x, event.y), display_size())
+        refresh_image()
+    except GLib.Error as ge:
+        # Invalid image data at full resolution
+        notify_error("<b>Error while zooming into the image</b>", ge.message)
+
+    return True
+
+
+@Signals.register
+def start_panning(widget, event) -> bool:
+    """Start dragging the displayed image, or show it as a whole again on double click."""
+
+    if event.type == Gdk.EventType._2BUTTON_PRESS:
+        show_new_image()
+        return True
+
+    State.pan_origin = (event.x, event.y)
+    return False
+
+
+@Signals.register
+def pan_image(widget, event) -> bool:
+    """Drag the displayed image around, when zoomed in."""
+
+    if State.pan_origin is None or not event.state & Gdk.ModifierType.BUTTON1_MASK:
+        return False
+
+    State.renderer.pan(event.x - State.pan_origin[0], event.y - State.pan_origin[1], display_size())
+    State.pan_origin = (event.x, event.y)
+    refresh_image()
+    return True
 
 
 @Signals.register
@@ -210,11 +432,10 @@ def show_previous_image(*args):
             return
 
         State.view.load_prev()
-        refresh_image()
+        show_new_image()
         load_meta()
 
-        State.get_object("PrevButton").set_sensitive(State.view.has_prev())
-        State.get_object("NextButton").set_sensitive(State.view.has_next())
+        navigation_sensitiveness()
     except StopIteration:
         # In case something goes wrong with the iteration, disable further movement in this direction
         State.get_object("PrevButton").set_sensitive(False)
@@ -232,11 +453,10 @@ def show_next_image(*args):
             return
 
         State.view.load_next()
-        refresh_image()
+        show_new_image()
         load_meta()
 
-        State.get_object("PrevButton").set_sensitive(State.view.has_prev())
-        State.get_object("NextButton").set_sensitive(State.view.has_next())
+        navigation_sensitiveness()
     except StopIteration:
         # In case something goes wrong with the iteration, disable further movement in this direction
         State.get_object("NextButton").set_sensitive(False)
@@ -277,11 +497,64 @@ def save_meta(*args):
     tags_buffer = State.get_object("TagsField").get_buffer()
     State.view.set_tags(tags_buffer.get_text(tags_buffer.get_start_iter(), tags_buffer.get_end_iter(), False))
 
+    # Metadata is written in the background, and errors are reported by the writer
+    State.view.write()
+    State.changed = False
+
+
+# Thumbnails #
+@Signals.register
+def show_thumbnails(*args):
+    """Show the thumbnails of the images in the current view, following the discovery of new ones."""
+
+    if State.view is None:
+        return
+
+    # The browser and its thumbnail generators are only set up once needed
+    if State.grid is None:
+        State.grid = ThumbnailGrid(State.get_object("ThumbnailGrid"),
+                                   ThumbnailLoader(ThumbnailCache(), generate_thumbnail, GLib.idle_add))
+
+    State.grid.set_images(State.view.images())
+    State.get_object("ThumbnailBrowser").show_all()
+
+    if State.grid_source is None:
+        State.grid_source = GLib.timeout_add(500, update_thumbnails)
+
+
+def update_thumbnails() -> bool:
+    """Add the images discovered in the meantime to the thumbnail grid, as long as it is shown."""
+
+    if State.view is None or not State.get_object("ThumbnailBrowser").get_visible():
+        State.grid_source = None
+        return GLib.SOURCE_REMOVE
+
+    State.grid.set_images(State.view.images())
+    return GLib.SOURCE_CONTINUE
+
+
+@Signals.register
+def open_thumbnail(icon_view, tree_path):
+    """Move the view to the image whose thumbnail has been clicked."""
+
+    if State.changed:
+        # Halt in the presence of unsaved changes
+        trigger_unsaved_warning(lambda: open_thumbnail(icon_view, tree_path))
+        return
+
     try:
-        State.view.write()
-        State.changed = False
-    except OSError as ose:
-        notify_error("<b>Error while saving metadata</b>", str(ose))
+        State.view.load_image(State.grid.image_at(tree_path))
+        show_new_image()
+        load_meta()
+
+        navigation_sensitiveness()
+        State.get_object("ThumbnailBrowser").hide()
+    except ValueError:
+        # The image left the view in the meantime
+        State.grid.set_images(State.view.images())
+    except GLib.Error as ge:
+        # Invalid image data
+        notify_error("<b>Error while loading image</b>", ge.message)
 
 
 # Filtering #
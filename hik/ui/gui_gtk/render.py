@@ -0,0 +1,103 @@
+from typing import Optional, Tuple
+
+from gi.repository import Gtk
+from gi.repository.GdkPixbuf import InterpType, Pixbuf
+
+from instrumentation import timed
+from ui.render import MipmapPyramid, Size, Viewport
+
+
+def _size(pixbuf: Pixbuf) -> Size:
+    return pixbuf.get_width(), pixbuf.get_height()
+
+
+def _downscale(pixbuf: Pixbuf, width: int, height: int) -> Pixbuf:
+    return pixbuf.scale_simple(width, height, InterpType.BILINEAR)
+
+
+class ImageRenderer:
+    """
+    The renderer of the displayed image onto a `Gtk.Image`, zoomed and panned through its viewport.
+
+    Only the visible part of the image is rendered, at the size of the display area, from the nearest level of a mipmap
+    pyramid of the image (see `MipmapPyramid`): neither zooming nor panning require decoding the image again, and the
+    cost of rendering depends on the size of the display area rather than on the size of the image.
+    """
+
+    def __init__(self, surface: Gtk.Image):
+        """
+        Instantiate a renderer onto the given image widget.
+
+        :param surface: the widget the image is rendered onto
+        """
+
+        self._surface = surface
+        self.viewport = Viewport()
+        self._pyramid: Optional[MipmapPyramid[Pixbuf]] = None
+        # What was rendered last, so that it isn't rendered again
+        self._rendered: Optional[Tuple] = None
+
+    @property
+    def image(self) -> Optional[Pixbuf]:
+        return self._pyramid.base if self._pyramid is not None else None
+
+    def set_image(self, pixbuf: Pixbuf) -> None:
+        """
+        Set the image to be rendered, keeping zoom and position.
+
+        Nothing changes if the image is already the current one.
+        """
+
+        if self._pyramid is None or self._pyramid.base is not pixbuf:
+            self._pyramid = MipmapPyramid(pixbuf, _size, _downscale)
+
+    def clear(self) -> None:
+        """Forget about the current image and show nothing."""
+
+        self._pyramid = None
+        self._rendered = None
+        self.viewport.reset()
+        self._surface.clear()
+
+    def magnifies(self, display: Size) -> bool:
+        """Tell whether the image is currently displayed larger than it is, in which case more detail would help."""
+
+        return self._pyramid is not None and self.viewport.scale(_size(self._pyramid.base), display) > 1
+
+    def zoom(self, factor: float, point: Tuple[float, float], display: Size) -> None:
+        """Zoom in or out, keeping still the given point of the display area (see `Viewport.zoom_at()`)."""
+
+        if self._pyramid is not None:
+            self.viewport.zoom_at(factor, point, _size(self._pyramid.base), display)
+
+    def pan(self, dx: float, dy: float, display: Size) -> None:
+        """Move the image by the given distance on the display area."""
+
+        if self._pyramid is not None:
+            self.viewport.pan(dx, dy, _size(self._pyramid.base), display)
+
+    @timed('ImageRenderer.render')
+    def render(self, display: Size) -> None:
+        """Render the visible part of the image for a display area of the given size."""
+
+        if self._pyramid is None or display[0] <= 0 or display[1] <= 0:
+            return
+
+        base = self._pyramid.base
+        layout = self.viewport.layout(_size(base), display)
+        if self._rendered == (base, layout):
+            return
+
+        if layout.scale == 1 and (layout.width, layout.height) == _size(base):
+            output = base
+        else:
+            level, factor = self._pyramid.level(layout.scale)
+            output = Pixbuf.new(base.get_colorspace(), base.get_has_alpha(), base.get_bits_per_sample(),
+                                layout.width, layout.height)
+            relative = layout.scale / factor
+            level.scale(output, 0, 0, layout.width, layout.height, -layout.left, -layout.top, relative, relative,
+                        InterpType.BILINEAR)
+
+        # The widget centres images smaller than the display area
+        self._surface.set_from_pixbuf(output)
+        self._rendered = (base, layout)
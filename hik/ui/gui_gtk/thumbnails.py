@@ -0,0 +1,133 @@
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from gi.repository import GLib, Gtk
+from gi.repository.GdkPixbuf import Pixbuf
+
+from ui.gui_gtk.view import _decode
+from ui.render import Debouncer
+from ui.thumbnails import ThumbnailLoader
+
+
+def generate_thumbnail(img: Path, destination: Path, uri: str, mtime: int, size: int) -> None:
+    """
+    Write the thumbnail of an image as a PNG file, as the freedesktop.org thumbnail specification requires.
+
+    Images are scaled down while decoding, and never scaled up.
+
+    :raise GLib.Error: when the image cannot be decoded or the thumbnail cannot be written
+    """
+
+    _, width, height = Pixbuf.get_file_info(str(img))
+    thumbnail = _decode(img, (size, size)).pixbuf
+    thumbnail.savev(str(destination), 'png',
+                    ['tEXt::Thumb::URI', 'tEXt::Thumb::MTime', 'tEXt::Thumb::Image::Width',
+                     'tEXt::Thumb::Image::Height', 'tEXt::Software'],
+                    [uri, str(mtime), str(width), str(height), 'HImaKura'])
+
+
+class ThumbnailGrid:
+    """
+    A grid of thumbnails over an icon view, whose model has the path and name of images and their thumbnails.
+
+    The grid is virtualised: only the cells that are visible, or nearly so, hold thumbnails, which are loaded or
+    generated as the grid is scrolled (see `ThumbnailLoader`).
+    """
+
+    PATH_COLUMN = 0
+    NAME_COLUMN = 1
+    THUMBNAIL_COLUMN = 2
+
+    # How many cells around the visible ones also get their thumbnail, so that scrolling a bit shows them right away
+    MARGIN = 32
+
+    def __init__(self, icon_view: Gtk.IconView, loader: ThumbnailLoader):
+        """
+        Instantiate a grid over the given icon view.
+
+        :param icon_view: the icon view showing the cells, inside a scrolled window
+        :param loader: the provider of the thumbnails
+        """
+
+        self._view = icon_view
+        self._model: Gtk.ListStore = icon_view.get_model()
+        self._loader = loader
+        self._images: List[Path] = []
+        self._rows: Dict[Path, int] = {}
+        # Rows holding a thumbnail, and rows that should
+        self._loaded: Set[int] = set()
+        self._wanted: Set[int] = set()
+
+        # Scrolling and resizing come in bursts, so only load thumbnails once they stop
+        self._debouncer = Debouncer(self.load_visible, 30, GLib.timeout_add, GLib.source_remove)
+        icon_view.get_vadjustment().connect("value-changed", self._debouncer)
+        icon_view.connect("size-allocate", self._debouncer)
+
+    def set_images(self, images: List[Path]) -> None:
+        """Show the given images, keeping the thumbnails already loaded if images were only appended."""
+
+        if images[:len(self._images)] != self._images:
+            self._model.clear()
+            self._images, self._rows = [], {}
+            self._loaded.clear()
+
+        for img in images[len(self._images):]:
+            self._rows[img] = len(self._images)
+            self._images.append(img)
+            self._model.append([str(img), img.name, None])
+
+        self._debouncer()
+
+    def image_at(self, tree_path: Gtk.TreePath) -> Path:
+        """Return the image of the cell at the given position."""
+
+        return self._images[tree_path.get_indices()[0]]
+
+    def load_visible(self) -> None:
+        """Load the thumbnails of the cells that are visible, and drop the others."""
+
+        visible = self._view.get_visible_range()
+        if visible is None:
+            self._wanted = set()
+        else:
+            first, last = visible[0].get_indices()[0], visible[1].get_indices()[0]
+            self._wanted = set(range(max(first - self.MARGIN, 0), min(last + self.MARGIN + 1, len(self._images))))
+
+        for row in self._loaded - self._wanted:
+            self._model[row][self.THUMBNAIL_COLUMN] = None
+        self._loaded &= self._wanted
+
+        self._loader.retain(self._images[row] for row in self._wanted)
+        for row in sorted(self._wanted - self._loaded):
+            thumbnail = self._loader.request(self._images[row], self._thumbnail_ready)
+            if thumbnail is not None:
+                self._show(row, thumbnail)
+
+    def _thumbnail_ready(self, img: Path, thumbnail: Optional[Path]) -> None:
+        row = self._rows.get(img)
+        if thumbnail is not None and row in self._wanted:
+            self._show(row, thumbnail)
+
+    def _show(self, row: int, thumbnail: Path) -> None:
+        try:
+            self._model[row][self.THUMBNAIL_COLUMN] = Pixbuf.new_from_file(str(thumbnail))
+            self._loaded.add(row)
+        except GLib.Error:
+            # Broken thumbnails are left out
+            pass
+
+    def clear(self) -> None:
+        """Empty the grid, giving up the thumbnails being generated."""
+
+        self._debouncer.cancel()
+        self._loader.retain(())
+        self._model.clear()
+        self._images, self._rows = [], {}
+        self._loaded.clear()
+        self._wanted.clear()
+
+    def close(self) -> None:
+        """Empty the grid and stop generating thumbnails."""
+
+        self.clear()
+        self._loader.close()
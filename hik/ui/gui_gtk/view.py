@@ -1,34 +1,177 @@
-from typing import Optional
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
 
+from gi.repository import GLib
 from gi.repository.GdkPixbuf import Pixbuf
 
+from data.cache import CacheStatistics
+from instrumentation import timed
+from ui.prefetch import ImageCache, Prefetcher
 from ui.view import View
 
 
+class DecodedImage(NamedTuple):
+    """
+    An image decoded into a pixbuf.
+
+    pixbuf - the decoded pixels
+    scaled - whether the image was scaled down while decoding, rather than decoded at full resolution
+    """
+
+    pixbuf: Pixbuf
+    scaled: bool
+
+    def fits(self, bound: Optional[Tuple[int, int]]) -> bool:
+        """Tell whether the image can be displayed within the given bound without losing detail."""
+
+        if not self.scaled:
+            return True
+        if bound is None:
+            return False
+
+        # Scaled images touch the bound they were decoded for in one dimension, at least
+        return self.pixbuf.get_width() >= bound[0] or self.pixbuf.get_height() >= bound[1]
+
+
+@timed('decode')
+def _decode(img: Path, bound: Optional[Tuple[int, int]] = None) -> DecodedImage:
+    """
+    Decode an image, scaling it down while decoding if it doesn't fit within the given bound.
+
+    Scaling happens inside the image loaders, which can skip most of the work for some formats (e.g. JPEG), without
+    ever allocating the full-resolution pixels. Images are never scaled up.
+
+    :param img: the path of the image
+    :param bound: the maximum width and height of the decoded image, or None for full resolution
+    :return: the decoded image
+    :raise GLib.Error: when the image cannot be decoded
+    """
+
+    if bound is not None:
+        _, width, height = Pixbuf.get_file_info(str(img))
+        if width > bound[0] or height > bound[1]:
+            return DecodedImage(Pixbuf.new_from_file_at_scale(str(img), bound[0], bound[1], True), True)
+
+    return DecodedImage(Pixbuf.new_from_file(str(img)), False)
+
+
+def _image_size(image: DecodedImage) -> int:
+    pixbuf = image.pixbuf
+    return pixbuf.get_width() * pixbuf.get_height() * pixbuf.get_n_channels() * pixbuf.get_bits_per_sample() // 8
+
+
 class GtkView(View):
-    """Specialization of the View class that provides image data as Pixbuf objects."""
+    """
+    Specialization of the View class that provides image data as Pixbuf objects.
+
+    Images are decoded at the size they are displayed at, as set through `set_display_size()`, and at full resolution
+    only when explicitly requested (e.g. for zooming in).
+
+    Images around the current one are decoded in the background, in the direction of travel, so that moving to them
+    doesn't block the main loop (see `Prefetcher`). Decoded images are then kept in memory, within a budget, so that
+    going back to them doesn't require decoding them again (see `ImageCache`).
+    """
 
-    _current_image: Pixbuf
+    # The default memory budget of decoded images, in bytes
+    CACHE_BUDGET = 256 * 2 ** 20
+
+    _current_image: DecodedImage
+
+    def __init__(self, *args, prefetch: int = 2, cache_budget: int = CACHE_BUDGET, **kwargs):
+        """
+        Instantiate a new view, as `View` does.
+
+        :arg prefetch: how many images to decode ahead of the current one, none if 0
+        :arg cache_budget: how much memory decoded images can take, in bytes, none if 0
+        """
 
+        super().__init__(*args, **kwargs)
+        self._display_size: Optional[Tuple[int, int]] = None
+        self._image_cache = ImageCache(cache_budget, _image_size) if cache_budget > 0 else None
+        if prefetch > 0 or self._image_cache is not None:
+            self._prefetcher = Prefetcher(self._decode, GLib.idle_add, window=prefetch, cache=self._image_cache)
+        else:
+            self._prefetcher = None
+
+    def _decode(self, img: Path) -> DecodedImage:
+        return _decode(img, self._display_size)
+
+    def _load_image(self, forward: bool) -> None:
+        image = self._prefetcher.get(self._image_path) if self._prefetcher is not None else None
+        # Images may have been decoded while the display was smaller
+        if image is None or not image.fits(self._display_size):
+            image = self._decode(self._image_path)
+
+        self._current_image = image
+
+        if self._prefetcher is not None:
+            self._prefetcher.put(self._image_path, image)
+            # Look further ahead when there's a cache to favour the images in the direction of travel
+            ahead = self._prefetcher.window if self._image_cache is None else \
+                max(self._prefetcher.window, Prefetcher.FAVOURED_SPAN)
+            self._prefetcher.update(self._image_path, self.upcoming(ahead, forward), self.upcoming(1, not forward))
+
+    def _replace_image(self, image: DecodedImage) -> None:
+        self._current_image = image
+        if self._prefetcher is not None:
+            self._prefetcher.put(self._image_path, image)
+
+    @timed('GtkView.load_prev')
     def load_prev(self) -> None:
         super().load_prev()
-        self._current_image = Pixbuf.new_from_file(str(self._image_path))
+        self._load_image(forward=False)
 
+    @timed('GtkView.load_next')
     def load_next(self) -> None:
         super().load_next()
-        self._current_image = Pixbuf.new_from_file(str(self._image_path))
+        self._load_image(forward=True)
+
+    @timed('GtkView.load_image')
+    def load_image(self, img: Path) -> None:
+        super().load_image(img)
+        self._load_image(forward=True)
+
+    def close(self) -> None:
+        super().close()
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+
+    def cache_statistics(self) -> Optional[CacheStatistics]:
+        """Return the statistics of the decoded image cache, or None if there's no cache."""
+
+        return self._image_cache.statistics() if self._image_cache is not None else None
+
+    def set_display_size(self, width: int, height: int) -> None:
+        """
+        Set the size of the area images are displayed in, so that they are decoded no larger than that.
+
+        The current image is decoded again if it was decoded for a smaller area.
+
+        :raise GLib.Error: when the current image cannot be decoded again
+        """
+
+        self._display_size = (max(width, 1), max(height, 1))
+        if self.has_image_data() and not self._current_image.fits(self._display_size):
+            self._replace_image(self._decode(self._image_path))
 
     def has_image_data(self) -> bool:
         return hasattr(self, '_current_image')
 
-    def get_image_data(self) -> Optional[Pixbuf]:
+    def get_image_data(self, full_resolution: bool = False) -> Optional[Pixbuf]:
         """
-        Return the current image as a pixbuf copy.
+        Return the current image as a pixbuf, which is shared and must not be modified.
+
+        Unless requested at full resolution, the image is no larger than the display size, if one was set.
 
+        :param full_resolution: whether the image should be returned at full resolution, decoding it again if needed
         :return: a pixbuf containing the image, or None if no image has been loaded
+        :raise GLib.Error: when the image has to be decoded again and cannot be
         """
 
-        if self.has_image_data():
-            return self._current_image.copy()
-        else:
-            return None
\ No newline at end of file
+        if not self.has_image_data():
+            return None
+
+        if full_resolution and self._current_image.scaled:
+            self._replace_image(_decode(self._image_path))
+
+        return self._current_image.pixbuf
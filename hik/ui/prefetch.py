@@ -0,0 +1,229 @@
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Dict, Generic, Iterable, Optional, Set, TypeVar, Tuple
+
+from data.cache import CacheStatistics
+
+T = TypeVar('T')
+
+
+class ImageCache(Generic[T]):
+    """
+    A cache of decoded images within a memory budget, evicting the least recently used images first.
+
+    Some images can be favoured, such as those lying ahead in the direction of travel: they are evicted only when no
+    other image is left.
+
+    The cache is not thread-safe.
+    """
+
+    def __init__(self, budget: int, size_of: Callable[[T], int]):
+        """
+        Instantiate a new empty cache.
+
+        :param budget: the maximum amount of memory taken by cached images, in bytes
+        :param size_of: the function telling how much memory a decoded image takes
+        """
+
+        self._entries: OrderedDict[Path, Tuple[T, int]] = OrderedDict()
+        self._size_of = size_of
+        self._budget = budget
+        self._favoured: Set[Path] = set()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __contains__(self, img: Path) -> bool:
+        return img in self._entries
+
+    @property
+    def budget(self) -> int:
+        return self._budget
+
+    @budget.setter
+    def budget(self, budget: int) -> None:
+        self._budget = budget
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self._budget:
+            # Oldest first, favoured images last
+            victim = next((img for img in self._entries if img not in self._favoured), None)
+            if victim is None:
+                victim = next(iter(self._entries))
+
+            self._size -= self._entries.pop(victim)[1]
+            self._evictions += 1
+
+    def favour(self, imgs: Iterable[Path]) -> None:
+        """Set the images to be retained as long as possible, replacing the previous ones."""
+
+        self._favoured = set(imgs)
+
+    def get(self, img: Path) -> Optional[T]:
+        """Get a decoded image, or None if it is not cached."""
+
+        entry = self._entries.get(img)
+        if entry is None:
+            self._misses += 1
+            return None
+
+        self._entries.move_to_end(img)
+        self._hits += 1
+        return entry[0]
+
+    def pop(self, img: Path) -> Optional[T]:
+        """Take a decoded image out of the cache, if it is there."""
+
+        entry = self._entries.pop(img, None)
+        if entry is None:
+            self._misses += 1
+            return None
+
+        self._size -= entry[1]
+        self._hits += 1
+        return entry[0]
+
+    def put(self, img: Path, decoded: T) -> None:
+        """Add a decoded image to the cache, evicting others if the budget is exceeded."""
+
+        size = self._size_of(decoded)
+        previous = self._entries.pop(img, None)
+        if previous is not None:
+            self._size -= previous[1]
+
+        # Images exceeding the whole budget would only flush the cache
+        if size <= self._budget:
+            self._entries[img] = (decoded, size)
+            self._size += size
+            self._evict()
+
+    def statistics(self) -> CacheStatistics:
+        """Return the statistics of the cache since it was created."""
+
+        return CacheStatistics(self._hits, self._misses, self._evictions, len(self._entries), self._size)
+
+
+class Prefetcher(Generic[T]):
+    """
+    A decoder of images that works ahead of the user, around the current position of a view.
+
+    Images are decoded by worker threads. Decoded images are handed over through a scheduling function, which is
+    expected to run callbacks on the thread owning the prefetcher (for instance, `GLib.idle_add` for the GTK main
+    loop): apart from decoding, all the work happens on that thread, hence no locking is needed.
+
+    Only the images in the current window are retained. Images leaving the window are moved to the given image cache,
+    if any, where they are favoured as long as they lie ahead in the direction of travel, or discarded otherwise.
+    """
+
+    # How many images ahead in the direction of travel are favoured by the image cache
+    FAVOURED_SPAN = 32
+
+    def __init__(self, decode: Callable[[Path], T], schedule: Callable[..., object],
+                 executor: Optional[Executor] = None, window: int = 2, cache: Optional[ImageCache[T]] = None):
+        """
+        Instantiate a new prefetcher.
+
+        :param decode: the function decoding an image, called by worker threads
+        :param schedule: a function running the given callback, with the given arguments, on the owning thread
+        :param executor: the executor decoding images, a dedicated pool of two threads if not provided
+        :param window: how many images to decode ahead of the current one, in the direction of travel
+        :param cache: the cache retaining decoded images that left the window
+        """
+
+        self._decode = decode
+        self._schedule = schedule
+        self._owns_executor = executor is None
+        self._executor = executor if executor is not None else ThreadPoolExecutor(2, thread_name_prefix="ImageDecoder")
+        self.window = window
+        self.cache = cache
+
+        # Images being decoded and decoded images, as futures
+        self._pending: Dict[Path, Future] = {}
+        self._ready: Dict[Path, Future] = {}
+
+    def _deliver(self, img: Path, future: Future) -> bool:
+        # Move a decoded image among the ready ones, unless it went out of the window in the meantime
+        if self._pending.get(img) is future:
+            del self._pending[img]
+            self._ready[img] = future
+
+        # Don't run again
+        return False
+
+    def _submit(self, img: Path) -> None:
+        future = self._executor.submit(self._decode, img)
+        self._pending[img] = future
+        future.add_done_callback(lambda f: self._schedule(self._deliver, img, f))
+
+    def get(self, img: Path) -> Optional[T]:
+        """
+        Get a decoded image, waiting for it if it is being decoded.
+
+        :param img: the path of the image
+        :return: the decoded image, or None if it has not been prefetched
+        :raise Exception: whatever the decoding function raised
+        """
+
+        future = self._ready.get(img)
+        if future is None:
+            future = self._pending.get(img)
+            if future is None or future.cancelled():
+                return self.cache.get(img) if self.cache is not None else None
+
+        return future.result()
+
+    def put(self, img: Path, decoded: T) -> None:
+        """Retain an image that was decoded elsewhere, such as the current one."""
+
+        future = Future()
+        future.set_result(decoded)
+        self._pending.pop(img, None)
+        self._ready[img] = future
+
+    def update(self, current: Path, ahead: Iterable[Path], behind: Iterable[Path] = ()) -> None:
+        """
+        Move the window, starting the decoding of the images that entered it and discarding those that left it.
+
+        :param current: the current image, which is retained
+        :param ahead: the images following the current one in the direction of travel, nearest first; those beyond the
+                      window are favoured by the image cache
+        :param behind: the images preceding the current one, nearest first
+        """
+
+        ahead = list(islice(ahead, max(self.window, self.FAVOURED_SPAN)))
+        wanted = [current]
+        wanted.extend(ahead[:self.window])
+        wanted.extend(behind)
+
+        for img in set(self._pending.keys()) - set(wanted):
+            self._pending.pop(img).cancel()
+        for img in set(self._ready.keys()) - set(wanted):
+            future = self._ready.pop(img)
+            if self.cache is not None and future.exception() is None:
+                self.cache.put(img, future.result())
+
+        if self.cache is not None:
+            self.cache.favour(ahead)
+
+        for img in wanted:
+            if img not in self._pending and img not in self._ready:
+                if self.cache is not None and img in self.cache:
+                    self.put(img, self.cache.pop(img))
+                else:
+                    self._submit(img)
+
+    def close(self) -> None:
+        """Stop decoding and discard all images."""
+
+        for future in self._pending.values():
+            future.cancel()
+
+        self._pending.clear()
+        self._ready.clear()
+
+        if self._owns_executor:
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,212 @@
+from typing import Callable, Generic, List, NamedTuple, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+Size = Tuple[int, int]
+
+
+class Layout(NamedTuple):
+    """
+    Where an image goes on a display area.
+
+    scale - the scaling factor applied to the image
+    left - the horizontal offset of the visible part of the scaled image
+    top - the vertical offset of the visible part of the scaled image
+    width - the width of the visible part of the scaled image
+    height - the height of the visible part of the scaled image
+    """
+
+    scale: float
+    left: float
+    top: float
+    width: int
+    height: int
+
+
+class Viewport:
+    """
+    The part of an image shown on a display area, zoomed and panned by the user.
+
+    The zoom is relative to the scale at which the whole image fits the display area, and the position is the centre of
+    the visible part, relative to the size of the image: both stay meaningful when the image or the display area change
+    size, for instance when the image is decoded again at a different resolution.
+    """
+
+    # Images are magnified at most this much
+    MAX_SCALE = 8.0
+
+    def __init__(self):
+        self.zoom = 1.0
+        self.centre = (0.5, 0.5)
+
+    def reset(self) -> None:
+        """Go back to showing the whole image."""
+
+        self.zoom = 1.0
+        self.centre = (0.5, 0.5)
+
+    @staticmethod
+    def fit_scale(image: Size, display: Size) -> float:
+        """Return the scale at which the whole image fits the display area, which is never larger than 1."""
+
+        return min(display[0] / image[0], display[1] / image[1], 1.0)
+
+    def scale(self, image: Size, display: Size) -> float:
+        """Return the scale at which the image is displayed."""
+
+        return self.fit_scale(image, display) * self.zoom
+
+    @staticmethod
+    def _clamp(centre: float, scaled: float, display: int) -> float:
+        # Keep the display area covered by the image, or the image centred if it's smaller
+        if scaled <= display:
+            return 0.5
+
+        margin = display / 2 / scaled
+        return min(max(centre, margin), 1 - margin)
+
+    def _set_centre(self, x: float, y: float, image: Size, display: Size) -> None:
+        scale = self.scale(image, display)
+        self.centre = (self._clamp(x, image[0] * scale, display[0]), self._clamp(y, image[1] * scale, display[1]))
+
+    def layout(self, image: Size, display: Size) -> Layout:
+        """Compute where the image goes on the display area."""
+
+        scale = self.scale(image, display)
+        scaled_width, scaled_height = image[0] * scale, image[1] * scale
+        width, height = min(max(round(scaled_width), 1), display[0]), min(max(round(scaled_height), 1), display[1])
+        centre_x = self._clamp(self.centre[0], scaled_width, display[0])
+        centre_y = self._clamp(self.centre[1], scaled_height, display[1])
+
+        return Layout(scale, centre_x * scaled_width - width / 2, centre_y * scaled_height - height / 2, width, height)
+
+    def zoom_at(self, factor: float, point: Tuple[float, float], image: Size, display: Size) -> None:
+        """
+        Zoom in or out, keeping still the given point of the display area.
+
+        :param factor: how much to zoom in, zooming out if smaller than 1
+        :param point: the coordinates of the point on the display area
+        :param image: the size of the image
+        :param display: the size of the display area
+        """
+
+        layout = self.layout(image, display)
+        # The image is centred when it's smaller than the display area
+        offset_x, offset_y = (display[0] - layout.width) / 2, (display[1] - layout.height) / 2
+        x = (layout.left + point[0] - offset_x) / (image[0] * layout.scale)
+        y = (layout.top + point[1] - offset_y) / (image[1] * layout.scale)
+
+        fit = self.fit_scale(image, display)
+        self.zoom = min(max(self.zoom * factor, 1.0), max(self.MAX_SCALE / fit, 1.0))
+
+        scale = self.scale(image, display)
+        self._set_centre(x + (display[0] / 2 - point[0]) / (image[0] * scale),
+                         y + (display[1] / 2 - point[1]) / (image[1] * scale), image, display)
+
+    def pan(self, dx: float, dy: float, image: Size, display: Size) -> None:
+        """Move the image by the given distance on the display area."""
+
+        scale = self.scale(image, display)
+        self._set_centre(self.centre[0] - dx / (image[0] * scale), self.centre[1] - dy / (image[1] * scale),
+                         image, display)
+
+
+class MipmapPyramid(Generic[T]):
+    """
+    An image together with copies of it at halved resolutions, built when first needed.
+
+    Rendering from the smallest copy that is still at least as large as needed is cheaper than scaling the original, and
+    keeps quality when scaling by large factors.
+    """
+
+    # Copies are not made smaller than this, in either dimension
+    MIN_SIZE = 64
+
+    def __init__(self, base: T, size: Callable[[T], Size], downscale: Callable[[T, int, int], T]):
+        """
+        Instantiate a pyramid over an image.
+
+        :param base: the image at the bottom of the pyramid
+        :param size: the function telling the width and height of an image
+        :param downscale: the function scaling an image down to the given width and height
+        """
+
+        self._size = size
+        self._downscale = downscale
+        self._base_width = size(base)[0]
+        # Copies of the image, together with their scaling factor relative to the original
+        self._levels: List[Tuple[T, float]] = [(base, 1.0)]
+
+    @property
+    def base(self) -> T:
+        return self._levels[0][0]
+
+    def level(self, scale: float) -> Tuple[T, float]:
+        """
+        Return the smallest copy of the image from which it can be scaled without being magnified.
+
+        :param scale: the scaling factor to apply to the original image
+        :return: the copy and its scaling factor relative to the original image
+        """
+
+        depth = 0
+        while True:
+            image, factor = self._levels[depth]
+            width, height = self._size(image)
+            if width // 2 < self.MIN_SIZE or height // 2 < self.MIN_SIZE or (width // 2) / self._base_width < scale:
+                return image, factor
+
+            if depth + 1 == len(self._levels):
+                self._levels.append((self._downscale(image, width // 2, height // 2), (width // 2) / self._base_width))
+
+            depth += 1
+
+
+class Debouncer:
+    """
+    A function call that is delayed until calls stop coming for a while, coalescing bursts of calls into a single one.
+
+    Calls are delayed through a scheduling function, which is expected to run callbacks on the calling thread after a
+    delay (for instance, `GLib.timeout_add` for the GTK main loop).
+    """
+
+    def __init__(self, callback: Callable[[], object], delay: int,
+                 schedule: Callable[[int, Callable[[], bool]], int], cancel: Callable[[int], object]):
+        """
+        Instantiate a new debouncer.
+
+        :param callback: the function to be called
+        :param delay: how long to wait after the last call, in milliseconds
+        :param schedule: a function running the given callback after the given delay, returning a handle
+        :param cancel: a function cancelling a scheduled callback, given its handle
+        """
+
+        self._callback = callback
+        self._delay = delay
+        self._schedule = schedule
+        self._cancel = cancel
+        self._handle: Optional[int] = None
+
+    def _fire(self) -> bool:
+        self._handle = None
+        self._callback()
+
+        # Don't run again
+        return False
+
+    def __call__(self, *args) -> None:
+        """Schedule the call, postponing any pending one. Arguments are ignored, so that it can handle signals."""
+
+        self.cancel()
+        self._handle = self._schedule(self._delay, self._fire)
+
+    @property
+    def pending(self) -> bool:
+        return self._handle is not None
+
+    def cancel(self) -> None:
+        """Drop the pending call, if any."""
+
+        if self._handle is not None:
+            self._cancel(self._handle)
+            self._handle = None
@@ -0,0 +1,235 @@
+import hashlib
+import multiprocessing
+import os
+import struct
+import zlib
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Set
+
+# The size of the thumbnails of each flavour, as defined by the freedesktop.org thumbnail specification
+THUMBNAIL_SIZES = {'normal': 128, 'large': 256, 'x-large': 512, 'xx-large': 1024}
+
+# The function generating a thumbnail, given the image, the destination, the URI and modification time of the image
+# to be recorded into the thumbnail, and the maximum size of the thumbnail
+Generator = Callable[[Path, Path, str, int, int], None]
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def default_thumbnail_directory() -> Path:
+    """Return the directory where thumbnails are shared among applications, as defined by the XDG specifications."""
+
+    cache = os.environ.get('XDG_CACHE_HOME')
+    return (Path(cache) if cache else Path.home() / '.cache') / 'thumbnails'
+
+
+def image_uri(img: Path) -> str:
+    """Return the URI that identifies an image within thumbnail caches."""
+
+    return Path(os.path.abspath(img)).as_uri()
+
+
+def read_png_text(png_file: Path) -> Dict[str, str]:
+    """
+    Read the textual information stored in a PNG file, without decoding the image.
+
+    :param png_file: the path of the PNG file
+    :return: the text entries found before the image data, by keyword
+    :raise OSError: when the file cannot be read
+    :raise ValueError: when the file is not a valid PNG file
+    """
+
+    text = {}
+    with png_file.open('rb') as png:
+        if png.read(len(_PNG_SIGNATURE)) != _PNG_SIGNATURE:
+            raise ValueError("Not a PNG file: {}".format(png_file))
+
+        while True:
+            header = png.read(8)
+            if len(header) < 8:
+                raise ValueError("Truncated PNG file: {}".format(png_file))
+
+            length, chunk_type = struct.unpack('>I4s', header)
+            # Text that matters comes before the image data
+            if chunk_type in (b'IDAT', b'IEND'):
+                return text
+
+            data = png.read(length)
+            png.seek(4, os.SEEK_CUR)
+
+            try:
+                if chunk_type == b'tEXt':
+                    keyword, value = data.split(b'\0', 1)
+                    text[keyword.decode('latin-1')] = value.decode('latin-1')
+                elif chunk_type == b'iTXt':
+                    # Compression flag and method, then language and translated keyword precede the text
+                    keyword, rest = data.split(b'\0', 1)
+                    compressed = rest[0]
+                    _, _, value = rest[2:].split(b'\0', 2)
+                    text[keyword.decode('latin-1')] = (zlib.decompress(value) if compressed else value).decode('utf-8')
+            except (ValueError, IndexError, zlib.error):
+                raise ValueError("Invalid text in PNG file: {}".format(png_file))
+
+
+class ThumbnailCache:
+    """
+    A cache of thumbnails compatible with the freedesktop.org thumbnail specification, shared with other applications.
+
+    Thumbnails are PNG files named after the MD5 hash of the URI of their image, recording the URI and modification
+    time of the image they were made from: they are valid as long as the image is not modified.
+    """
+
+    def __init__(self, directory: Optional[Path] = None, flavour: str = 'normal'):
+        """
+        Open a thumbnail cache.
+
+        :param directory: the root of the cache, the shared one if not specified (see `default_thumbnail_directory()`)
+        :param flavour: the size of the thumbnails (see `THUMBNAIL_SIZES`)
+        :raise ValueError: when the flavour is unknown
+        """
+
+        if flavour not in THUMBNAIL_SIZES:
+            raise ValueError("Unknown thumbnail flavour: {}".format(flavour))
+
+        self.directory = directory if directory is not None else default_thumbnail_directory()
+        self.flavour = flavour
+        self.size = THUMBNAIL_SIZES[flavour]
+
+    def path(self, uri: str) -> Path:
+        """Return where the thumbnail of the image with the given URI goes."""
+
+        return self.directory / self.flavour / (hashlib.md5(uri.encode('utf-8')).hexdigest() + '.png')
+
+    def lookup(self, img: Path) -> Optional[Path]:
+        """
+        Look up the thumbnail of an image.
+
+        :param img: the path of the image
+        :return: the path of the thumbnail, or None if there's none or it is outdated
+        """
+
+        uri = image_uri(img)
+        thumbnail = self.path(uri)
+
+        try:
+            mtime = int(img.stat().st_mtime)
+            text = read_png_text(thumbnail)
+        except (OSError, ValueError):
+            return None
+
+        if text.get('Thumb::URI') != uri or text.get('Thumb::MTime') != str(mtime):
+            return None
+
+        return thumbnail
+
+
+def _create_thumbnail(generate: Generator, img: Path, destination: Path, size: int) -> Path:
+    # Module-level, so that thumbnails can be created by process pools
+    mtime = int(img.stat().st_mtime)
+    destination.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+    # Thumbnails are written under a temporary name and then renamed, so that no one reads incomplete thumbnails
+    temporary = destination.with_name("{}.{}.tmp".format(destination.name, os.getpid()))
+    try:
+        generate(img, temporary, image_uri(img), mtime, size)
+        os.chmod(temporary, 0o600)
+        os.replace(temporary, destination)
+    finally:
+        if temporary.exists():
+            temporary.unlink()
+
+    return destination
+
+
+class ThumbnailLoader:
+    """
+    A provider of thumbnails, generating the missing ones in the background.
+
+    Thumbnails are generated by worker processes, and handed over through a scheduling function, which is expected to
+    run callbacks on the thread owning the loader (for instance, `GLib.idle_add` for the GTK main loop).
+    """
+
+    def __init__(self, cache: ThumbnailCache, generate: Generator, schedule: Callable[..., object],
+                 executor: Optional[Executor] = None):
+        """
+        Instantiate a new loader.
+
+        :param cache: the cache where thumbnails are looked up and stored
+        :param generate: the function generating a thumbnail, which must be defined at module level
+        :param schedule: a function running the given callback, with the given arguments, on the owning thread
+        :param executor: the executor generating thumbnails, a dedicated process pool if not provided, whose workers
+                         are started from a fresh server process rather than forked from the threads of the caller
+        """
+
+        self.cache = cache
+        self._generate = generate
+        self._schedule = schedule
+        self._owns_executor = executor is None
+        self._executor = executor if executor is not None \
+            else ProcessPoolExecutor(mp_context=multiprocessing.get_context('forkserver'))
+
+        self._pending: Dict[Path, Future] = {}
+        self._callbacks: Dict[Path, Callable[[Path, Optional[Path]], object]] = {}
+        # Images whose thumbnail couldn't be generated, which aren't tried again
+        self._failed: Set[Path] = set()
+
+    def _deliver(self, img: Path, future: Future) -> bool:
+        if self._pending.get(img) is future:
+            del self._pending[img]
+            callback = self._callbacks.pop(img)
+
+            try:
+                thumbnail = future.result()
+            except Exception:
+                self._failed.add(img)
+                thumbnail = None
+
+            callback(img, thumbnail)
+
+        # Don't run again
+        return False
+
+    def request(self, img: Path, callback: Callable[[Path, Optional[Path]], object]) -> Optional[Path]:
+        """
+        Get the thumbnail of an image, generating it if it's missing or outdated.
+
+        :param img: the path of the image
+        :param callback: the function called with the image and the path of its thumbnail, or None if it couldn't be
+                         generated, once the thumbnail has been generated
+        :return: the path of the thumbnail, or None if it has to be generated or cannot be
+        """
+
+        thumbnail = self.cache.lookup(img)
+        if thumbnail is not None or img in self._failed:
+            return thumbnail
+
+        self._callbacks[img] = callback
+        if img not in self._pending:
+            future = self._executor.submit(_create_thumbnail, self._generate, img,
+                                           self.cache.path(image_uri(img)), self.cache.size)
+            self._pending[img] = future
+            future.add_done_callback(lambda f: self._schedule(self._deliver, img, f))
+
+        return None
+
+    def retain(self, imgs: Iterable[Path]) -> None:
+        """Give up generating the thumbnails of all images but the given ones, unless already under way."""
+
+        imgs = set(imgs)
+        for img in set(self._pending.keys()) - imgs:
+            if self._pending[img].cancel():
+                del self._pending[img]
+                del self._callbacks[img]
+
+    def close(self) -> None:
+        """Stop generating thumbnails."""
+
+        for future in self._pending.values():
+            future.cancel()
+
+        self._pending.clear()
+        self._callbacks.clear()
+
+        if self._owns_executor:
+            self._executor.shutdown(wait=False)
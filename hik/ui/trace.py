@@ -0,0 +1,47 @@
+import os
+import sys
+from time import perf_counter
+from typing import List, Optional, TextIO, Tuple
+
+# The environment variable enabling startup traces
+TRACE_VARIABLE = 'HIMAKURA_TRACE_STARTUP'
+
+
+class StartupTrace:
+    """
+    A trace of the phases of application startup, for spotting regressions.
+
+    Each phase lasts from the end of the previous one, or from the start of the trace, until it is marked.
+    """
+
+    def __init__(self, start: Optional[float] = None, output: TextIO = sys.stderr):
+        """
+        Start a new trace.
+
+        :param start: when startup began, as returned by `time.perf_counter()`, now if not given
+        :param output: the stream the trace is reported to
+        """
+
+        self.start = start if start is not None else perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self._output = output
+        self._last = self.start
+
+    @classmethod
+    def from_environment(cls, start: Optional[float] = None) -> Optional['StartupTrace']:
+        """Start a new trace if enabled through the `TRACE_VARIABLE` environment variable, otherwise return None."""
+
+        return cls(start) if os.environ.get(TRACE_VARIABLE) else None
+
+    def mark(self, phase: str) -> None:
+        """Record the end of a phase."""
+
+        now = perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self) -> None:
+        """Write the duration of each phase, and of the whole startup, to the output."""
+
+        print("startup: " + ", ".join("{} {:.1f} ms".format(phase, duration * 1000) for phase, duration in self.phases)
+              + ", total {:.1f} ms".format((self._last - self.start) * 1000), file=self._output)
@@ -1,26 +1,17 @@
-import stringprep
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import Executor
 from pathlib import Path
-from typing import Optional, Iterable
+from typing import Optional, Iterable, List
 from uuid import UUID
 from uri import URI
 
 from data.common import ImageMetadata
-from data.filexp import Carousel, write_meta, load_meta
+from data.filexp import Carousel, LiveCarousel, StreamingCarousel
 from data.filtering import FilterBuilder
-
-
-def remove_control_and_redundant_space(s: str) -> str:
-    """Substitute multiple concatenated control and space characters into single whitespace."""
-
-    res = ''
-    for ch in s:
-        # Convert Unicode control and space characters into simple whitespaces
-        ss = ch if not stringprep.in_table_c11_c12(ch) and not stringprep.in_table_c21_c22(ch) else ' '
-        res += ss
-
-    # Remove redundant spaces
-    return ' '.join(res.split())
+from data.index import MetadataIndex
+from data.normalise import normalise, normalise_list
+from data.storage import MetadataStore, SidecarStore
+from data.writeback import WriteBehindQueue
 
 
 class View(metaclass=ABCMeta):
@@ -44,7 +35,10 @@ class View(metaclass=ABCMeta):
     characters: Optional[Iterable[str]]
     tags: Optional[Iterable[str]]
 
-    def __init__(self, context_dir: Path, filter_factory: Optional[FilterBuilder] = None):
+    def __init__(self, context_dir: Path, filter_factory: Optional[FilterBuilder] = None,
+                 index: Optional[MetadataIndex] = None, executor: Optional[Executor] = None, streaming: bool = False,
+                 max_depth: Optional[int] = 0, exclude: Iterable[str] = (), live: bool = False,
+                 store: Optional[MetadataStore] = None, writer: Optional[WriteBehindQueue] = None):
         """
         Instantiate a new view over the image/metadata file pairs at the specified path.
 
@@ -52,19 +46,57 @@ class View(metaclass=ABCMeta):
         Therefore, before attempting to retrieve any data, call the `load_next()` method.
 
         Optionally, a `FilterBuilder` can be provided as a second argument, which will be used for obtaining image
-        filters.
+        filters. If a metadata index is also provided, filters are evaluated on the metadata it serves. If an executor
+        is provided, metadata files are loaded concurrently through it.
+
+        A streaming view discovers images in the background while it is being used, instead of scanning the whole
+        directory beforehand (see `StreamingCarousel`).
+
+        Subdirectories are also explored up to the given depth, skipping paths matched by the exclusion patterns.
+
+        A live view is a streaming view that also follows the changes to the directory, which are applied by calling
+        `sync()` (see `LiveCarousel`). Live views cannot explore subdirectories.
+
+        Metadata is read from and written to the given metadata store, or to metadata files paired with images if none
+        is provided (see `data.storage`). If a write-behind queue over the same store is provided, metadata is written
+        through it, in the background.
 
         :arg context_dir: path to the directory under which all operations will be performed
         :arg filter_factory: a filter builder providing filters for the new view
+        :arg index: a metadata index speeding up filtering
+        :arg executor: an executor used for loading metadata files while filtering
+        :arg streaming: whether images should be discovered in the background
+        :arg max_depth: how many levels of subdirectories to explore, or None for no limit
+        :arg exclude: glob patterns matching the paths of images and directories to be skipped
+        :arg live: whether the view should follow the changes to the directory
+        :arg store: the store holding the metadata of the images
+        :arg writer: the queue metadata is written through
         :raise FileNotFoundError: when the path points to an invalid location
         :raise NotADirectoryException: when the path point to a file that is not a directory
+        :raise ValueError: when a live view is requested to explore subdirectories
         """
 
-        # If given a filter provider, use it to generate a set of filters and apply them on the carousel
-        if filter_factory is not None:
-            self._carousel = Carousel(context_dir, filter_factory.get_all_filters())
+        self._store = store if store is not None else SidecarStore()
+        self._writer = writer
+
+        # If given a filter provider, let the carousel apply its constraints
+        filters = filter_factory if filter_factory is not None else ()
+        if live:
+            if max_depth != 0:
+                raise ValueError("Live views cannot explore subdirectories.")
+
+            self._carousel = LiveCarousel(context_dir, filters, index, executor, exclude, background=True,
+                                          store=self._store)
+        elif streaming:
+            self._carousel = StreamingCarousel(context_dir, filters, index, executor, max_depth, exclude,
+                                               background=True, store=self._store)
         else:
-            self._carousel = Carousel(context_dir)
+            self._carousel = Carousel(context_dir, filters, index, executor, max_depth, exclude, self._store)
+
+    def _load_meta(self, img: Path) -> ImageMetadata:
+        # Updates that haven't been written yet are the most recent metadata
+        pending = self._writer.pending(img) if self._writer is not None else None
+        return pending if pending is not None else self._store.load(img)
 
     def _update_meta(self, meta: ImageMetadata) -> None:
         self._id = meta.img_id
@@ -85,10 +117,15 @@ class View(metaclass=ABCMeta):
 
         return self._carousel.has_prev()
 
-    def has_next(self) -> bool:
-        """Check whether there is a next image."""
+    def has_next(self, wait: bool = True) -> Optional[bool]:
+        """
+        Check whether there is a next image.
+
+        If the view is streaming and the next image has not been discovered yet, either wait for it or, when `wait` is
+        `False`, return `None`.
+        """
 
-        return self._carousel.has_next()
+        return self._carousel.has_next(wait)
 
     def load_prev(self) -> None:
         """
@@ -98,7 +135,7 @@ class View(metaclass=ABCMeta):
         """
 
         self._image_path = self._carousel.prev()
-        self._update_meta(load_meta(self._image_path))
+        self._update_meta(self._load_meta(self._image_path))
 
     def load_next(self) -> None:
         """Retrieve the next image and its metadata.
@@ -107,7 +144,67 @@ class View(metaclass=ABCMeta):
         """
 
         self._image_path = self._carousel.next()
-        self._update_meta(load_meta(self._image_path))
+        self._update_meta(self._load_meta(self._image_path))
+
+    def load_image(self, img: Path) -> None:
+        """
+        Move to the given image and retrieve its metadata.
+
+        :raise ValueError: when the image is not part of the view
+        """
+
+        self._image_path = self._carousel.seek(img)
+        self._update_meta(self._load_meta(self._image_path))
+
+    def images(self) -> List[Path]:
+        """Return the images in the view, as far as they are already known, in order."""
+
+        return self._carousel.images()
+
+    def upcoming(self, count: int, forward: bool = True) -> List[Path]:
+        """
+        Return the images that come after the current one, or before it, as far as they are already known.
+
+        :param count: the maximum number of images to be returned
+        :param forward: whether to look at the following images, rather than the preceding ones
+        :return: the paths of the images, nearest first
+        """
+
+        images = []
+        for distance in range(1, count + 1):
+            img = self._carousel.peek(distance if forward else -distance)
+            if img is None:
+                break
+
+            images.append(img)
+
+        return images
+
+    @property
+    def live(self) -> bool:
+        """Tell whether the view follows the changes to its directory."""
+
+        return isinstance(self._carousel, LiveCarousel)
+
+    def watch_fileno(self) -> Optional[int]:
+        """Return a file descriptor that becomes readable when changes to a live view are pending, if there's one."""
+
+        return self._carousel.fileno() if self.live else None
+
+    def sync(self) -> bool:
+        """
+        Apply pending changes to a live view.
+
+        :return: whether images were added or removed
+        :raise OSError: when the directory cannot be examined anymore
+        """
+
+        return self._carousel.sync() if self.live else False
+
+    def close(self) -> None:
+        """Stop any activity related to this view."""
+
+        self._carousel.close()
 
     @property
     def image_id(self) -> UUID:
@@ -127,7 +224,7 @@ class View(metaclass=ABCMeta):
         if len(author) == 0:
             author = None
         else:
-            author = remove_control_and_redundant_space(author)
+            author = normalise(author)
 
         self.author = author
 
@@ -138,7 +235,7 @@ class View(metaclass=ABCMeta):
         if len(universe) == 0:
             universe = None
         else:
-            universe = remove_control_and_redundant_space(universe)
+            universe = normalise(universe)
 
         self.universe = universe
 
@@ -151,9 +248,7 @@ class View(metaclass=ABCMeta):
         if len(characters) == 0:
             new_chars = None
         else:
-            new_chars = remove_control_and_redundant_space(characters)
-            new_chars = new_chars.split(',')
-            new_chars = [c.strip() for c in new_chars]
+            new_chars = normalise_list(characters)
 
         self.characters = new_chars
 
@@ -171,9 +266,7 @@ class View(metaclass=ABCMeta):
         if len(tags) == 0:
             new_tags = None
         else:
-            new_tags = remove_control_and_redundant_space(tags)
-            new_tags = new_tags.split(',')
-            new_tags = [t.strip() for t in new_tags]
+            new_tags = normalise_list(tags)
 
         self.tags = new_tags
 
@@ -189,7 +282,9 @@ class View(metaclass=ABCMeta):
         """
         Persist the updated metadata.
 
-        :raise OSError: when the metadata file couldn't be opened
+        With a write-behind queue, the metadata is only queued, and errors are reported by the queue.
+
+        :raise OSError: when the metadata couldn't be written
         """
 
         meta_obj = ImageMetadata(self._id,
@@ -198,4 +293,8 @@ class View(metaclass=ABCMeta):
                                  self.universe,
                                  self.characters,
                                  self.tags)
-        write_meta(meta_obj, self._image_path)
+        if self._writer is not None:
+            self._writer.submit(meta_obj, self._image_path)
+        else:
+            self._store.write(meta_obj, self._image_path)
+            self._store.sync([self._image_path])
@@ -0,0 +1,60 @@
+"""
+The reference implementation of the metadata reader and writer of `data.xmngr`, going through ElementTree.
+
+The specialized reader and writer are checked against it by the tests, and compared with it by `benchmarks.bench_xml`.
+"""
+
+import xml.etree.ElementTree as ElTree
+from uuid import UUID
+
+from uri import URI
+
+from data.common import ImageMetadata
+
+
+def generate_xml_etree(metadata: ImageMetadata) -> str:
+    """Generate the XML document of image metadata, building it through ElementTree."""
+
+    new_xml_root = ElTree.Element('image', {'id': str(metadata.img_id), 'file': str(metadata.file)})
+
+    if metadata.author is not None:
+        ElTree.SubElement(new_xml_root, 'author').text = metadata.author
+
+    if metadata.universe is not None:
+        ElTree.SubElement(new_xml_root, 'universe').text = metadata.universe
+
+    if metadata.characters is not None:
+        section = ElTree.SubElement(new_xml_root, 'characters')
+        for char in metadata.characters:
+            ElTree.SubElement(section, 'character').text = char
+
+    if metadata.tags is not None:
+        section = ElTree.SubElement(new_xml_root, 'tags')
+        for tag in metadata.tags:
+            ElTree.SubElement(section, 'tag').text = tag
+
+    return ElTree.tostring(new_xml_root, encoding="unicode")
+
+
+def parse_xml_etree(data: str) -> ImageMetadata:
+    """Parse an XML document containing image metadata, building the whole element tree."""
+
+    image_elem = ElTree.fromstring(data)
+    img_id = image_elem.get('id')
+    file = image_elem.get('file')
+
+    # If we were presented with a legacy XML not containing 'file', use the legacy name 'filename'
+    if file is None:
+        file = image_elem.get('filename')
+
+    author = image_elem.find("./author")
+    universe = image_elem.find("./universe")
+    characters = [char.text for char in image_elem.findall("./characters/character")]
+    tags = [tag.text for tag in image_elem.findall("./tags/tag")]
+
+    return ImageMetadata(img_id=UUID(img_id),
+                         file=URI(file),
+                         author=author.text if author is not None else None,
+                         universe=universe.text if universe is not None else None,
+                         characters=characters if len(characters) != 0 else None,
+                         tags=tags if len(tags) != 0 else None)
@@ -0,0 +1,167 @@
+import io
+import unittest as ut
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stderr
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from uuid import uuid4
+
+from uri import URI
+
+from cli import main
+from data.bulk import Edit, Operation, apply_edits, bulk_edit, check_edit
+from data.common import ImageMetadata
+from data.filexp import load_meta, write_meta
+from data.filtering import FilterBuilder
+from data.normalise import TagVocabulary
+
+
+class TestEdits(ut.TestCase):
+    def setUp(self) -> None:
+        self.meta = ImageMetadata(uuid4(), URI(Path("/tmp/x.png")), "author", None, ["a", "b"], ["x", "y", "z"])
+
+    def test_single_valued(self):
+        self.assertIs(self.meta, apply_edits(self.meta, [Edit(Operation.ADD, 'author', ("other",))]))
+        self.assertEqual("u", apply_edits(self.meta, [Edit(Operation.ADD, 'universe', ("u",))]).universe)
+
+        self.assertIs(self.meta, apply_edits(self.meta, [Edit(Operation.REMOVE, 'author', ("other",))]))
+        self.assertIsNone(apply_edits(self.meta, [Edit(Operation.REMOVE, 'author', ("author",))]).author)
+        self.assertIsNone(apply_edits(self.meta, [Edit(Operation.REMOVE, 'author')]).author)
+
+        self.assertEqual("new", apply_edits(self.meta, [Edit(Operation.REPLACE, 'author', ("author",), "new")]).author)
+        self.assertEqual("new", apply_edits(self.meta, [Edit(Operation.REPLACE, 'universe', (), "new")]).universe)
+        self.assertIs(self.meta, apply_edits(self.meta, [Edit(Operation.REPLACE, 'universe', ("other",), "new")]))
+
+    def test_multi_valued(self):
+        self.assertEqual(["x", "y", "z", "w"],
+                         apply_edits(self.meta, [Edit(Operation.ADD, 'tags', ("x", "w", "w"))]).tags)
+        self.assertIs(self.meta, apply_edits(self.meta, [Edit(Operation.ADD, 'tags', ("z",))]))
+
+        self.assertEqual(["b"], apply_edits(self.meta, [Edit(Operation.REMOVE, 'characters', ("a", "c"))]).characters)
+        # Properties without values are missing
+        self.assertIsNone(apply_edits(self.meta, [Edit(Operation.REMOVE, 'characters')]).characters)
+        self.assertIsNone(apply_edits(self.meta, [Edit(Operation.REMOVE, 'tags', ("x", "y", "z"))]).tags)
+
+        self.assertEqual(["z", "y"], apply_edits(self.meta, [Edit(Operation.REPLACE, 'tags', ("x",), "z")]).tags)
+        self.assertEqual(["x", "z"], apply_edits(self.meta, [Edit(Operation.REPLACE, 'tags', ("y",))]).tags)
+        self.assertEqual(["w"], apply_edits(self.meta, [Edit(Operation.REPLACE, 'tags', (), "w")]).tags)
+
+        # Edits are applied in order
+        edited = apply_edits(self.meta, [Edit(Operation.ADD, 'tags', ("w",)), Edit(Operation.REMOVE, 'tags', ("w",))])
+        self.assertIs(self.meta, edited)
+
+    def test_check(self):
+        check_edit(Edit(Operation.ADD, 'tags', ("a", "b")))
+        self.assertRaises(ValueError, check_edit, Edit(Operation.ADD, 'img_id', ("a",)))
+        self.assertRaises(ValueError, check_edit, Edit(Operation.ADD, 'tags'))
+        self.assertRaises(ValueError, check_edit, Edit(Operation.ADD, 'author', ("a", "b")))
+
+    def test_vocabulary(self):
+        # Tags are compared through the vocabulary, so that aliases match each other
+        vocabulary = TagVocabulary({"black and white": ["monochrome", "B&W"]})
+        meta = self.meta._replace(tags=["x", "B&W"])
+
+        self.assertIs(meta, apply_edits(meta, [Edit(Operation.ADD, 'tags', ("black and white",))], vocabulary))
+        self.assertEqual(["x"], apply_edits(meta, [Edit(Operation.REMOVE, 'tags', ("black and white",))],
+                                            vocabulary).tags)
+        self.assertEqual(["x", "y"], apply_edits(meta, [Edit(Operation.REPLACE, 'tags', ("monochrome",), "y")],
+                                                 vocabulary).tags)
+        self.assertEqual(["black and white"], apply_edits(meta, [Edit(Operation.REPLACE, 'tags', ("x",),
+                                                                      "black and white")], vocabulary).tags)
+        self.assertEqual(["x", "B&W", "monochrome"],
+                         apply_edits(meta, [Edit(Operation.ADD, 'tags', ("monochrome",))]).tags)
+
+
+class TestBulkEdit(ut.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = TemporaryDirectory()
+        self.test_path = Path(self.test_dir.name)
+
+        self.images = []
+        for n in range(0, 12):
+            img_path = self.test_path / "{:02}.png".format(n)
+            img_path.touch()
+            self.images.append(img_path)
+            # Leave some images without metadata
+            if n % 4 != 0:
+                write_meta(ImageMetadata(uuid4(), URI(img_path), str(n % 2), None, None,
+                                         ["a", "b"] if n % 3 else ["a"]), img_path)
+
+    def tearDown(self) -> None:
+        self.test_dir.cleanup()
+
+    def test_dry_run(self):
+        before = [load_meta(img) for img in self.images]
+        result = bulk_edit(self.test_path, FilterBuilder().author_constraint("1"),
+                           [Edit(Operation.ADD, 'tags', ("b",))], dry_run=True)
+
+        self.assertEqual(6, result.selected)
+        self.assertCountEqual([self.images[3], self.images[9]], result.changed)
+        self.assertEqual(before, [load_meta(img) for img in self.images])
+
+    def test_edit(self):
+        edits = [Edit(Operation.REPLACE, 'tags', ("b",), "c"), Edit(Operation.ADD, 'universe', ("u",))]
+        expected = [img for img in self.images if load_meta(img).tags is not None and "b" in load_meta(img).tags]
+
+        with ThreadPoolExecutor(3) as executor:
+            result = bulk_edit(self.test_path, FilterBuilder().tag_constraint("b"), edits, executor=executor, window=2)
+
+        self.assertEqual(len(expected), result.selected)
+        self.assertCountEqual(expected, result.changed)
+        self.assertEqual([], result.failed)
+        for img in expected:
+            self.assertEqual((["a", "c"], "u"), (load_meta(img).tags, load_meta(img).universe))
+
+        # Nothing changes the second time around
+        result = bulk_edit(self.test_path, FilterBuilder().tag_constraint("c"), edits)
+        self.assertEqual((len(expected), []), (result.selected, result.changed))
+
+    def test_failure(self):
+        # Metadata cannot replace a non-empty directory
+        blocked = self.test_path / "01.xml"
+        blocked.unlink()
+        blocked.mkdir()
+        (blocked / "x").touch()
+
+        result = bulk_edit(self.test_path, FilterBuilder().filename_constraint("01.png"),
+                           [Edit(Operation.ADD, 'tags', ("new",))])
+        self.assertEqual([], result.changed)
+        self.assertEqual([self.images[1]], [img for img, _ in result.failed])
+
+    def test_cli(self):
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            status = main(['edit', str(self.test_path), '--where', 'author=1', '--where-not', 'tag=b',
+                           '--add', 'tag', 'c', '--set', 'author', '2'])
+
+        self.assertEqual(0, status)
+        self.assertIn("2 images selected, 2 changed", stderr.getvalue())
+        for img in self.images[3::6]:
+            self.assertEqual(("2", ["a", "c"]), (load_meta(img).author, load_meta(img).tags))
+
+        # Missing properties are matched by constraints without a value
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            status = main(['edit', str(self.test_path), '--dry-run', '--where', 'author=', '--add', 'author', 'x'])
+        self.assertEqual(0, status)
+        self.assertIn("3 images selected, 3 to be changed", stderr.getvalue())
+        self.assertIsNone(load_meta(self.images[0]).author)
+
+    def test_cli_vocabulary(self):
+        vocabulary = self.test_path / "vocabulary.txt"
+        vocabulary.write_text("black and white, monochrome, b&w\n")
+        meta = load_meta(self.images[1])
+        write_meta(meta._replace(tags=["a", "B&W"]), self.images[1])
+
+        for edit, tags in ((['--add', 'tag', 'monochrome'], ["a", "B&W"]), (['--remove', 'tag', 'monochrome'], ["a"])):
+            stderr = io.StringIO()
+            with redirect_stderr(stderr):
+                status = main(['edit', str(self.test_path), '--vocabulary', str(vocabulary), '--where',
+                               'tag=monochrome', *edit])
+
+            self.assertEqual(0, status)
+            self.assertEqual(tags, load_meta(self.images[1]).tags)
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,96 @@
+import os
+import unittest as ut
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+from uuid import uuid4
+
+from uri import URI
+
+from data.cache import CACHE_SIZE_VARIABLE, DEFAULT_CACHE_SIZE, MetadataCache, _cache_size, metadata_cache
+from data.common import ImageMetadata
+from data.filexp import load_meta, write_meta
+from data.xmngr import parse_xml
+
+
+class TestMetadataCache(ut.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = TemporaryDirectory()
+        self.test_path = Path(self.test_dir.name)
+
+        self.files = []
+        for n in range(0, 4):
+            meta_file = self.test_path / "{}.xml".format(n)
+            meta_file.write_text("x" * (n + 1))
+            self.files.append(meta_file)
+
+        self.meta = ImageMetadata(uuid4(), URI("a.png"), None, None, None, None)
+
+    def tearDown(self) -> None:
+        self.test_dir.cleanup()
+
+    def test_validation(self):
+        cache = MetadataCache()
+        stat = os.stat(self.files[0])
+
+        self.assertIsNone(cache.get(self.files[0], stat))
+        cache.put(self.files[0], stat, self.meta)
+        self.assertIs(self.meta, cache.get(self.files[0], stat))
+
+        # A different size or modification time means a different file
+        self.files[0].write_text("yy")
+        self.assertIsNone(cache.get(self.files[0], os.stat(self.files[0])))
+        os.utime(self.files[0], ns=(0, 0))
+        self.assertIsNone(cache.get(self.files[0], os.stat(self.files[0])))
+
+        self.assertEqual((1, 3, 0, 1, 1), cache.statistics())
+
+    def test_eviction(self):
+        cache = MetadataCache(max_entries=2)
+        for meta_file in self.files[:3]:
+            cache.put(meta_file, os.stat(meta_file), self.meta)
+
+        # The least recently used entry goes first
+        self.assertIsNone(cache.get(self.files[0], os.stat(self.files[0])))
+        self.assertIsNotNone(cache.get(self.files[1], os.stat(self.files[1])))
+        cache.put(self.files[3], os.stat(self.files[3]), self.meta)
+        self.assertIsNotNone(cache.get(self.files[1], os.stat(self.files[1])))
+        self.assertIsNone(cache.get(self.files[2], os.stat(self.files[2])))
+
+        # Sizes are 1 to 4 bytes: only the last two files fit into 7 bytes
+        cache = MetadataCache(max_size=7)
+        for meta_file in self.files:
+            cache.put(meta_file, os.stat(meta_file), self.meta)
+        self.assertEqual((0, 0, 2, 2, 7), cache.statistics())
+
+        cache.configure(max_entries=1)
+        self.assertEqual(1, cache.statistics().entries)
+
+    def test_budget(self):
+        # The shared cache is bounded by size, which the environment can change
+        for value, size in ((None, DEFAULT_CACHE_SIZE), ('128', 128), ('0', 0), ('lots', DEFAULT_CACHE_SIZE)):
+            environment = {CACHE_SIZE_VARIABLE: value} if value is not None else {}
+            with mock.patch.dict(os.environ, environment, clear=True):
+                self.assertEqual(size * 1024 * 1024, _cache_size())
+
+    def test_load_meta(self):
+        metadata_cache.clear()
+        img_path = self.test_path / "test.png"
+        img_path.touch()
+        meta = ImageMetadata(uuid4(), URI(img_path), "a", None, ["b"], None)
+        write_meta(meta, img_path)
+
+        with mock.patch('data.filexp.parse_xml', wraps=parse_xml) as parser:
+            # Written metadata is served without parsing
+            self.assertEqual(meta, load_meta(img_path))
+            self.assertEqual(meta, load_meta(img_path))
+            self.assertEqual(0, parser.call_count)
+
+            # Changes made by others are noticed
+            (self.test_path / "test.xml").write_text((self.test_path / "test.xml").read_text()
+                                                     .replace("<author>a</author>", "<author>zz</author>"))
+            self.assertEqual("zz", load_meta(img_path).author)
+            self.assertEqual(1, parser.call_count)
+
+        self.assertEqual(2, metadata_cache.statistics().hits)
+        self.assertEqual(1, metadata_cache.statistics().misses)
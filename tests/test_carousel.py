@@ -1,11 +1,19 @@
 import os
 import unittest as ut
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from unittest import mock
 from uuid import uuid4
 
+from uri import URI
+
+from data.cache import metadata_cache
 from data.common import ImageMetadata
-from data.filexp import Carousel, write_meta
+from data.filtering import FilterBuilder
+from data.filexp import Carousel, LiveCarousel, StreamingCarousel, postings_cache, write_meta
+from data.postings import PostingIndex
+from data.xmngr import parse_xml
 
 
 class TestCarouselConstruction(ut.TestCase):
@@ -49,6 +57,95 @@ class TestCarouselConstruction(ut.TestCase):
 
         self.assertEqual([Path(self.test_dir.name) / "included.png"], specimen._image_files)
 
+    def test_filter_builder(self):
+        test_path = Path(self.test_dir.name)
+        for n in range(0, 10):
+            img_path = test_path / "{}.png".format(n)
+            img_path.touch()
+            write_meta(ImageMetadata(uuid4(), URI(img_path), None, None, None, ["odd" if n % 2 else "even"]), img_path)
+
+        builder = FilterBuilder().tag_constraint("odd")
+        self.assertEqual(Carousel(test_path, builder.get_all_filters())._image_files,
+                         Carousel(test_path, builder)._image_files)
+        self.assertEqual(5, len(Carousel(test_path, builder)._image_files))
+        # A builder without constraints must not filter anything
+        self.assertEqual(10, len(Carousel(test_path, FilterBuilder())._image_files))
+
+    def test_postings_reuse(self):
+        test_path = Path(self.test_dir.name)
+        for n in range(0, 10):
+            img_path = test_path / "{}.png".format(n)
+            img_path.touch()
+            write_meta(ImageMetadata(uuid4(), URI(img_path), None, None, None, ["odd" if n % 2 else "even"]), img_path)
+
+        postings_cache.clear()
+        with mock.patch.object(FilterBuilder, 'compile') as compiler, \
+                mock.patch('data.postings.PostingIndex', wraps=PostingIndex) as indexer:
+            self.assertEqual(5, len(Carousel(test_path, FilterBuilder().tag_constraint("odd"))._image_files))
+            self.assertEqual(5, len(Carousel(test_path, FilterBuilder().tag_constraint("odd", True))._image_files))
+            self.assertEqual(1, indexer.call_count)
+
+            # Constraints on other properties need them to be indexed, too
+            self.assertEqual(10, len(Carousel(test_path, FilterBuilder().author_constraint(None))._image_files))
+            self.assertEqual(5, len(Carousel(test_path, FilterBuilder().tag_constraint("odd"))._image_files))
+            self.assertEqual(2, indexer.call_count)
+
+            # Changed metadata is indexed again
+            write_meta(ImageMetadata(uuid4(), URI(test_path / "0.png"), None, None, None, ["odd"]), test_path / "0.png")
+            self.assertEqual(6, len(Carousel(test_path, FilterBuilder().tag_constraint("odd"))._image_files))
+            self.assertEqual(3, indexer.call_count)
+
+        # Filter builders are only evaluated over the index
+        compiler.assert_not_called()
+
+    def test_filename_pushdown(self):
+        test_path = Path(self.test_dir.name)
+        for n in range(0, 10):
+            img_path = test_path / "{}.png".format(n)
+            img_path.touch()
+            write_meta(ImageMetadata(uuid4(), URI(img_path), "a", None, None, None), img_path)
+
+        builder = FilterBuilder().filename_constraint("3.png").filename_constraint("7.png").author_constraint("a")
+        # Make sure that metadata files are actually parsed
+        metadata_cache.clear()
+        with mock.patch('data.filexp.parse_xml', wraps=parse_xml) as parser:
+            self.assertEqual({test_path / "3.png", test_path / "7.png"}, set(Carousel(test_path, builder)._image_files))
+            # Only the metadata files of images whose names match are read
+            self.assertEqual(2, parser.call_count)
+
+            parser.reset_mock()
+            self.assertEqual(8, len(TestStreamingCarousel.drain(
+                StreamingCarousel(test_path, FilterBuilder().filename_constraint("3.png", True)
+                                  .filename_constraint("7.png", True)))))
+            self.assertEqual(0, parser.call_count)
+
+    def test_recursive(self):
+        test_path = Path(self.test_dir.name)
+        (test_path / "sub" / "subsub").mkdir(parents=True)
+        for name in ["01.png", "sub/02.png", "sub/subsub/03.png"]:
+            (test_path / name).touch()
+
+        self.assertEqual([test_path / "01.png"], Carousel(test_path)._image_files)
+        self.assertEqual([test_path / "01.png", test_path / "sub" / "02.png", test_path / "sub" / "subsub" / "03.png"],
+                         Carousel(test_path, max_depth=None)._image_files)
+
+        streaming = StreamingCarousel(test_path, max_depth=None, exclude=["subsub"])
+        self.assertEqual([test_path / "01.png", test_path / "sub" / "02.png"], TestStreamingCarousel.drain(streaming))
+
+    def test_filter_concurrent(self):
+        for n in range(0, 10):
+            img_path = Path(self.test_dir.name) / "{}.png".format(n)
+            img_path.touch()
+            write_meta(ImageMetadata(uuid4(), img_path.name, str(n % 2), None, None, None), img_path)
+
+        sequential = Carousel(Path(self.test_dir.name), [lambda meta: meta.author == "0"])
+        with ThreadPoolExecutor(4) as executor:
+            concurrent = Carousel(Path(self.test_dir.name), [lambda meta: meta.author == "0"], executor=executor)
+
+        # Concurrent loading must not alter the outcome nor the order of images
+        self.assertEqual(5, len(concurrent._image_files))
+        self.assertEqual(sequential._image_files, concurrent._image_files)
+
 
 class TestCarouselBehaviour(ut.TestCase):
     def setUp(self) -> None:
@@ -154,3 +251,156 @@ class TestCarouselBehaviour(ut.TestCase):
         self.assertRaises(StopIteration, lambda: specimen.next())
         self.assertFalse(specimen.has_prev())
         self.assertRaises(StopIteration, lambda: specimen.prev())
+
+
+class TestStreamingCarousel(ut.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = TemporaryDirectory()
+        self.test_path = Path(self.test_dir.name)
+
+        for n in range(0, 10):
+            img_path = self.test_path / "{}.png".format(n)
+            img_path.touch()
+            write_meta(ImageMetadata(uuid4(), img_path.name, str(n % 2), None, None, None), img_path)
+
+    def tearDown(self) -> None:
+        self.test_dir.cleanup()
+
+    @staticmethod
+    def drain(carousel: Carousel):
+        results = []
+        while carousel.has_next():
+            results.append(carousel.next())
+
+        return results
+
+    def test_on_demand(self):
+        specimen = StreamingCarousel(self.test_path, [lambda meta: meta.author == "0"])
+
+        # Nothing has been discovered yet
+        self.assertIsNone(specimen.has_next(wait=False))
+        self.assertEqual([], specimen._image_files)
+
+        # Discovery proceeds one image at a time
+        self.assertTrue(specimen.has_next())
+        self.assertEqual(1, len(specimen._image_files))
+
+        # In the end, the same images as an eager carousel must be produced, in the same order
+        self.assertEqual(Carousel(self.test_path, [lambda meta: meta.author == "0"])._image_files,
+                         self.drain(specimen))
+        self.assertTrue(specimen.exhausted)
+        self.assertFalse(specimen.has_next(wait=False))
+        self.assertRaises(StopIteration, specimen.next)
+
+        # Going back must still be possible
+        self.assertTrue(specimen.has_prev())
+
+    def test_background(self):
+        with ThreadPoolExecutor(2) as executor:
+            specimen = StreamingCarousel(self.test_path, [lambda meta: meta.author == "1"], executor=executor,
+                                         background=True)
+            self.assertEqual(Carousel(self.test_path, [lambda meta: meta.author == "1"])._image_files,
+                             self.drain(specimen))
+
+    def test_peek(self):
+        specimen = StreamingCarousel(self.test_path)
+        specimen.next()
+
+        # Peeking never discovers images
+        self.assertIsNone(specimen.peek(1))
+        specimen.has_next()
+        self.assertEqual(specimen._image_files[1], specimen.peek(1))
+        self.assertEqual(specimen._image_files[0], specimen.peek(0))
+        self.assertIsNone(specimen.peek(-1))
+
+    def test_seek(self):
+        specimen = StreamingCarousel(self.test_path)
+        specimen.next()
+        specimen.has_next()
+
+        # Only discovered images can be reached
+        images = specimen.images()
+        self.assertEqual(2, len(images))
+        self.assertEqual(images[1], specimen.seek(images[1]))
+        self.assertEqual(images[0], specimen.peek(-1))
+        self.assertEqual(images[0], specimen.prev())
+        self.assertRaises(ValueError, specimen.seek, self.test_path / "missing.png")
+
+    def test_close(self):
+        specimen = StreamingCarousel(self.test_path)
+        specimen.next()
+        specimen.close()
+
+        # No more images are discovered after closing
+        self.assertRaises(StopIteration, specimen.next)
+
+
+class TestLiveCarousel(ut.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = TemporaryDirectory()
+        self.test_path = Path(self.test_dir.name)
+
+        for name in ["01.png", "02.png", "03.png"]:
+            (self.test_path / name).touch()
+
+    def tearDown(self) -> None:
+        self.test_dir.cleanup()
+
+    def test_additions_and_removals(self):
+        specimen = LiveCarousel(self.test_path)
+        first = specimen.next()
+        others = {self.test_path / "01.png", self.test_path / "02.png", self.test_path / "03.png"} - {first}
+
+        # Nothing happened
+        self.assertFalse(specimen.sync())
+
+        (self.test_path / "04.png").touch()
+        (self.test_path / "04.txt").touch()
+        for other in others:
+            os.remove(other)
+        self.assertTrue(specimen.sync())
+
+        # Removed images are gone, while new ones come last
+        self.assertFalse(specimen.has_prev())
+        self.assertEqual(self.test_path / "04.png", specimen.next())
+        self.assertEqual([first, self.test_path / "04.png"], specimen._image_files)
+
+        # Removing the current image must bring us back to its predecessor
+        os.remove(self.test_path / "04.png")
+        self.assertTrue(specimen.sync())
+        self.assertFalse(specimen.has_next())
+        self.assertEqual([first], specimen._image_files)
+        self.assertEqual(0, specimen._current)
+
+        specimen.close()
+
+    def test_metadata_changes(self):
+        def only_tagged(meta: ImageMetadata) -> bool:
+            return meta.tags is not None and "t" in meta.tags
+
+        specimen = LiveCarousel(self.test_path, [only_tagged])
+        self.assertFalse(specimen.has_next())
+
+        # Tagging an image must make it appear
+        write_meta(ImageMetadata(uuid4(), URI(self.test_path / "02.png"), None, None, None, ["t"]),
+                   self.test_path / "02.png")
+        self.assertTrue(specimen.sync())
+        self.assertEqual(self.test_path / "02.png", specimen.next())
+
+        # Removing the metadata file must make it disappear
+        os.remove(self.test_path / "02.xml")
+        self.assertTrue(specimen.sync())
+        self.assertEqual([], specimen._image_files)
+
+        specimen.close()
+
+    def test_no_probing(self):
+        specimen = LiveCarousel(self.test_path)
+        TestStreamingCarousel.drain(specimen)
+
+        # Without a sync, the carousel must not notice deletions
+        os.remove(self.test_path / "01.png")
+        self.assertEqual(3, len(specimen._image_files))
+        self.assertTrue(specimen.has_prev())
+
+        specimen.close()
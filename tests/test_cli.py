@@ -0,0 +1,91 @@
+import io
+import json
+import subprocess
+import sys
+import unittest as ut
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from uuid import uuid4
+
+from uri import URI
+
+import cli
+from data.common import ImageMetadata
+from data.export import EXPORT_FORMATS
+from data.filexp import write_meta
+
+
+class TestCommandLine(ut.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = TemporaryDirectory()
+        self.test_path = Path(self.test_dir.name)
+
+        for n in range(0, 10):
+            img_path = self.test_path / "{:02}.png".format(n)
+            img_path.touch()
+            # Leave some images without metadata
+            if n % 5 != 0:
+                write_meta(ImageMetadata(uuid4(), URI(img_path), str(n % 2), None, ["c"] if n % 4 == 0 else None,
+                                         ["a", "b"] if n % 3 else ["a"]), img_path)
+
+    def tearDown(self) -> None:
+        self.test_dir.cleanup()
+
+    def run_cli(self, *args: str) -> str:
+        output = io.StringIO()
+        with redirect_stdout(output), redirect_stderr(io.StringIO()):
+            self.assertEqual(0, cli.main(list(args)))
+
+        return output.getvalue()
+
+    def test_query(self):
+        selected = self.run_cli('query', str(self.test_path), '--where', 'author=1', '--where-not', 'tag=b')
+        self.assertCountEqual([str(self.test_path / "03.png"), str(self.test_path / "09.png")], selected.split())
+
+        self.assertEqual("2\n", self.run_cli('query', str(self.test_path), '--where', 'author=', '--count'))
+        self.assertEqual("10\n", self.run_cli('query', str(self.test_path), '--count', '--jobs', '1'))
+
+    def test_stats(self):
+        lines = self.run_cli('stats', str(self.test_path), '--top', '1').splitlines()
+
+        self.assertEqual("10 images, 8 with metadata", lines[0])
+        self.assertIn("tags (2 distinct):", lines)
+        self.assertEqual("8 a", lines[lines.index("tags (2 distinct):") + 1].strip())
+        self.assertEqual("2 c", lines[lines.index("characters (1 distinct):") + 1].strip())
+
+    def test_export(self):
+        self.assertCountEqual(EXPORT_FORMATS.keys(), cli._EXPORT_FORMATS)
+
+        records = [json.loads(line) for line in self.run_cli('export', str(self.test_path), '--where', 'tag=b')
+                   .splitlines()]
+        self.assertEqual(5, len(records))
+        self.assertTrue(all("b" in record['tags'] for record in records))
+
+        output = self.test_path / "out.csv"
+        self.run_cli('export', str(self.test_path), '--format', 'csv', '--output', str(output))
+        self.assertEqual(11, len(output.read_text().splitlines()))
+
+    def test_vocabulary(self):
+        vocabulary = self.test_path / "vocabulary.txt"
+        vocabulary.write_text("Alpha, a\n")
+
+        self.assertEqual("0\n", self.run_cli('query', str(self.test_path), '--where', 'tag=ALPHA', '--count'))
+        self.assertEqual("8\n", self.run_cli('query', str(self.test_path), '--where', 'tag=ALPHA', '--count',
+                                             '--vocabulary', str(vocabulary)))
+
+        lines = self.run_cli('stats', str(self.test_path), '--vocabulary', str(vocabulary)).splitlines()
+        self.assertEqual("8 Alpha", lines[lines.index("tags (2 distinct):") + 1].strip())
+
+    def test_lazy_imports(self):
+        # Queries don't need the GUI, nor the modules of the other commands
+        code = "import sys, cli; cli.main(['query', {!r}]); " \
+               "print('loaded:', ','.join(m for m in sys.modules if m == 'gi' or m.startswith(('ui', 'data.bulk'))))"
+        result = subprocess.run([sys.executable, '-c', code.format(self.test_dir.name)], capture_output=True, text=True,
+                                cwd=Path(cli.__file__).parent, check=True)
+
+        self.assertEqual("loaded: ", result.stdout.splitlines()[-1])
+
+
+if __name__ == '__main__':
+    ut.main()
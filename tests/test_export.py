@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+import unittest as ut
+import xml.etree.ElementTree as ElTree
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from uuid import uuid4
+
+from uri import URI
+
+from data.common import ImageMetadata
+from data.export import export_metadata, iter_metadata
+from data.filexp import Carousel, load_meta, write_meta
+from data.filtering import FilterBuilder
+from data.storage import CollectionStore, SidecarStore, copy_metadata
+from data.xmngr import parse_xml
+
+
+class TestExport(ut.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = TemporaryDirectory()
+        self.test_path = Path(self.test_dir.name)
+
+        for n in range(0, 20):
+            img_path = self.test_path / "{:02}.png".format(n)
+            img_path.touch()
+            # Leave some images without metadata
+            if n % 5 != 0:
+                write_meta(ImageMetadata(uuid4(), URI(img_path), str(n % 2), None, ["x, y"] if n % 3 else None,
+                                         ["a", "<b>"]), img_path)
+
+        self.images = Carousel(self.test_path)._image_files
+
+    def tearDown(self) -> None:
+        self.test_dir.cleanup()
+
+    def test_iteration(self):
+        self.assertEqual([load_meta(img) for img in self.images], list(iter_metadata(self.test_path, window=4)))
+
+        builder = FilterBuilder().author_constraint("1")
+        expected = [load_meta(img) for img in Carousel(self.test_path, builder)._image_files]
+        with ThreadPoolExecutor(2) as executor:
+            self.assertEqual(expected, list(iter_metadata(self.test_path, builder, executor=executor, window=3)))
+
+        with CollectionStore(self.test_path) as store:
+            copy_metadata(self.images, SidecarStore(), store)
+            self.assertEqual(list(iter_metadata(self.test_path, builder)),
+                             list(iter_metadata(self.test_path, builder, store=store)))
+
+    def test_formats(self):
+        expected = [load_meta(img) for img in self.images]
+
+        output = io.StringIO()
+        self.assertEqual(20, export_metadata(iter_metadata(self.test_path), output, 'jsonl'))
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([str(meta.img_id) for meta in expected], [record['id'] for record in records])
+        self.assertEqual([meta.tags for meta in expected], [record['tags'] for record in records])
+
+        output = io.StringIO(newline='')
+        self.assertEqual(20, export_metadata(iter_metadata(self.test_path), output, 'csv'))
+        rows = list(csv.DictReader(io.StringIO(output.getvalue(), newline='')))
+        self.assertEqual([str(meta.file) for meta in expected], [row['file'] for row in rows])
+        self.assertEqual([', '.join(meta.characters) if meta.characters else '' for meta in expected],
+                         [row['characters'] for row in rows])
+
+        output = io.StringIO()
+        self.assertEqual(20, export_metadata(iter_metadata(self.test_path), output, 'xml'))
+        root = ElTree.fromstring(output.getvalue())
+        self.assertEqual(expected, [parse_xml(ElTree.tostring(child, encoding="unicode")) for child in root])
+
+        self.assertRaises(ValueError, export_metadata, [], io.StringIO(), 'yaml')
@@ -1,9 +1,11 @@
 import unittest as ut
+from random import Random
 from uuid import uuid4
 from uri import URI
 
 from data.common import ImageMetadata
 from data.filtering import FilterBuilder
+from data.postings import PostingIndex
 
 
 class TestFilters(ut.TestCase):
@@ -133,3 +135,89 @@ class TestFilters(ut.TestCase):
         self.assertFalse(f(el1))
         self.assertTrue(f(el2))
         self.assertTrue(f(el3))
+
+    def test_restricted(self):
+        builder = FilterBuilder().filename_constraint("a.png").tag_constraint("x").tags_as_disjunctive(True)
+        restricted = builder.restricted(['tags'])
+
+        self.assertEqual(['tags'], restricted.constrained_fields())
+        self.assertEqual(builder.get_constraints('tags'), restricted.get_constraints('tags'))
+
+        # The original builder must be left untouched
+        restricted.tag_constraint("y")
+        self.assertEqual(frozenset({"x"}), builder.get_constraints('tags')[0])
+
+        name_filter = builder.get_value_filter('file')
+        self.assertTrue(name_filter("a.png"))
+        self.assertFalse(name_filter("b.png"))
+
+
+class TestEquivalentEvaluation(ut.TestCase):
+    # Check that bulk and compiled evaluations select the same images as the filter list does
+    def setUp(self) -> None:
+        rng = Random(1234)
+        vocabulary = ["a", "b", "c", "d"]
+
+        def sample():
+            # Produce missing, empty and populated values alike
+            return rng.choice([None, [], rng.sample(vocabulary, rng.randint(1, 3))])
+
+        self.elements = [ImageMetadata(uuid4(), URI("{}.png".format(n)), rng.choice([None, "x", "y"]),
+                                       rng.choice([None, "u", "v"]), sample(), sample())
+                         for n in range(0, 200)]
+        self.index = PostingIndex(self.elements)
+
+    def assertSameSelection(self, filter_builder: FilterBuilder):
+        filters = filter_builder.get_all_filters()
+        expected = [n for n, el in enumerate(self.elements) if all(f(el) for f in filters)]
+
+        self.assertEqual(expected, self.index.matches(filter_builder))
+
+        compiled = filter_builder.compile()
+        self.assertEqual(expected, [n for n, el in enumerate(self.elements) if compiled(el)])
+
+    def test_empty(self):
+        self.assertSameSelection(FilterBuilder())
+        self.assertEqual(list(range(0, len(self.elements))), self.index.matches(FilterBuilder()))
+        self.assertEqual([], PostingIndex().matches(FilterBuilder().tag_constraint("a")))
+
+    def test_single_valued(self):
+        self.assertSameSelection(FilterBuilder().author_constraint("x"))
+        self.assertSameSelection(FilterBuilder().author_constraint("x").author_constraint(None))
+        self.assertSameSelection(FilterBuilder().author_constraint("x").author_constraint("y", True))
+        self.assertSameSelection(FilterBuilder().universe_constraint(None, True))
+        self.assertSameSelection(FilterBuilder().filename_constraint("3.png").filename_constraint("150.png"))
+        self.assertSameSelection(FilterBuilder().id_constraint(str(self.elements[7].img_id)))
+        self.assertSameSelection(FilterBuilder().id_constraint(str(self.elements[7].img_id), True))
+        self.assertSameSelection(FilterBuilder().author_constraint("unknown"))
+
+    def test_multi_valued(self):
+        # Try all combinations of two constraints, under both evaluation modes
+        values = ["a", "b", "c", None, "unknown"]
+        for disjunctive in (False, True):
+            for first in values:
+                for second in values:
+                    for first_excluded in (False, True):
+                        for second_excluded in (False, True):
+                            self.assertSameSelection(FilterBuilder().tags_as_disjunctive(disjunctive)
+                                                     .tag_constraint(first, first_excluded)
+                                                     .tag_constraint(second, second_excluded))
+
+    def test_combined(self):
+        self.assertSameSelection(FilterBuilder().author_constraint("x").universe_constraint("v", True)
+                                 .character_constraint("a").character_constraint("b").characters_as_disjunctive(True)
+                                 .tag_constraint("c", True))
+
+    def test_incremental(self):
+        index = PostingIndex(fields=['tags'])
+        for el in self.elements[:100]:
+            index.add(el)
+
+        # Querying in between must not spoil later results
+        index.matches(FilterBuilder().tag_constraint("a"))
+        for el in self.elements[100:]:
+            index.add(el)
+
+        self.assertEqual(self.index.matches(FilterBuilder().tag_constraint("a")),
+                         index.matches(FilterBuilder().tag_constraint("a")))
+        self.assertRaises(KeyError, index.matches, FilterBuilder().author_constraint("x"))
@@ -0,0 +1,83 @@
+import os
+import unittest as ut
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+from uuid import UUID, uuid4
+
+from uri import URI
+
+import data.index
+from data.common import ImageMetadata
+from data.filexp import Carousel, load_meta, write_meta
+from data.index import MetadataIndex
+
+
+class TestMetadataIndex(ut.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = TemporaryDirectory()
+        self.test_path = Path(self.test_dir.name)
+
+        self.image = self.test_path / "test.png"
+        self.image.touch()
+        self.meta = ImageMetadata(UUID('97ed6183-73a0-46ea-b51d-0721b0fbd357'), URI(self.image), "a", None, ["x"],
+                                  ["f", "a"])
+        write_meta(self.meta, self.image)
+
+    def tearDown(self) -> None:
+        self.test_dir.cleanup()
+
+    def test_load(self):
+        with MetadataIndex(self.test_path) as index:
+            self.assertEqual(self.meta, index.load(self.image))
+            # Loading again must yield the same metadata
+            self.assertEqual(self.meta, index.load(self.image))
+
+        self.assertTrue((self.test_path / MetadataIndex.DB_NAME).exists())
+
+    def test_persistence(self):
+        with MetadataIndex(self.test_path) as index:
+            index.load(self.image)
+
+        # A new instance must serve the metadata without parsing the file again
+        with MetadataIndex(self.test_path) as index, patch.object(data.index, 'load_meta') as loader:
+            self.assertEqual(self.meta, index.load(self.image))
+            loader.assert_not_called()
+
+    def test_change_detection(self):
+        with MetadataIndex(self.test_path) as index:
+            index.load(self.image)
+
+            updated = self.meta._replace(author="b", tags=None)
+            write_meta(updated, self.image)
+            # Make sure that the modification time changes, even on coarse-grained file systems
+            stat = os.stat(self.test_path / "test.xml")
+            os.utime(self.test_path / "test.xml", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+            self.assertEqual(updated, index.load(self.image))
+
+            # Deleting the metadata file must make metadata blank again
+            os.remove(self.test_path / "test.xml")
+            self.assertEqual(load_meta(self.image), index.load(self.image))
+
+    def test_load_many(self):
+        other = self.test_path / "other.png"
+        other.touch()
+
+        expected = [self.meta, load_meta(other), self.meta]
+
+        # Try both with an empty and with a populated index
+        with MetadataIndex(self.test_path) as index, ThreadPoolExecutor(2) as executor:
+            self.assertEqual(expected, list(index.load_many([self.image, other, self.image], executor)))
+            self.assertEqual(expected, list(index.load_many([self.image, other, self.image])))
+
+    def test_carousel(self):
+        excluded = self.test_path / "excluded.jpg"
+        excluded.touch()
+        write_meta(ImageMetadata(uuid4(), URI(excluded), "b", None, None, None), excluded)
+
+        with MetadataIndex(self.test_path) as index:
+            for _ in range(0, 2):
+                specimen = Carousel(self.test_path, [lambda meta: meta.author == "a"], index)
+                self.assertEqual([self.image], specimen._image_files)
@@ -0,0 +1,98 @@
+import io
+import os
+import pstats
+import subprocess
+import sys
+import unittest as ut
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import instrumentation
+from instrumentation import Histogram, Recorder
+
+
+class TestHistogram(ut.TestCase):
+    def test_percentiles(self):
+        histogram = Histogram()
+        for _ in range(0, 90):
+            histogram.add(0.000010)
+        for _ in range(0, 10):
+            histogram.add(0.002)
+
+        self.assertEqual(100, histogram.count)
+        self.assertAlmostEqual(0.0209, histogram.total)
+        self.assertEqual({3: 90, 10: 10}, histogram.buckets)
+        self.assertEqual(16e-6, histogram.percentile(0.5))
+        self.assertEqual(16e-6, histogram.percentile(0.9))
+        self.assertEqual(0.002, histogram.percentile(0.99))
+
+
+class TestRecorder(ut.TestCase):
+    def test_disabled(self):
+        recorder = Recorder(False)
+
+        def function():
+            return 1
+
+        self.assertIs(function, recorder.timed('function')(function))
+        with recorder.measure('block'):
+            recorder.count('counter')
+
+        self.assertEqual({}, recorder.histograms)
+        self.assertEqual({}, recorder.counters)
+
+    def test_enabled(self):
+        recorder = Recorder(True)
+
+        @recorder.timed('function')
+        def function(fail):
+            """Documented."""
+            if fail:
+                raise ValueError()
+            return 1
+
+        self.assertEqual("Documented.", function.__doc__)
+        self.assertEqual(1, function(False))
+        self.assertRaises(ValueError, function, True)
+        with recorder.measure('block'):
+            recorder.count('counter')
+            recorder.count('counter', 2)
+
+        self.assertEqual(2, recorder.histograms['function'].count)
+        self.assertEqual(1, recorder.histograms['block'].count)
+        self.assertEqual({'counter': 3}, recorder.counters)
+
+        output = io.StringIO()
+        recorder.report(output)
+        self.assertIn("function: 2 runs", output.getvalue())
+        self.assertIn("block: 1 runs", output.getvalue())
+        self.assertIn("counter: 3", output.getvalue())
+
+    def test_session(self):
+        with TemporaryDirectory() as test_dir:
+            test_path = Path(test_dir)
+            (test_path / "image.png").touch()
+            (test_path / "image.xml").write_text('<image id="c6f96e5d-3fbd-4bb1-9e38-20d5a7d06a1a" '
+                                                 'file="file:///image.png"><tags><tag>a</tag></tags></image>')
+
+            environment = dict(os.environ)
+            environment.update({instrumentation.INSTRUMENT_VARIABLE: str(test_path / "report.txt"),
+                                instrumentation.PROFILE_VARIABLE: str(test_path / "profile.out"),
+                                instrumentation.TRACEMALLOC_VARIABLE: str(test_path / "allocations.txt")})
+            code = "import instrumentation; instrumentation.start_session(); from pathlib import Path; " \
+                   "from data.filexp import Carousel; from data.filtering import FilterBuilder; " \
+                   "Carousel(Path({!r}), FilterBuilder().tag_constraint('a'))".format(test_dir)
+            subprocess.run([sys.executable, '-c', code], env=environment, check=True,
+                           cwd=Path(instrumentation.__file__).parent)
+
+            report = (test_path / "report.txt").read_text()
+            for name in ("Carousel.__init__", "Carousel.scan", "filter.postings", "load_meta", "parse_xml"):
+                self.assertIn(name + ": 1 runs", report)
+            self.assertIn("load_meta.parsed: 1", report)
+
+            self.assertGreater(pstats.Stats(str(test_path / "profile.out")).total_calls, 0)
+            self.assertTrue((test_path / "allocations.txt").read_text().startswith("current "))
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -1,11 +1,13 @@
 import unittest as ut
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from pathlib import Path
 from tempfile import TemporaryDirectory
 from uuid import UUID
 from uri import URI
 
+from data.cache import metadata_cache
 from data.common import ImageMetadata
-from data.filexp import load_meta, write_meta
+from data.filexp import load_meta, load_meta_many, write_meta
 
 
 class TestLoadStore(ut.TestCase):
@@ -91,6 +93,38 @@ class TestLoadStore(ut.TestCase):
                          "<tags><tag>f</tag><tag>a</tag></tags></image>",
                          result)
 
+    def test_atomic_store(self):
+        img = self.test_path / "test.png"
+        meta_file = self.test_path / "test.xml"
+        meta_file.write_text("previous")
+        previous_inode = meta_file.stat().st_ino
+
+        write_meta(ImageMetadata(UUID(int=1), URI(img), "a", None, None, None), img)
+
+        # The metadata file is replaced rather than rewritten, and no temporary file is left behind
+        self.assertNotEqual(previous_inode, meta_file.stat().st_ino)
+        self.assertEqual("a", load_meta(img).author)
+        self.assertEqual([meta_file], list(self.test_path.iterdir()))
+
+        # Failed writes leave no temporary file behind either
+        blocked = self.test_path / "blocked.xml"
+        blocked.mkdir()
+        (blocked / "content").touch()
+        blocked_img = self.test_path / "blocked.png"
+        self.assertRaises(OSError, write_meta, ImageMetadata(UUID(int=2), URI(blocked_img), "b", None, None, None),
+                          blocked_img)
+        self.assertEqual({meta_file, blocked}, set(self.test_path.iterdir()))
+
+    def test_store_invalid_characters(self):
+        # Characters that cannot appear in XML are left out, and the metadata still reads back as written
+        img = self.test_path / "test.png"
+        write_meta(ImageMetadata(UUID(int=1), URI(img), "\x07", None, None, ["a\uffffb", "\ud800"]), img)
+
+        expected = ImageMetadata(UUID(int=1), URI(img), None, None, None, ["ab", None])
+        self.assertEqual(expected, load_meta(img))
+        metadata_cache.clear()
+        self.assertEqual(expected, load_meta(img))
+
     def test_legacy_load(self):
         image_uri = URI(self.test_path / "test.png")
         with (self.test_path / "test.xml").open('w') as f:
@@ -99,3 +133,20 @@ class TestLoadStore(ut.TestCase):
         loaded = load_meta(Path(image_uri.path))
         self.assertEqual(ImageMetadata(UUID('97ed6183-73a0-46ea-b51d-0721b0fbd357'), image_uri, None, None, None, None),
                          loaded)
+
+    def test_load_many(self):
+        images = []
+        for n in range(0, 20):
+            images.append(self.test_path / "{:02}.png".format(n))
+            # Only give metadata to even-numbered images
+            if n % 2 == 0:
+                write_meta(ImageMetadata(UUID(int=n), URI(images[-1]), str(n), None, None, None), images[-1])
+
+        expected = [load_meta(img) for img in images]
+
+        # Order must be preserved, regardless of the executor in use
+        self.assertEqual(expected, list(load_meta_many(images)))
+        with ThreadPoolExecutor(4) as executor:
+            self.assertEqual(expected, list(load_meta_many(images, executor)))
+        with ProcessPoolExecutor(2) as executor:
+            self.assertEqual(expected, list(load_meta_many(images, executor, chunksize=3)))
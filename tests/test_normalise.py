@@ -0,0 +1,115 @@
+import stringprep
+import unittest as ut
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from uuid import uuid4
+
+from uri import URI
+
+from data.bulk import Edit, Operation, normalise_edit
+from data.common import ImageMetadata
+from data.filtering import FilterBuilder
+from data.normalise import TagVocabulary, normalise, normalise_list
+from data.postings import PostingIndex
+
+
+def _reference_normalise(s: str) -> str:
+    # The character-by-character implementation normalise() replaces
+    res = ''
+    for ch in s:
+        res += ch if not stringprep.in_table_c11_c12(ch) and not stringprep.in_table_c21_c22(ch) else ' '
+
+    return ' '.join(res.split())
+
+
+class TestNormalise(ut.TestCase):
+    def test_space_and_control(self):
+        self.assertEqual("a b c", normalise("  a\t\u00a0b\u200b\u3000\x07c\r\n"))
+        self.assertEqual("", normalise(" \x00 \ufeff "))
+        self.assertEqual("\uff21\uff42", normalise("\uff21\uff42"))
+
+    def test_equivalence(self):
+        # Same results as stringprep over every character of the BMP, and the few controls outside of it
+        text = ''.join(chr(code) + 'x' for code in range(0, 0x10000) if not 0xD800 <= code < 0xE000)
+        text += ''.join(chr(code) + 'y' for code in range(0x1D170, 0x1D180))
+        self.assertEqual(_reference_normalise(text), normalise(text))
+
+    def test_options(self):
+        self.assertEqual("ab c", normalise("\uff21\uff42\u2003C", nfkc=True, casefold=True))
+        self.assertEqual("strasse", normalise("STRA\u00dfE", casefold=True))
+        self.assertEqual("\ufb01", normalise("\ufb01"))
+        self.assertEqual("fi", normalise("\ufb01", nfkc=True))
+
+    def test_list(self):
+        self.assertEqual(["a b", "c", ""], normalise_list(" a\t b ,\nc,"))
+        self.assertEqual(["x"], normalise_list("X", casefold=True))
+
+
+class TestVocabulary(ut.TestCase):
+    def setUp(self) -> None:
+        self.vocabulary = TagVocabulary({"Black and white": ["monochrome", "B&W"], "colour": ["color"]})
+
+    def test_keys(self):
+        key = self.vocabulary.key("black  AND white")
+        self.assertEqual("black and white", key)
+        self.assertIs(key, self.vocabulary.key("Monochrome"))
+        self.assertIs(key, self.vocabulary.key("\uff42\uff06\uff57"))
+        self.assertEqual("landscape", self.vocabulary.key(" Landscape"))
+        self.assertIsNone(self.vocabulary.key(None))
+        self.assertEqual({"colour", None}, self.vocabulary.keys(["Color", None]))
+        self.assertIsNone(self.vocabulary.keys(None))
+
+    def test_canonical(self):
+        self.assertEqual("Black and white", self.vocabulary.canonical("MONOCHROME"))
+        self.assertEqual("Landscape", self.vocabulary.canonical("Landscape\t"))
+        self.assertIn("b&w", self.vocabulary)
+        self.assertNotIn("landscape", self.vocabulary)
+
+    def test_add(self):
+        self.assertEqual("colored", self.vocabulary.key("colored"))
+        self.vocabulary.add("colour", ["colored"])
+        self.assertEqual("colour", self.vocabulary.key("colored"))
+
+        self.assertRaises(ValueError, self.vocabulary.add, "grayscale", ["monochrome"])
+        self.assertRaises(ValueError, self.vocabulary.add, "grayscale", [" "])
+
+    def test_load(self):
+        with TemporaryDirectory() as test_dir:
+            path = Path(test_dir) / "vocabulary.txt"
+            path.write_text("# Canonical tags first\nBlack and white, monochrome,B&W\n\ncolour,  color\nlandscape\n")
+            vocabulary = TagVocabulary.load(path)
+
+        for tag in ("monochrome", "colour", "landscape"):
+            self.assertEqual(self.vocabulary.key(tag), vocabulary.key(tag))
+        self.assertEqual("Black and white", vocabulary.canonical("b&w"))
+
+    def test_filters(self):
+        metadata = [ImageMetadata(uuid4(), URI("{}.png".format(n)), None, None, None, tags)
+                    for n, tags in enumerate([["Monochrome"], ["B&W", "Colour"], ["color"], None, ["landscape"]])]
+
+        builder = FilterBuilder().tag_constraint("black and white").tag_constraint("COLOR", True)
+        self.assertEqual([], [n for n, meta in enumerate(metadata) if builder.compile()(meta)])
+
+        builder.with_vocabulary(self.vocabulary)
+        self.assertEqual((frozenset(["black and white"]), frozenset(["colour"]), False),
+                         builder.get_constraints('tags'))
+        for predicate in (builder.compile(), builder.get_tag_filter()):
+            self.assertEqual([0], [n for n, meta in enumerate(metadata) if predicate(meta)])
+        self.assertEqual([0], PostingIndex(metadata, vocabulary=self.vocabulary).matches(builder))
+        self.assertIs(self.vocabulary, builder.restricted(['tags']).vocabulary)
+
+        builder = FilterBuilder().with_vocabulary(self.vocabulary).tag_constraint("colour").tag_constraint(None)
+        builder.tags_as_disjunctive(True)
+        self.assertEqual([1, 2, 3], PostingIndex(metadata, vocabulary=self.vocabulary).matches(builder))
+        self.assertEqual([1, 2, 3], [n for n, meta in enumerate(metadata) if builder.compile()(meta)])
+
+    def test_edits(self):
+        edit = normalise_edit(Edit(Operation.REPLACE, 'tags', (" b&w ",), "Color\t"), self.vocabulary)
+        self.assertEqual(Edit(Operation.REPLACE, 'tags', ("Black and white",), "colour"), edit)
+
+        edit = normalise_edit(Edit(Operation.ADD, 'characters', ("  Some\u3000one",)), self.vocabulary)
+        self.assertEqual(Edit(Operation.ADD, 'characters', ("Some one",)), edit)
+
+
+if __name__ == '__main__':
+    ut.main()
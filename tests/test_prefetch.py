@@ -0,0 +1,142 @@
+import unittest as ut
+from pathlib import Path
+from typing import Callable, List
+
+from ui.prefetch import ImageCache, Prefetcher
+
+
+class TestImageCache(ut.TestCase):
+    def setUp(self) -> None:
+        self.images = [Path("{}.png".format(n)) for n in range(0, 10)]
+
+    def test_budget(self):
+        # Images are strings, taking as many bytes as their length
+        cache = ImageCache(10, len)
+
+        cache.put(self.images[0], "aaaa")
+        cache.put(self.images[1], "bbbb")
+        self.assertEqual("aaaa", cache.get(self.images[0]))
+        # The least recently used image goes first
+        cache.put(self.images[2], "cccc")
+        self.assertNotIn(self.images[1], cache)
+        self.assertIsNone(cache.get(self.images[1]))
+        self.assertEqual("aaaa", cache.get(self.images[0]))
+
+        # Images larger than the whole budget aren't retained
+        cache.put(self.images[3], "d" * 11)
+        self.assertNotIn(self.images[3], cache)
+
+        cache.budget = 4
+        self.assertEqual((2, 1, 2, 1, 4), tuple(cache.statistics()))
+
+        self.assertEqual("aaaa", cache.pop(self.images[0]))
+        self.assertEqual(0, cache.statistics().size)
+
+    def test_favoured(self):
+        cache = ImageCache(8, len)
+
+        cache.put(self.images[0], "aaaa")
+        cache.put(self.images[1], "bbbb")
+        cache.favour([self.images[0]])
+        cache.put(self.images[2], "cccc")
+        self.assertIn(self.images[0], cache)
+        self.assertNotIn(self.images[1], cache)
+
+        # Favoured images are evicted when nothing else is left
+        cache.budget = 0
+        self.assertEqual(0, cache.statistics().entries)
+
+
+class TestPrefetcher(ut.TestCase):
+    def setUp(self) -> None:
+        self.decoded: List[Path] = []
+        self.callbacks: List[Callable] = []
+        self.images = [Path("{}.png".format(n)) for n in range(0, 10)]
+
+    def decode(self, img: Path) -> str:
+        self.decoded.append(img)
+        if img.name == "9.png":
+            raise ValueError("Corrupted image")
+
+        return "decoded " + img.name
+
+    def schedule(self, callback, *args):
+        # Simulate a main loop, which runs callbacks when the test says so
+        self.callbacks.append(lambda: callback(*args))
+
+    def run_callbacks(self):
+        while self.callbacks:
+            self.callbacks.pop(0)()
+
+    def test_window(self):
+        prefetcher = Prefetcher(self.decode, self.schedule, window=2)
+
+        prefetcher.put(self.images[0], "current")
+        prefetcher.update(self.images[0], self.images[1:], [])
+        # Waiting for pending images must work even before they are handed over
+        self.assertEqual("decoded 1.png", prefetcher.get(self.images[1]))
+        self.assertIsNone(prefetcher.get(self.images[3]))
+
+        # Once handed over, decoded images are served right away
+        prefetcher.get(self.images[2])
+        self.run_callbacks()
+        self.assertEqual("decoded 2.png", prefetcher.get(self.images[2]))
+        self.assertEqual({self.images[1], self.images[2]}, set(self.decoded))
+
+        prefetcher.close()
+
+    def test_direction(self):
+        prefetcher = Prefetcher(self.decode, self.schedule, window=2)
+
+        prefetcher.put(self.images[5], "current")
+        prefetcher.update(self.images[5], [self.images[4], self.images[3]], [self.images[6]])
+        prefetcher.get(self.images[3])
+        prefetcher.get(self.images[6])
+        self.run_callbacks()
+
+        # Moving backwards: 5 stays behind, 6 falls out of the window
+        prefetcher.put(self.images[4], prefetcher.get(self.images[4]))
+        prefetcher.update(self.images[4], [self.images[3], self.images[2]], [self.images[5]])
+        self.assertEqual("current", prefetcher.get(self.images[5]))
+        self.assertIsNone(prefetcher.get(self.images[6]))
+        self.assertEqual("decoded 2.png", prefetcher.get(self.images[2]))
+
+        prefetcher.close()
+        self.run_callbacks()
+        # No image has been decoded twice
+        self.assertEqual(len(self.decoded), len(set(self.decoded)))
+
+    def test_errors(self):
+        prefetcher = Prefetcher(self.decode, self.schedule, window=1)
+
+        prefetcher.put(self.images[8], "current")
+        prefetcher.update(self.images[8], [self.images[9]])
+        self.assertRaises(ValueError, prefetcher.get, self.images[9])
+
+        prefetcher.close()
+        self.run_callbacks()
+
+    def test_cache(self):
+        cache = ImageCache(100, len)
+        prefetcher = Prefetcher(self.decode, self.schedule, window=1, cache=cache)
+
+        prefetcher.put(self.images[0], "current")
+        prefetcher.update(self.images[0], self.images[1:], [])
+        prefetcher.get(self.images[1])
+        self.run_callbacks()
+
+        # Moving on, image 0 leaves the window but stays in the cache
+        prefetcher.put(self.images[1], prefetcher.get(self.images[1]))
+        prefetcher.update(self.images[1], self.images[2:], [])
+        self.assertEqual("current", prefetcher.get(self.images[0]))
+
+        # Going back, it is taken from the cache instead of being decoded again
+        prefetcher.get(self.images[2])
+        self.run_callbacks()
+        prefetcher.update(self.images[1], [self.images[0]], [self.images[2]])
+        self.assertEqual("current", prefetcher.get(self.images[0]))
+        self.assertNotIn(self.images[0], self.decoded)
+        self.assertNotIn(self.images[0], cache)
+
+        prefetcher.close()
+        self.run_callbacks()
@@ -0,0 +1,100 @@
+import unittest as ut
+from typing import Callable, Dict, List, Tuple
+
+from ui.render import Debouncer, MipmapPyramid, Viewport
+
+
+class TestViewport(ut.TestCase):
+    def test_fit(self):
+        viewport = Viewport()
+
+        # Large images are scaled down to fit, small ones are left alone and centred
+        layout = viewport.layout((4000, 2000), (1000, 1000))
+        self.assertEqual((0.25, 0, 0, 1000, 500), tuple(layout))
+        self.assertEqual((1.0, 0, 0, 200, 100), tuple(viewport.layout((200, 100), (1000, 1000))))
+
+    def test_zoom_and_pan(self):
+        viewport = Viewport()
+        image, display = (4000, 2000), (1000, 1000)
+
+        # Zooming in around the centre keeps it still
+        viewport.zoom_at(4, (500, 500), image, display)
+        layout = viewport.layout(image, display)
+        self.assertEqual(1.0, layout.scale)
+        self.assertEqual((1500, 500, 1000, 1000), tuple(layout)[1:])
+
+        # Zooming in around a point keeps that point still
+        viewport.zoom_at(2, (0, 0), image, display)
+        layout = viewport.layout(image, display)
+        self.assertEqual((2.0, 3000, 1000), tuple(layout)[:3])
+
+        # Panning moves the visible part, but never past the edges of the image
+        viewport.pan(100, 0, image, display)
+        self.assertEqual(2900, viewport.layout(image, display).left)
+        viewport.pan(10000, 10000, image, display)
+        self.assertEqual((0, 0), tuple(viewport.layout(image, display))[1:3])
+
+        # Zoom is bounded on both sides
+        viewport.zoom_at(1000, (500, 500), image, display)
+        self.assertEqual(Viewport.MAX_SCALE, viewport.scale(image, display))
+        viewport.zoom_at(0.001, (500, 500), image, display)
+        self.assertEqual((0.25, 0, 0, 1000, 500), tuple(viewport.layout(image, display)))
+
+    def test_resolution_independence(self):
+        viewport = Viewport()
+        viewport.zoom_at(4, (250, 250), (4000, 2000), (1000, 1000))
+
+        # The same part of the image is visible when it is decoded at a different resolution
+        full = viewport.layout((4000, 2000), (1000, 1000))
+        scaled = viewport.layout((1000, 500), (1000, 1000))
+        self.assertEqual(full.left / full.scale, scaled.left / scaled.scale * 4)
+        self.assertEqual(full.top / full.scale, scaled.top / scaled.scale * 4)
+
+
+class TestMipmapPyramid(ut.TestCase):
+    def test_levels(self):
+        # Images are just their sizes
+        downscaled: List[Tuple[int, int]] = []
+
+        def downscale(_, width, height):
+            downscaled.append((width, height))
+            return width, height
+
+        pyramid = MipmapPyramid((1000, 800), lambda image: image, downscale)
+
+        self.assertEqual(((1000, 800), 1.0), pyramid.level(2.0))
+        self.assertEqual(((1000, 800), 1.0), pyramid.level(0.6))
+        # Levels are built when first needed
+        self.assertEqual([], downscaled)
+        self.assertEqual(((250, 200), 0.25), pyramid.level(0.2))
+        self.assertEqual([(500, 400), (250, 200)], downscaled)
+        self.assertEqual(((500, 400), 0.5), pyramid.level(0.3))
+        # Levels don't go below the minimum size
+        self.assertEqual(((125, 100), 0.125), pyramid.level(0.001))
+        self.assertEqual(3, len(downscaled))
+
+
+class TestDebouncer(ut.TestCase):
+    def test_coalescing(self):
+        scheduled: Dict[int, Callable] = {}
+        calls = []
+
+        def schedule(delay, callback):
+            handle = len(scheduled) + 1
+            scheduled[handle] = callback
+            return handle
+
+        debouncer = Debouncer(lambda: calls.append(True), 50, schedule, scheduled.pop)
+
+        for _ in range(0, 10):
+            debouncer("allocation")
+        self.assertTrue(debouncer.pending)
+        self.assertEqual(1, len(scheduled))
+
+        self.assertFalse(scheduled.popitem()[1]())
+        self.assertEqual(1, len(calls))
+        self.assertFalse(debouncer.pending)
+
+        debouncer()
+        debouncer.cancel()
+        self.assertEqual({}, scheduled)
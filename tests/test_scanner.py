@@ -0,0 +1,86 @@
+import os
+import unittest as ut
+from mimetypes import guess_type
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from data.scanner import ImageEntry, is_image_name, scan_images, walk_images
+
+
+class TestScanner(ut.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = TemporaryDirectory()
+        self.test_path = Path(self.test_dir.name)
+
+    def tearDown(self) -> None:
+        self.test_dir.cleanup()
+
+    def test_classification(self):
+        # Classification must agree with the standard guesser
+        for name in ["a.png", "a.PNG", "a.jpeg", "a.Jpg", "a.svgz", "a.png.gz", "a.tar.gz", "a.xml", "a.pdf", ".png",
+                     "png", "a.", "a.b.gif", "a.webp"]:
+            mime = guess_type(name)[0]
+            self.assertEqual(mime is not None and mime.startswith('image/'), is_image_name(name), name)
+
+    def test_scan(self):
+        for name in ["01.png", "01.xml", "02.jpg", "03.gif", "03.xml", "04.pdf", "04.xml", "orphan.xml", "foo"]:
+            (self.test_path / name).touch()
+        # Directories must never be mistaken for images
+        (self.test_path / "05.png").mkdir()
+
+        entries = scan_images(self.test_path)
+
+        self.assertEqual({ImageEntry(self.test_path / "01.png", self.test_path / "01.xml"),
+                          ImageEntry(self.test_path / "02.jpg", None),
+                          ImageEntry(self.test_path / "03.gif", self.test_path / "03.xml")},
+                         set(entries))
+
+        # Directory order must be preserved
+        listing = [name for name in os.listdir(self.test_path) if name in {"01.png", "02.jpg", "03.gif"}]
+        self.assertEqual(listing, [entry.path.name for entry in entries])
+
+    def test_missing_directory(self):
+        with self.assertRaises(FileNotFoundError):
+            scan_images(self.test_path / "nonexistent")
+
+
+class TestTreeWalker(ut.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = TemporaryDirectory()
+        self.root = Path(self.test_dir.name)
+
+        for directory in ["b/y", "a/x", "a/drafts", "c"]:
+            (self.root / directory).mkdir(parents=True)
+        for name in ["0.png", "a/1.png", "a/1.xml", "a/x/2.png", "a/drafts/3.png", "b/4.jpg", "b/y/5.gif",
+                     "b/y/6.txt"]:
+            (self.root / name).touch()
+        # Loops must not be followed
+        (self.root / "c" / "loop").symlink_to(self.root, target_is_directory=True)
+
+    def tearDown(self) -> None:
+        self.test_dir.cleanup()
+
+    def walk(self, *args, **kwargs):
+        return [entry.path.relative_to(self.root).as_posix() for entry in walk_images(self.root, *args, **kwargs)]
+
+    def test_full_walk(self):
+        # Subdirectories must be visited depth-first, in name order, regardless of the number of workers
+        expected = ["0.png", "a/1.png", "a/drafts/3.png", "a/x/2.png", "b/4.jpg", "b/y/5.gif"]
+        self.assertEqual(expected, self.walk())
+        self.assertEqual(expected, self.walk(workers=1))
+
+        # Metadata files must still be paired
+        self.assertEqual(self.root / "a" / "1.xml", next(entry for entry in walk_images(self.root)
+                                                         if entry.path.name == "1.png").metadata_file)
+
+    def test_depth_limit(self):
+        self.assertEqual(["0.png"], self.walk(0))
+        self.assertEqual(["0.png", "a/1.png", "b/4.jpg"], self.walk(1))
+
+    def test_exclusion(self):
+        self.assertEqual(["0.png", "a/1.png", "a/x/2.png", "b/4.jpg"], self.walk(exclude=["drafts", "*.gif"]))
+        self.assertEqual(["0.png", "a/1.png", "a/drafts/3.png", "a/x/2.png"], self.walk(exclude=["b"]))
+
+    def test_missing_root(self):
+        with self.assertRaises(FileNotFoundError):
+            list(walk_images(self.root / "nonexistent"))
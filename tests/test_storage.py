@@ -0,0 +1,191 @@
+import unittest as ut
+import xml.etree.ElementTree as ElTree
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from uuid import uuid4
+
+from uri import URI
+
+from data.common import ImageMetadata
+from data.filexp import Carousel, LiveCarousel, StreamingCarousel, load_meta, write_meta
+from data.filtering import FilterBuilder
+from data.storage import CollectionStore, SidecarStore, copy_metadata, open_store
+from data.watch import PollingWatcher
+
+
+class TestCollectionStore(ut.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = TemporaryDirectory()
+        self.test_path = Path(self.test_dir.name)
+
+        self.images = []
+        for n in range(0, 4):
+            img_path = self.test_path / "{:02} & co.png".format(n)
+            img_path.touch()
+            self.images.append(img_path)
+
+    def tearDown(self) -> None:
+        self.test_dir.cleanup()
+
+    def meta(self, n: int, author: str) -> ImageMetadata:
+        return ImageMetadata(uuid4(), URI(self.images[n]), author, None, ["<x>"], ["a", "b"])
+
+    def test_round_trip(self):
+        first = self.meta(0, "a")
+        second = self.meta(1, "b")
+
+        with CollectionStore(self.test_path) as store:
+            store.write(first, self.images[0])
+            store.write(second, self.images[1])
+
+            self.assertEqual(first, store.load(self.images[0]))
+            self.assertEqual(second, store.load(self.images[1]))
+            self.assertFalse(store.has_metadata(self.images[2]))
+            self.assertEqual(load_meta(self.images[2]), store.load(self.images[2]))
+
+        # The collection must be a well-formed document, and be read again as it was left
+        root = ElTree.parse(self.test_path / CollectionStore.FILE_NAME).getroot()
+        self.assertEqual(['image', 'image'], [child.tag for child in root])
+
+        with CollectionStore(self.test_path) as store:
+            self.assertEqual([first, second, load_meta(self.images[2])],
+                             list(store.load_many(self.images[:3])))
+
+    def test_updates(self):
+        with CollectionStore(self.test_path) as store:
+            for n in range(0, 3):
+                store.write(self.meta(0, str(n)), self.images[0])
+            store.write(self.meta(1, "b"), self.images[1])
+
+            self.assertEqual("2", store.load(self.images[0]).author)
+
+        with CollectionStore(self.test_path) as store:
+            self.assertEqual("2", store.load(self.images[0]).author)
+
+            size = store.path.stat().st_size
+            store.compact()
+            self.assertLess(store.path.stat().st_size, size)
+            self.assertEqual("2", store.load(self.images[0]).author)
+            self.assertEqual("b", store.load(self.images[1]).author)
+
+            # Appending must still work after compaction
+            store.write(self.meta(2, "c"), self.images[2])
+            self.assertEqual("c", store.load(self.images[2]).author)
+
+    def test_external_changes(self):
+        with CollectionStore(self.test_path) as store, CollectionStore(self.test_path) as other:
+            self.assertFalse(store.refresh())
+
+            other.write(self.meta(0, "a"), self.images[0])
+            self.assertTrue(store.refresh())
+            self.assertEqual("a", store.load(self.images[0]).author)
+
+            other.compact()
+            self.assertTrue(store.refresh())
+            self.assertEqual("a", store.load(self.images[0]).author)
+
+    def test_damaged(self):
+        with CollectionStore(self.test_path) as store:
+            store.write(self.meta(0, "a"), self.images[0])
+            store.write(self.meta(1, "b"), self.images[1])
+
+        # Simulate an interrupted append
+        path = self.test_path / CollectionStore.FILE_NAME
+        path.write_bytes(path.read_bytes().rsplit(b'</image>', 1)[0])
+
+        with CollectionStore(self.test_path) as store:
+            self.assertEqual("a", store.load(self.images[0]).author)
+            self.assertIsNone(store.load(self.images[1]).author)
+
+            store.write(self.meta(2, "c"), self.images[2])
+            self.assertEqual("c", store.load(self.images[2]).author)
+
+    def test_foreign_markup(self):
+        # Start tags inside comments, CDATA sections and other markup written by other tools are not documents
+        foreign = '<image id="{}" file="{}" />'.format(uuid4(), URI(self.images[1]))
+        path = self.test_path / CollectionStore.FILE_NAME
+        path.write_text('<?xml version="1.0"?>\n<!DOCTYPE collection [<!ENTITY e \'<image file="e.png" />\'>]>\n'
+                        '<collection>\n<!-- {f} -->\n'
+                        '<image id="{i}" file="{u}"><author><![CDATA[{f}]]></author></image>\n'
+                        '<?note {f} ?>\n</collection>\n'.format(f=foreign, i=uuid4(), u=URI(self.images[0])))
+
+        with CollectionStore(self.test_path) as store:
+            self.assertEqual(foreign, store.load(self.images[0]).author)
+            self.assertFalse(store.has_metadata(self.images[1]))
+
+            store.write(self.meta(1, "b"), self.images[1])
+            self.assertEqual("b", store.load(self.images[1]).author)
+
+        self.assertEqual(['image', 'image'], [child.tag for child in ElTree.parse(path).getroot()])
+
+    def test_conversion(self):
+        for n in range(0, 2):
+            write_meta(self.meta(n, str(n)), self.images[n])
+
+        with CollectionStore(self.test_path) as collection:
+            self.assertEqual(2, copy_metadata(self.images, SidecarStore(), collection))
+            self.assertEqual([load_meta(img) for img in self.images], list(collection.load_many(self.images)))
+
+            for n in range(0, 2):
+                (self.test_path / "{:02} & co.xml".format(n)).unlink()
+            self.assertEqual(2, copy_metadata(self.images, collection, SidecarStore()))
+
+            self.assertEqual([collection.load(img) for img in self.images], [load_meta(img) for img in self.images])
+
+    def test_open_store(self):
+        self.assertIsInstance(open_store(self.test_path), SidecarStore)
+        CollectionStore(self.test_path).close()
+        with open_store(self.test_path) as store:
+            self.assertIsInstance(store, CollectionStore)
+
+
+class TestCarouselOverCollection(ut.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = TemporaryDirectory()
+        self.test_path = Path(self.test_dir.name)
+        self.store = CollectionStore(self.test_path)
+
+        for n in range(0, 10):
+            img_path = self.test_path / "{:02}.png".format(n)
+            img_path.touch()
+            self.store.write(ImageMetadata(uuid4(), URI(img_path), str(n % 2), None, None, None), img_path)
+
+    def tearDown(self) -> None:
+        self.store.close()
+        self.test_dir.cleanup()
+
+    def test_filtering(self):
+        builder = FilterBuilder().author_constraint("1")
+        expected = [self.test_path / "{:02}.png".format(n) for n in range(1, 10, 2)]
+
+        self.assertEqual(expected, sorted(Carousel(self.test_path, builder, store=self.store)._image_files))
+        with ThreadPoolExecutor(2) as executor:
+            self.assertEqual(expected, sorted(Carousel(self.test_path, [lambda meta: meta.author == "1"],
+                                                       executor=executor, store=self.store)._image_files))
+
+        streaming = StreamingCarousel(self.test_path, builder, store=self.store)
+        images = []
+        while streaming.has_next():
+            images.append(streaming.next())
+        self.assertEqual(expected, sorted(images))
+
+        # Metadata files play no role
+        self.assertEqual([], Carousel(self.test_path, builder)._image_files)
+
+    def test_live(self):
+        specimen = LiveCarousel(self.test_path, FilterBuilder().author_constraint("1"),
+                                watcher=PollingWatcher(self.test_path), store=self.store)
+        while specimen.has_next():
+            specimen.next()
+        self.assertEqual(5, len(specimen._image_files))
+
+        # Changes made through another store are noticed
+        with CollectionStore(self.test_path) as other:
+            img_path = self.test_path / "00.png"
+            other.write(ImageMetadata(uuid4(), URI(img_path), "1", None, None, None), img_path)
+
+        self.assertTrue(specimen.sync())
+        self.assertEqual(6, len(specimen._image_files))
+
+        specimen.close()
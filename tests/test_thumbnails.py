@@ -0,0 +1,160 @@
+import os
+import struct
+import time
+import unittest as ut
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Event
+from typing import Callable, List
+
+from ui.thumbnails import ThumbnailCache, ThumbnailLoader, image_uri, read_png_text
+
+
+def chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+
+def write_png(path: Path, text: dict, international: bool = False) -> None:
+    # A 1x1 grey image, with the given text before its data
+    png = b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 0, 0, 0, 0))
+    for keyword, value in text.items():
+        if international:
+            png += chunk(b'iTXt', keyword.encode('latin-1') + b'\0\1\0\0\0' + zlib.compress(value.encode('utf-8')))
+        else:
+            png += chunk(b'tEXt', keyword.encode('latin-1') + b'\0' + value.encode('latin-1'))
+
+    png += chunk(b'IDAT', zlib.compress(b'\0\x80')) + chunk(b'IEND', b'')
+    path.write_bytes(png)
+
+
+def generate(img: Path, destination: Path, uri: str, mtime: int, size: int) -> None:
+    if img.name.startswith("broken"):
+        raise ValueError("Corrupted image")
+
+    write_png(destination, {'Thumb::URI': uri, 'Thumb::MTime': str(mtime), 'Thumb::Size': str(size)})
+
+
+class TestThumbnailCache(ut.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = TemporaryDirectory()
+        self.test_path = Path(self.test_dir.name)
+        self.cache = ThumbnailCache(self.test_path / "thumbnails", 'large')
+
+        self.img = self.test_path / "01.png"
+        self.img.touch()
+        os.utime(self.img, (1000000000, 1000000000))
+
+    def tearDown(self) -> None:
+        self.test_dir.cleanup()
+
+    def test_png_text(self):
+        png = self.test_path / "text.png"
+        write_png(png, {'Thumb::URI': "file:///tmp/01.png", 'Thumb::MTime': "1000"})
+        self.assertEqual({'Thumb::URI': "file:///tmp/01.png", 'Thumb::MTime': "1000"}, read_png_text(png))
+
+        write_png(png, {'Title': "ヘンタイ"}, international=True)
+        self.assertEqual({'Title': "ヘンタイ"}, read_png_text(png))
+
+        self.assertRaises(ValueError, read_png_text, self.img)
+
+    def test_lookup(self):
+        uri = image_uri(self.img)
+        thumbnail = self.cache.path(uri)
+        # Named after the MD5 hash of the URI, under the directory of the flavour
+        self.assertEqual(self.test_path / "thumbnails" / "large", thumbnail.parent)
+        self.assertEqual(32, len(thumbnail.stem))
+
+        self.assertIsNone(self.cache.lookup(self.img))
+
+        thumbnail.parent.mkdir(parents=True)
+        write_png(thumbnail, {'Thumb::URI': uri, 'Thumb::MTime': "1000000000"})
+        self.assertEqual(thumbnail, self.cache.lookup(self.img))
+
+        # Modifying the image makes its thumbnail outdated
+        os.utime(self.img, (1000000001, 1000000001))
+        self.assertIsNone(self.cache.lookup(self.img))
+
+        self.assertRaises(ValueError, ThumbnailCache, self.test_path, 'huge')
+
+
+class TestThumbnailLoader(ut.TestCase):
+    def setUp(self) -> None:
+        self.test_dir = TemporaryDirectory()
+        self.test_path = Path(self.test_dir.name)
+        self.cache = ThumbnailCache(self.test_path / "thumbnails")
+        self.callbacks: List[Callable] = []
+        self.delivered = []
+
+        self.images = [self.test_path / "{}.png".format(n) for n in range(0, 5)] + [self.test_path / "broken.png"]
+        for img in self.images:
+            img.touch()
+
+    def tearDown(self) -> None:
+        self.test_dir.cleanup()
+
+    def schedule(self, callback, *args):
+        self.callbacks.append(lambda: callback(*args))
+
+    def deliver(self, img, thumbnail):
+        self.delivered.append((img, thumbnail))
+
+    def test_generation(self):
+        with ThreadPoolExecutor(1) as executor:
+            loader = ThumbnailLoader(self.cache, generate, self.schedule, executor)
+
+            self.assertIsNone(loader.request(self.images[0], self.deliver))
+            self.assertIsNone(loader.request(self.images[5], self.deliver))
+
+        while self.callbacks:
+            self.callbacks.pop(0)()
+
+        thumbnail = self.cache.path(image_uri(self.images[0]))
+        self.assertIn((self.images[0], thumbnail), self.delivered)
+        self.assertIn((self.images[5], None), self.delivered)
+        self.assertEqual("128", read_png_text(thumbnail)['Thumb::Size'])
+        self.assertEqual(0o600, thumbnail.stat().st_mode & 0o777)
+        # No temporary file is left behind
+        self.assertEqual([thumbnail], list(thumbnail.parent.iterdir()))
+
+        # Thumbnails are now served right away, and broken images aren't tried again
+        self.assertEqual(thumbnail, loader.request(self.images[0], self.deliver))
+        self.assertIsNone(loader.request(self.images[5], self.deliver))
+        self.assertEqual([], self.callbacks)
+
+    def test_retain(self):
+        executor = ThreadPoolExecutor(1)
+        # Keep the only worker busy, so that nothing else starts
+        release = Event()
+        executor.submit(release.wait)
+        loader = ThumbnailLoader(self.cache, generate, self.schedule, executor)
+
+        # Thumbnails of images that scrolled away are given up
+        for img in self.images[:4]:
+            loader.request(img, self.deliver)
+        loader.retain(self.images[2:4])
+        release.set()
+        executor.shutdown()
+
+        while self.callbacks:
+            self.callbacks.pop(0)()
+
+        self.assertEqual({self.images[2], self.images[3]}, {img for img, _ in self.delivered})
+        loader.close()
+
+    def test_process_pool(self):
+        # The default pool starts its workers from a server process, which must be able to import the generator
+        loader = ThumbnailLoader(self.cache, generate, self.schedule)
+        try:
+            self.assertIsNone(loader.request(self.images[0], self.deliver))
+            deadline = time.monotonic() + 30
+            while not self.callbacks and time.monotonic() < deadline:
+                time.sleep(0.05)
+
+            while self.callbacks:
+                self.callbacks.pop(0)()
+        finally:
+            loader.close()
+
+        self.assertEqual([(self.images[0], self.cache.path(image_uri(self.images[0])))], self.delivered)
@@ -0,0 +1,36 @@
+import io
+import os
+import unittest as ut
+from time import perf_counter
+from unittest import mock
+
+from ui.trace import TRACE_VARIABLE, StartupTrace
+
+
+class TestStartupTrace(ut.TestCase):
+    def test_phases(self):
+        output = io.StringIO()
+        start = perf_counter() - 1
+        trace = StartupTrace(start, output)
+
+        trace.mark("import")
+        trace.mark("builder")
+        self.assertEqual(["import", "builder"], [phase for phase, _ in trace.phases])
+        self.assertGreaterEqual(trace.phases[0][1], 1)
+        self.assertLess(trace.phases[1][1], 1)
+
+        trace.report()
+        report = output.getvalue()
+        self.assertTrue(report.startswith("startup: import "))
+        self.assertIn("ms, builder ", report)
+        self.assertIn(", total ", report)
+
+    def test_environment(self):
+        with mock.patch.dict(os.environ, {TRACE_VARIABLE: ''}):
+            self.assertIsNone(StartupTrace.from_environment())
+        with mock.patch.dict(os.environ, {TRACE_VARIABLE: '1'}):
+            self.assertEqual(10.0, StartupTrace.from_environment(10.0).start)
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -38,6 +38,28 @@ class TestView(TestCase):
         self.assertTrue(specimen.has_image_data())
         self.assertIsNotNone(specimen.get_image_data())
 
+    def test_display_size(self):
+        specimen = GtkView(self.test_path, prefetch=0)
+
+        specimen.load_next()
+        full_width, full_height = specimen.get_image_data().get_width(), specimen.get_image_data().get_height()
+
+        # Images are decoded no larger than the display size, keeping their aspect ratio
+        specimen.set_display_size(full_width // 4, full_height)
+        self.assertEqual(full_width // 4, specimen.get_image_data().get_width())
+        self.assertLess(specimen.get_image_data().get_height(), full_height)
+
+        # Scaled-down images are decoded again when the display grows, or at full resolution on request
+        specimen.set_display_size(full_width // 2, full_height)
+        self.assertEqual(full_width // 2, specimen.get_image_data().get_width())
+        self.assertEqual(full_width, specimen.get_image_data(full_resolution=True).get_width())
+
+        # Images are never scaled up
+        specimen.load_next()
+        specimen.set_display_size(full_width * 2, full_height * 2)
+        self.assertEqual(full_width, specimen.get_image_data().get_width())
+        specimen.close()
+
     def test_carousel_behaviour(self):
         specimen = GtkView(self.test_path)
 
@@ -0,0 +1,70 @@
+import os
+import unittest as ut
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from data.watch import Change, ChangeKind, InotifyWatcher, PollingWatcher
+
+
+class WatcherTests:
+    watcher_type = None
+
+    def setUp(self) -> None:
+        self.test_dir = TemporaryDirectory()
+        self.test_path = Path(self.test_dir.name)
+        (self.test_path / "existing.png").write_bytes(b"a")
+
+        try:
+            self.watcher = self.watcher_type(self.test_path)
+        except OSError as e:
+            self.skipTest(str(e))
+
+    def tearDown(self) -> None:
+        self.watcher.close()
+        self.test_dir.cleanup()
+
+    def test_nothing_happened(self):
+        self.assertEqual([], self.watcher.poll())
+
+    def test_changes(self):
+        (self.test_path / "new.png").write_bytes(b"a")
+        os.remove(self.test_path / "existing.png")
+        (self.test_path / "subdir").mkdir()
+
+        self.assertEqual({Change(self.test_path / "new.png", ChangeKind.UPDATED),
+                          Change(self.test_path / "existing.png", ChangeKind.REMOVED)},
+                         set(self.watcher.poll()))
+        # Changes are handed out only once
+        self.assertEqual([], self.watcher.poll())
+
+    def test_rename(self):
+        os.rename(self.test_path / "existing.png", self.test_path / "renamed.png")
+
+        self.assertEqual({Change(self.test_path / "renamed.png", ChangeKind.UPDATED),
+                          Change(self.test_path / "existing.png", ChangeKind.REMOVED)},
+                         set(self.watcher.poll()))
+
+    def test_link(self):
+        # Hard links create files without writing them
+        os.link(self.test_path / "existing.png", self.test_path / "linked.png")
+
+        self.assertEqual([Change(self.test_path / "linked.png", ChangeKind.UPDATED)], self.watcher.poll())
+
+    def test_coalescing(self):
+        (self.test_path / "new.png").write_bytes(b"a")
+        os.remove(self.test_path / "new.png")
+
+        self.assertNotIn(Change(self.test_path / "new.png", ChangeKind.UPDATED), self.watcher.poll())
+
+
+class TestInotifyWatcher(WatcherTests, ut.TestCase):
+    watcher_type = InotifyWatcher
+
+    def test_directory_removal(self):
+        self.test_dir.cleanup()
+
+        self.assertEqual([Change(self.test_path, ChangeKind.RESCAN)], self.watcher.poll())
+
+
+class TestPollingWatcher(WatcherTests, ut.TestCase):
+    watcher_type = PollingWatcher
@@ -0,0 +1,119 @@
+import unittest as ut
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Event
+from typing import Iterable, List, Tuple
+from uuid import UUID
+
+from uri import URI
+
+from data.common import ImageMetadata
+from data.storage import MetadataStore, SidecarStore
+from data.writeback import WriteBehindQueue
+
+
+class RecordingStore(MetadataStore):
+    """A store recording writes, which can be held until released."""
+
+    def __init__(self):
+        self.writes: List[Tuple[str, Path]] = []
+        self.syncs: List[List[Path]] = []
+        self.released = Event()
+        self.released.set()
+
+    def has_metadata(self, img_file: Path) -> bool:
+        return False
+
+    def load(self, img_file: Path) -> ImageMetadata:
+        raise NotImplementedError
+
+    def write(self, metadata: ImageMetadata, img_file: Path) -> None:
+        self.released.wait()
+        if img_file.name == "readonly.png":
+            raise PermissionError("Read-only")
+        if img_file.name == "closed.png":
+            raise ValueError("I/O operation on closed file")
+
+        self.writes.append((metadata.author, img_file))
+
+    def sync(self, img_files: Iterable[Path]) -> None:
+        self.syncs.append(list(img_files))
+
+
+def meta(author: str) -> ImageMetadata:
+    return ImageMetadata(UUID(int=0), URI("file:///01.png"), author, None, None, None)
+
+
+class TestWriteBehindQueue(ut.TestCase):
+    def setUp(self) -> None:
+        self.store = RecordingStore()
+        self.errors = []
+        self.queue = WriteBehindQueue(self.store, lambda img, error: self.errors.append((img, error)))
+
+    def tearDown(self) -> None:
+        self.store.released.set()
+        self.queue.close()
+
+    def test_coalescing(self):
+        # Hold the writer on a first update, while more are queued
+        self.store.released.clear()
+        self.queue.submit(meta("first"), Path("/01.png"))
+        for author in ["a", "b", "c"]:
+            self.queue.submit(meta(author), Path("/02.png"))
+        self.queue.submit(meta("d"), Path("/03.png"))
+
+        # Queued updates can be read back before being written
+        self.assertEqual("c", self.queue.pending(Path("/02.png")).author)
+        self.assertIsNone(self.queue.pending(Path("/04.png")))
+
+        self.store.released.set()
+        self.assertTrue(self.queue.flush(5))
+
+        self.assertIn(("c", Path("/02.png")), self.store.writes)
+        self.assertNotIn(("a", Path("/02.png")), self.store.writes)
+        self.assertEqual(3, len(self.store.writes))
+        self.assertIsNone(self.queue.pending(Path("/02.png")))
+        # Every batch is synchronized once
+        self.assertEqual(sum(map(len, self.store.syncs)), 3)
+
+    def test_errors(self):
+        self.queue.submit(meta("a"), Path("/readonly.png"))
+        self.queue.submit(meta("b"), Path("/01.png"))
+        self.queue.flush(5)
+
+        self.assertEqual(1, len(self.errors))
+        self.assertEqual(Path("/readonly.png"), self.errors[0][0])
+        self.assertIsInstance(self.errors[0][1], PermissionError)
+        self.assertEqual([("b", Path("/01.png"))], self.store.writes)
+
+    def test_unexpected_errors(self):
+        # Errors other than OSError are logged, and the writer goes on
+        with self.assertLogs('data.writeback', 'ERROR'):
+            self.queue.submit(meta("a"), Path("/closed.png"))
+            self.assertTrue(self.queue.flush(5))
+
+        self.queue.submit(meta("b"), Path("/01.png"))
+        self.assertTrue(self.queue.flush(5))
+        self.assertEqual([], self.errors)
+        self.assertEqual([("b", Path("/01.png"))], self.store.writes)
+
+    def test_close(self):
+        self.store.released.clear()
+        self.queue.submit(meta("a"), Path("/01.png"))
+        self.store.released.set()
+
+        # Closing writes everything that was queued, and refuses further updates
+        self.queue.close()
+        self.assertEqual([("a", Path("/01.png"))], self.store.writes)
+        self.assertRaises(RuntimeError, self.queue.submit, meta("b"), Path("/01.png"))
+
+    def test_sidecar_store(self):
+        with TemporaryDirectory() as test_dir:
+            img = Path(test_dir) / "01.png"
+            store = SidecarStore()
+            queue = WriteBehindQueue(store, lambda *args: None)
+
+            queue.submit(ImageMetadata(UUID(int=1), URI(img), "a", None, None, None), img)
+            queue.close()
+
+            self.assertEqual("a", store.load(img).author)
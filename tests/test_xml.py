@@ -1,9 +1,11 @@
 import unittest as ut
 import uuid
 import uri
+import xml.etree.ElementTree as ElTree
 
 from data.common import ImageMetadata
 import data.xmngr as xm
+from tests.etree_reference import generate_xml_etree, parse_xml_etree
 
 
 class TestXMLCreation(ut.TestCase):
@@ -54,3 +56,55 @@ class TestXMLIngestion(ut.TestCase):
         metadata = ImageMetadata(uuid.UUID('03012ba3-086c-4604-bd6a-aa3e1a78f389'), uri.URI("tt.png"),
                                  None, None, None, None)
         self.assertEqual(metadata, xm.parse_xml(xml_string_legacy))
+
+
+class TestCodecCompatibility(ut.TestCase):
+    # The specialized reader and writer must behave exactly like the reference ElementTree implementation
+    img_id = uuid.UUID('03012ba3-086c-4604-bd6a-aa3e1a78f389')
+
+    def test_generate(self):
+        specimens = [ImageMetadata(self.img_id, uri.URI("a b&c.png"), "", None, [], None),
+                     ImageMetadata(self.img_id, uri.URI("x.png"), "<John> & \"Jane\"\r\n\t", "it's", ["", None, "M"],
+                                   ("a", "b")),
+                     ImageMetadata(self.img_id, uri.URI("file:///tmp/%22q%22.png"), None, "", None, [])]
+
+        for metadata in specimens:
+            self.assertEqual(generate_xml_etree(metadata), xm.generate_xml(metadata))
+
+    def test_parse(self):
+        specimens = ['<image id="{i}" file="a.png"><author>A &amp; B</author><author>C</author></image>',
+                     '<image id="{i}" filename="a.png"><universe>x<!-- c -->y<b>z</b>w</universe></image>',
+                     '<image id="{i}" file="a.png"><characters><character /><character>Q</character></characters>'
+                     '<tags><tag><![CDATA[<t>]]></tag></tags><characters><character>R</character></characters>'
+                     '<other><tag>no</tag></other></image>',
+                     '<image xmlns="urn:x" id="{i}" file="a.png"><author>ns</author></image>',
+                     '<?xml version="1.0"?>\n<image id="{i}" file="a.png">\n  <author>\n  A\n  </author>\n</image>\n',
+                     '<!DOCTYPE image [<!ENTITY a "Alice">]><image id="{i}" file="a.png"><author>&a;</author></image>']
+
+        for specimen in specimens:
+            specimen = specimen.format(i=self.img_id)
+            self.assertEqual(parse_xml_etree(specimen), xm.parse_xml(specimen))
+
+    def test_read_back(self):
+        specimens = [ImageMetadata(self.img_id, uri.URI("a b&c.png"), "", None, [], None),
+                     ImageMetadata(self.img_id, uri.URI("x.png"), "<John> & \"Jane\"\n\t", "it's", ["", None, "M"],
+                                   ("a", "b")),
+                     ImageMetadata(str(self.img_id), "file:///tmp/%22q%22.png", None, "", None, []),
+                     ImageMetadata(self.img_id, uri.URI("y.png"), "line\r\nbreak", None, None, ["a\rb"])]
+
+        for metadata in specimens:
+            document = xm.generate_xml(metadata)
+            self.assertEqual(xm.parse_xml(document), xm.read_back(metadata, document))
+
+        # Characters that cannot be written are left out
+        metadata = ImageMetadata(self.img_id, uri.URI("z.png"), "\x07", "a\ufffeb", None, ["\uffff", "c\x00"])
+        document = xm.generate_xml(metadata)
+        self.assertEqual(ImageMetadata(self.img_id, uri.URI("z.png"), None, "ab", None, [None, "c"]),
+                         xm.read_back(metadata, document))
+        self.assertEqual(xm.parse_xml(document), xm.read_back(metadata, document))
+
+    def test_parse_malformed(self):
+        for specimen in ["", "<image id=", '<image id="{}" file="a.png"><author></image>'.format(self.img_id)]:
+            self.assertRaises(ElTree.ParseError, xm.parse_xml, specimen)
+
+        self.assertRaises(ValueError, xm.parse_xml, '<image id="x" file="a.png" />')